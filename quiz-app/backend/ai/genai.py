@@ -1,10 +1,15 @@
-from google import genai
-from system_prompt import SYSTEM_PROMPT
+import logging
 from schema import QuizQuestions
 
+logger = logging.getLogger(__name__)
+
+_client = None  # Created on first use; google.genai is slow to import and only the admin generator needs it
+
 
 async def generate_questions_by_ai():
-    
+    global _client
+    from google import genai
+    from system_prompt import SYSTEM_PROMPT
 
     # gemini client with api key
     # client = genai.Client(api_key='GEMINI_API_KEY')
@@ -15,15 +20,16 @@ async def generate_questions_by_ai():
     # )
 
     # gemini async client with vertex (gcloud)
-    print("Creating gemini client")
-    client = genai.Client(
-    vertexai=True, project='gen-lang-client-0899905004', location='global'
-    )
-    print("Gemini client created")
+    if _client is None:
+        logger.debug("Creating gemini client")
+        _client = genai.Client(
+        vertexai=True, project='gen-lang-client-0899905004', location='global'
+        )
+        logger.debug("Gemini client created")
 
-    async_client = client.aio
+    async_client = _client.aio
 
-    print("Generating quiz questions")
+    logger.info("Generating quiz questions")
     response = await async_client.models.generate_content(
         model="gemini-3-flash-preview",
         contents = "Generate 20 questions",
@@ -38,7 +44,7 @@ async def generate_questions_by_ai():
     # else:
     #     print("Failed to generate quiz questions")
 
-    print(response)
+    logger.debug("Gemini response: %s", response)
 
     return response.parsed["question_sets"]
 
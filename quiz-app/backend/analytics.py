@@ -0,0 +1,322 @@
+"""
+Incrementally maintained quiz statistics.
+
+Answer distribution: submit() adds each submission's picks to one of
+ANSWER_STATS_SHARDS counter documents of the week (answer_stats/{week_id}_{shard}),
+picked at random so concurrent submissions rarely write the same document.
+Readers fetch all shards of a week with one query and sum them.
+
+Counters are keyed by question id and option index ("0", "1", ...); answers
+that match none of the question's options are counted under UNLISTED_OPTION.
+
+Score distribution: submit() also updates fixed-bucket histograms of scores
+and time taken in score_stats/{scope}_{shard}, for the week (scope = week id,
+one entry per submission) and overall (scope = OVERALL_SCOPE, one score entry
+per player holding their cumulative score). Scores are small integers, so
+every score is its own bucket; times are bucketed by TIME_BUCKET_SECONDS.
+Means, medians and percentiles are computed from the histograms in O(buckets).
+
+Player summary: submit() also keeps a USER_STATS_FIELD map on the user
+document with the player's score and time for every week played (one field per
+week) and Increment totals, so concurrent writes to it (another week's
+submission, a regrade) never overwrite each other. Streaks over consecutive ISO
+weeks, the personal best (score desc, time asc, as on the leaderboard) and the
+last USER_HISTORY_WEEKS weeks are derived from it when read, so a player's stats
+are one document read.
+"""
+
+import random
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from storage import fields
+from weeks import week_offset
+
+ANSWER_STATS_COLLECTION = "answer_stats"
+ANSWER_STATS_SHARDS = 10
+UNLISTED_OPTION = "other"
+
+SCORE_STATS_COLLECTION = "score_stats"
+SCORE_STATS_SHARDS = 10
+OVERALL_SCOPE = "overall"
+TIME_BUCKET_SECONDS = 30
+MAX_TIME_BUCKET = 3600  # Longer times are counted in this bucket
+
+USER_STATS_FIELD = "stats"
+USER_HISTORY_WEEKS = 12
+
+Counts = Dict[str, Dict[str, int]]  # question id -> option key -> count
+
+
+def option_key(question: Dict[str, Any], selected_option: str) -> str:
+    try:
+        return str(question.get("options", []).index(selected_option))
+    except ValueError:
+        return UNLISTED_OPTION
+
+
+def answer_counts(answers: Dict[str, str], questions: List[Dict[str, Any]]) -> Counts:
+    """Counts of one submission (question id -> option text) against the week's question rows"""
+    counts: Counts = {}
+    for question in questions:
+        selected_option = answers.get(question["id"])
+        if selected_option is not None:
+            counts[question["id"]] = {option_key(question, selected_option): 1}
+    return counts
+
+
+def shard_id(scope: str, shard: int) -> str:
+    return f"{scope}_{shard}"
+
+
+def random_shard_id(scope: str, shards: int = ANSWER_STATS_SHARDS) -> str:
+    return shard_id(scope, random.randrange(shards))
+
+
+def answer_stats_delta(week_id: str, questions: List[Dict[str, Any]], answers: Dict[str, str],
+                       previous_answers: Optional[Dict[str, str]] = None) -> Dict[str, Any]:
+    """
+    Data for set(..., merge=True) on a shard document recording one submission.
+    `previous_answers` (a tester re-submission) are subtracted in the same write.
+    """
+    net: Dict[Tuple[str, str], int] = {}
+    for answer_map, sign in ((answers, 1), (previous_answers or {}, -1)):
+        for qid, options in answer_counts(answer_map, questions).items():
+            for key in options:
+                net[(qid, key)] = net.get((qid, key), 0) + sign
+
+    counts: Dict[str, Dict[str, Any]] = {}
+    for (qid, key), value in net.items():
+        if value:
+            counts.setdefault(qid, {})[key] = fields.Increment(value)
+
+    # An empty map in a merge write would replace the shard's counters, so it is left out
+    data: Dict[str, Any] = {"week_id": week_id}
+    if counts:
+        data["counts"] = counts
+    if previous_answers is None:
+        data["participants"] = fields.Increment(1)
+    return data
+
+
+def merge_answer_shards(shards: Iterable[Dict[str, Any]]) -> Tuple[int, Counts]:
+    """Sums shard documents into (participants, counts)"""
+    participants = 0
+    counts: Counts = {}
+    for shard in shards:
+        participants += shard.get("participants", 0)
+        for qid, options in (shard.get("counts") or {}).items():
+            totals = counts.setdefault(qid, {})
+            for key, value in options.items():
+                totals[key] = totals.get(key, 0) + value
+    return participants, counts
+
+
+def answer_distribution(questions: List[Dict[str, Any]], participants: int, counts: Counts) -> List[Dict[str, Any]]:
+    """Per-question option counts, correct rate and skips, in question order"""
+    result = []
+    for question in questions:
+        qid = question["id"]
+        question_counts = counts.get(qid, {})
+        options = question.get("options", [])
+        correct_option = question.get("correct_answer")
+        option_rows = [{
+            "option": option,
+            "count": question_counts.get(str(i), 0),
+            "is_correct": option == correct_option
+        } for i, option in enumerate(options)]
+        answered = sum(question_counts.values())
+        correct = sum(row["count"] for row in option_rows if row["is_correct"])
+        result.append({
+            "question_id": qid,
+            "text": question.get("text"),
+            "options": option_rows,
+            "unlisted": question_counts.get(UNLISTED_OPTION, 0),
+            "answered": answered,
+            "skipped": max(participants - answered, 0),
+            "correct_rate": round(correct / participants, 4) if participants else None
+        })
+    return result
+
+
+# --- SCORE DISTRIBUTION ---
+
+Change = Tuple[Optional[int], int]  # (old value or None for a new entry, new value)
+
+
+def time_bucket(seconds: int) -> int:
+    """Lower bound (seconds) of the time bucket"""
+    return min(max(int(seconds), 0) // TIME_BUCKET_SECONDS * TIME_BUCKET_SECONDS, MAX_TIME_BUCKET)
+
+
+def _histogram_move(old_key: Optional[int], new_key: int) -> Dict[str, Any]:
+    if old_key == new_key:
+        return {}
+    moves = {str(new_key): fields.Increment(1)}
+    if old_key is not None:
+        moves[str(old_key)] = fields.Increment(-1)
+    return moves
+
+
+def score_stats_delta(scope: str, score: Change, time_taken: Change) -> Dict[str, Any]:
+    """
+    Data for set(..., merge=True) on a score_stats shard.
+    `score` and `time_taken` are (old, new) pairs; old is None when the entry is new
+    (a player's first submission overall, a new submission for the week).
+    """
+    old_score, new_score = score
+    old_time, new_time = time_taken
+    data: Dict[str, Any] = {
+        "scope": scope,
+        "score_sum": fields.Increment(new_score - (old_score or 0)),
+        "time_sum": fields.Increment(new_time - (old_time or 0))
+    }
+    # Unchanged buckets give empty maps, which would replace the whole histogram in a merge write
+    scores = _histogram_move(old_score, new_score)
+    times = _histogram_move(None if old_time is None else time_bucket(old_time), time_bucket(new_time))
+    if scores:
+        data["scores"] = scores
+    if times:
+        data["times"] = times
+    if old_score is None:
+        data["participants"] = fields.Increment(1)
+    if old_time is None:
+        data["submissions"] = fields.Increment(1)
+    return data
+
+
+def score_moves_delta(scope: str, moves: Iterable[Tuple[int, int]]) -> Dict[str, Any]:
+    """Data for set(..., merge=True) moving many (old, new) scores at once, e.g. after a regrade"""
+    net: Dict[int, int] = {}
+    score_sum = 0
+    for old_score, new_score in moves:
+        net[old_score] = net.get(old_score, 0) - 1
+        net[new_score] = net.get(new_score, 0) + 1
+        score_sum += new_score - old_score
+    data: Dict[str, Any] = {"scope": scope, "score_sum": fields.Increment(score_sum)}
+    scores = {str(k): fields.Increment(v) for k, v in net.items() if v}
+    if scores:  # Moves that cancel out must not write an empty map (it would replace the histogram)
+        data["scores"] = scores
+    return data
+
+
+def merge_score_shards(shards: Iterable[Dict[str, Any]]) -> Dict[str, Any]:
+    """Sums score_stats shard documents"""
+    totals = {"participants": 0, "score_sum": 0, "submissions": 0, "time_sum": 0, "scores": {}, "times": {}}
+    for shard in shards:
+        for field in ("participants", "score_sum", "submissions", "time_sum"):
+            totals[field] += shard.get(field, 0)
+        for field in ("scores", "times"):
+            histogram = totals[field]
+            for key, count in (shard.get(field) or {}).items():
+                histogram[int(key)] = histogram.get(int(key), 0) + count
+    return totals
+
+
+def histogram_median(histogram: Dict[int, int]) -> Optional[int]:
+    """Bucket holding the median entry"""
+    total = sum(histogram.values())
+    seen = 0
+    for key in sorted(histogram):
+        seen += histogram[key]
+        if seen * 2 >= total and seen:
+            return key
+    return None
+
+
+def percentile_below(histogram: Dict[int, int], value: int) -> Optional[float]:
+    """Percentage of entries strictly below `value` ("you beat N% of players")"""
+    total = sum(histogram.values())
+    if not total:
+        return None
+    below = sum(count for key, count in histogram.items() if key < value)
+    return round(100 * below / total, 1)
+
+
+def score_distribution(totals: Dict[str, Any], score: Optional[int] = None) -> Dict[str, Any]:
+    participants = totals["participants"]
+    submissions = totals["submissions"]
+    scores = {k: v for k, v in totals["scores"].items() if v > 0}
+    times = {k: v for k, v in totals["times"].items() if v > 0}
+    result = {
+        "participants": participants,
+        "score": {
+            "mean": round(totals["score_sum"] / participants, 2) if participants else None,
+            "median": histogram_median(scores),
+            "histogram": [{"score": k, "count": scores[k]} for k in sorted(scores)]
+        },
+        "time_taken": {
+            "submissions": submissions,
+            "mean": round(totals["time_sum"] / submissions, 1) if submissions else None,
+            "median_bucket": histogram_median(times),
+            "bucket_seconds": TIME_BUCKET_SECONDS,
+            "histogram": [{"from": k, "count": times[k]} for k in sorted(times)]
+        }
+    }
+    if score is not None:
+        result["percentile"] = percentile_below(scores, score)
+    return result
+
+
+# --- PLAYER SUMMARY ---
+
+def _is_better(entry: Dict[str, Any], best: Optional[Dict[str, Any]]) -> bool:
+    return best is None or (-entry["score"], entry["time_taken"]) < (-best["score"], best["time_taken"])
+
+
+def user_stats_fields(week_id: str, score: int, time_taken: int,
+                      previous: Optional[Tuple[int, int]] = None) -> Dict[str, Any]:
+    """
+    Field updates (for update()) recording a submission in USER_STATS_FIELD. `previous` is the
+    (score, time_taken) of the submission it replaces (tester re-submission, regrade), None for a new week.
+    """
+    old_score, old_time = previous or (0, 0)
+    update = {
+        f"{USER_STATS_FIELD}.weeks.{week_id}": {"score": score, "time_taken": time_taken},
+        f"{USER_STATS_FIELD}.score_sum": fields.Increment(score - old_score),
+        f"{USER_STATS_FIELD}.time_sum": fields.Increment(time_taken - old_time)
+    }
+    if previous is None:
+        update[f"{USER_STATS_FIELD}.weeks_played"] = fields.Increment(1)
+    return update
+
+
+def user_stats_summary(weeks: Iterable[Tuple[str, int, int]]) -> Dict[str, Any]:
+    """Whole USER_STATS_FIELD value for (week_id, score, time_taken) submissions (backfill)"""
+    played = {week_id: {"score": score, "time_taken": time_taken} for week_id, score, time_taken in weeks}
+    return {
+        "weeks_played": len(played),
+        "score_sum": sum(w["score"] for w in played.values()),
+        "time_sum": sum(w["time_taken"] for w in played.values()),
+        "weeks": played
+    }
+
+
+def user_stats_view(stats: Optional[Dict[str, Any]], current_week: str) -> Dict[str, Any]:
+    """Public form of USER_STATS_FIELD; the current streak only counts if it reaches last week or this week"""
+    stats = stats or {}
+    weeks = stats.get("weeks") or {}
+    history = [{"week_id": week_id, **weeks[week_id]} for week_id in sorted(weeks)]
+    best = None
+    streak = longest_streak = 0
+    last_week = None
+    for entry in history:
+        consecutive = last_week is not None and week_offset(last_week, 1) == entry["week_id"]
+        streak = streak + 1 if consecutive else 1
+        longest_streak = max(longest_streak, streak)
+        last_week = entry["week_id"]
+        if _is_better(entry, best):
+            best = entry
+
+    weeks_played = stats.get("weeks_played", 0)
+    streak_alive = last_week is not None and last_week in (current_week, week_offset(current_week, -1))
+    return {
+        "weeks_played": weeks_played,
+        "total_score": stats.get("score_sum", 0),
+        "average_score": round(stats.get("score_sum", 0) / weeks_played, 2) if weeks_played else None,
+        "average_time": round(stats.get("time_sum", 0) / weeks_played, 1) if weeks_played else None,
+        "current_streak": streak if streak_alive else 0,
+        "longest_streak": longest_streak,
+        "last_week": last_week,
+        "best": best,
+        "history": history[-USER_HISTORY_WEEKS:]
+    }
@@ -0,0 +1,235 @@
+"""
+Backfill Script: incrementally maintained statistics (see analytics.py)
+
+Rebuilds the answer distribution counters and score/time histograms of past
+weeks from their submissions, (--overall) the overall histogram from users'
+cumulative scores, and (--users) every player's summary (weeks played and
+totals) from their submissions. Each week is recomputed from scratch with one
+collection-group scan and written to shard 0; the other shards are deleted, so
+re-running is safe.
+
+The current week is skipped unless --include-current is given, and --overall
+should run while no quiz is live: submissions arriving during the rebuild would
+be lost when the shards are overwritten.
+
+Usage:
+    python backfill_stats.py --week 2025-W02             # Preview one week (dry run)
+    python backfill_stats.py --all                       # Preview every week with questions or submissions
+    python backfill_stats.py --all --execute             # Write the counters
+    python backfill_stats.py --overall --execute         # Rebuild the overall histogram
+    python backfill_stats.py --users --execute           # Rebuild players' summaries
+"""
+
+from dotenv import load_dotenv
+from storage import create_client
+from analytics import (ANSWER_STATS_COLLECTION, ANSWER_STATS_SHARDS, SCORE_STATS_COLLECTION, SCORE_STATS_SHARDS,
+                       OVERALL_SCOPE, USER_STATS_FIELD, answer_counts, shard_id, time_bucket, user_stats_summary,
+                       user_stats_view)
+from grading import PACKED_FIELDS, PackedLayoutMismatch, submission_answers
+import os
+import argparse
+from datetime import datetime, timezone
+
+load_dotenv()
+
+# Initialize Firestore Client (or a local stand-in, see storage/__init__.py)
+DB_NAME = os.getenv("DB_NAME")
+db = create_client(use_async=False)
+
+BATCH_SIZE = 500
+
+
+def current_iso_week() -> str:
+    iso_cal = datetime.now(timezone.utc).isocalendar()
+    return f"{iso_cal[0]}-W{iso_cal[1]:02d}"
+
+
+def week_questions(week_id):
+    rows = []
+    for doc in db.collection("questions").where("week_id", "==", week_id).order_by("order").stream():
+        q = doc.to_dict()
+        q["id"] = doc.id
+        rows.append(q)
+    return rows
+
+
+def known_week_ids():
+    """Week ids that have questions or submissions (most weeks have no 'weeks' document)"""
+    weeks = set()
+    for doc in db.collection("questions").select(["week_id"]).stream():
+        weeks.add(doc.to_dict().get("week_id"))
+    for sub_doc in db.collection_group("submissions").select(["week_id"]).stream():
+        user_ref = sub_doc.reference.parent.parent
+        if user_ref is not None and user_ref.parent.id == "users":
+            weeks.add(sub_doc.to_dict().get("week_id") or sub_doc.id)
+    weeks.discard(None)
+    return weeks
+
+
+def iter_week_submissions(week_id, fields):
+    """Submission dicts of a week under users/{id}/submissions (one collection-group scan)"""
+    query = db.collection_group("submissions").where("week_id", "==", week_id).select(fields)
+    for sub_doc in query.stream():
+        user_ref = sub_doc.reference.parent.parent
+        if user_ref is None or user_ref.parent.id != "users":
+            continue
+        yield sub_doc.to_dict()
+
+
+class ScoreHistogram:
+    """Absolute counterpart of analytics.score_stats_delta"""
+
+    def __init__(self, scope):
+        self.data = {"scope": scope, "participants": 0, "score_sum": 0, "submissions": 0, "time_sum": 0,
+                     "scores": {}, "times": {}}
+
+    def add_score(self, score):
+        self.data["participants"] += 1
+        self.data["score_sum"] += score
+        key = str(score)
+        self.data["scores"][key] = self.data["scores"].get(key, 0) + 1
+
+    def add_time(self, time_taken):
+        self.data["submissions"] += 1
+        self.data["time_sum"] += time_taken
+        key = str(time_bucket(time_taken))
+        self.data["times"][key] = self.data["times"].get(key, 0) + 1
+
+
+def write_shards(batch, collection, scope, shards, data):
+    """Puts the rebuilt totals in shard 0 and clears the scope's other shards"""
+    stats_ref = db.collection(collection)
+    batch.set(stats_ref.document(shard_id(scope, 0)), data)
+    for shard in range(1, shards):
+        batch.delete(stats_ref.document(shard_id(scope, shard)))
+
+
+def backfill_week(week_id, dry_run=True):
+    questions = week_questions(week_id)
+    answer_stats = {"week_id": week_id, "participants": 0, "counts": {}}
+    histogram = ScoreHistogram(week_id)
+    undecodable = 0
+    for submission in iter_week_submissions(week_id, ["answers", *PACKED_FIELDS, "score", "time_taken"]):
+        answer_stats["participants"] += 1
+        try:
+            answers = submission_answers(submission, questions)
+        except PackedLayoutMismatch:
+            undecodable += 1  # Packed against since-edited questions; scores and times still count
+            answers = {}
+        for qid, options in answer_counts(answers, questions).items():
+            totals = answer_stats["counts"].setdefault(qid, {})
+            for key, value in options.items():
+                totals[key] = totals.get(key, 0) + value
+        histogram.add_score(submission.get("score", 0))
+        histogram.add_time(submission.get("time_taken", 0))
+
+    answered = sum(sum(options.values()) for options in answer_stats["counts"].values())
+    mean = histogram.data["score_sum"] / histogram.data["participants"] if histogram.data["participants"] else 0
+    print(f"📊 {week_id}: {answer_stats['participants']} submissions, {len(questions)} questions, "
+          f"{answered} answers, mean score {mean:.2f}")
+    if undecodable:
+        print(f"⚠️  {week_id}: {undecodable} packed submissions no longer match the questions, answers not counted")
+
+    if dry_run:
+        return
+
+    batch = db.batch()
+    write_shards(batch, ANSWER_STATS_COLLECTION, week_id, ANSWER_STATS_SHARDS, answer_stats)
+    write_shards(batch, SCORE_STATS_COLLECTION, week_id, SCORE_STATS_SHARDS, histogram.data)
+    batch.commit()
+
+
+def backfill_overall(dry_run=True):
+    """Cumulative scores of players who submitted, plus the time taken of every submission"""
+    histogram = ScoreHistogram(OVERALL_SCOPE)
+    for user_doc in db.collection("users").where("submitted", "==", True).select(["cumulative_score"]).stream():
+        histogram.add_score(user_doc.to_dict().get("cumulative_score", 0))
+    for sub_doc in db.collection_group("submissions").select(["time_taken"]).stream():
+        user_ref = sub_doc.reference.parent.parent
+        if user_ref is not None and user_ref.parent.id == "users":
+            histogram.add_time(sub_doc.to_dict().get("time_taken", 0))
+    print(f"📊 {OVERALL_SCOPE}: {histogram.data['participants']} players, {histogram.data['submissions']} submissions")
+
+    if dry_run:
+        return
+
+    batch = db.batch()
+    write_shards(batch, SCORE_STATS_COLLECTION, OVERALL_SCOPE, SCORE_STATS_SHARDS, histogram.data)
+    batch.commit()
+
+
+def backfill_users(dry_run=True):
+    """Rebuilds every player's summary from their submissions"""
+    submissions = {}
+    for sub_doc in db.collection_group("submissions").select(["week_id", "score", "time_taken"]).stream():
+        user_ref = sub_doc.reference.parent.parent
+        if user_ref is None or user_ref.parent.id != "users":
+            continue
+        data = sub_doc.to_dict()
+        submissions.setdefault(user_ref.id, []).append(
+            (data.get("week_id") or sub_doc.id, data.get("score", 0), data.get("time_taken", 0)))
+
+    # Submissions outlive a deleted user document; updating it would fail the whole batch
+    existing = {user_doc.id for user_doc in db.collection("users").select(["submitted"]).stream()}
+    missing = sorted(user_id for user_id in submissions if user_id not in existing)
+    for user_id in missing:
+        del submissions[user_id]
+
+    longest = 0
+    batch = db.batch()
+    pending = 0
+    for user_id, weeks in submissions.items():
+        stats = user_stats_summary(weeks)
+        longest = max(longest, user_stats_view(stats, current_iso_week())["longest_streak"])
+        if not dry_run:
+            batch.update(db.collection("users").document(user_id), {USER_STATS_FIELD: stats})
+            pending += 1
+            if pending >= BATCH_SIZE:
+                batch.commit()
+                batch = db.batch()
+                pending = 0
+    if pending:
+        batch.commit()
+    print(f"👤 users: {len(submissions)} players, {sum(len(w) for w in submissions.values())} submissions, "
+          f"longest streak {longest} weeks")
+    if missing:
+        print(f"   ⚠️  {len(missing)} players with submissions but no user document skipped: {', '.join(missing[:10])}"
+              f"{' ...' if len(missing) > 10 else ''}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rebuild incrementally maintained statistics for past weeks")
+    parser.add_argument("--week", action="append", default=[], metavar="WEEK_ID", help="Week to rebuild (repeatable)")
+    parser.add_argument("--all", action="store_true", help="Rebuild every week with questions or submissions")
+    parser.add_argument("--include-current", action="store_true", help="Also rebuild the current ISO week")
+    parser.add_argument("--overall", action="store_true", help="Rebuild the overall score histogram")
+    parser.add_argument("--users", action="store_true", help="Rebuild every player's summary")
+    parser.add_argument("--execute", action="store_true", help="Actually write the counters (dry run otherwise)")
+    args = parser.parse_args()
+
+    weeks = list(args.week)
+    if args.all:
+        weeks += [week_id for week_id in known_week_ids() if week_id not in weeks]
+    if not weeks and not args.overall and not args.users:
+        parser.print_help()
+        return
+
+    current = current_iso_week()
+    print(f"{'🚀 Rebuilding' if args.execute else '🔍 DRY RUN - previewing'} statistics for {len(weeks)} week(s)"
+          f"{' and overall' if args.overall else ''}{' and players' if args.users else ''}")
+    for week_id in sorted(weeks):
+        if week_id == current and not args.include_current:
+            print(f"⏭️  {week_id}: current week skipped (use --include-current)")
+            continue
+        backfill_week(week_id, dry_run=not args.execute)
+    if args.overall:
+        backfill_overall(dry_run=not args.execute)
+    if args.users:
+        backfill_users(dry_run=not args.execute)
+
+    if not args.execute:
+        print("\n💡 Run with --execute to write the counters")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,237 @@
+"""
+Quiz-night load generator.
+
+Replays the player flow (register -> config -> questions -> submit -> leaderboard
+polling) for many concurrent virtual players and reports latency percentiles,
+throughput and, in-process, storage operations per endpoint.
+
+Usage (from quiz-app/backend):
+    python -m benchmarks.loadtest                                   # in-process, in-memory storage
+    python -m benchmarks.loadtest --users 2000 --concurrency 200 --ramp 10 --think 60
+    python -m benchmarks.loadtest --scenario leaderboard-storm --polls 20
+    python -m benchmarks.loadtest --target http://localhost:8080    # against a running server
+    python -m benchmarks.loadtest --json loadtest.json              # also write the report as JSON
+
+In-process runs default STORAGE_BACKEND to "memory" and seed the active week's
+questions through the admin batch endpoint before the run.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import time
+from typing import Any, Dict, List, Optional
+
+import httpx
+
+SCENARIOS = {
+    # Full player flow: the 8 pm burst
+    "quiz-night": ["register", "config", "questions", "submit", "poll"],
+    # Everyone joins at once, nobody submits yet
+    "register-burst": ["register", "config", "questions"],
+    # Players sitting on the leaderboard page after the quiz
+    "leaderboard-storm": ["poll"],
+}
+
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, int(round(pct / 100 * len(sorted_values))))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+class LoadStats:
+    def __init__(self):
+        self.latencies: Dict[str, List[float]] = {}
+        self.errors: Dict[str, Dict[str, int]] = {}
+        self.storage_ops: Dict[str, Dict[str, int]] = {}
+
+    def record(self, endpoint: str, seconds: float, status: Optional[int], ops: Optional[Dict[str, int]]):
+        self.latencies.setdefault(endpoint, []).append(seconds)
+        if status is None or status >= 400:
+            errors = self.errors.setdefault(endpoint, {})
+            key = str(status) if status is not None else "exception"
+            errors[key] = errors.get(key, 0) + 1
+        if ops is not None:
+            totals = self.storage_ops.setdefault(endpoint, {})
+            for kind, count in ops.items():
+                totals[kind] = totals.get(kind, 0) + count
+
+    def report(self, wall_seconds: float) -> Dict[str, Any]:
+        endpoints = {}
+        total = 0
+        for endpoint, values in sorted(self.latencies.items()):
+            values = sorted(values)
+            total += len(values)
+            ops = self.storage_ops.get(endpoint)
+            endpoints[endpoint] = {
+                "requests": len(values),
+                "errors": self.errors.get(endpoint, {}),
+                "p50_ms": round(percentile(values, 50) * 1000, 2),
+                "p95_ms": round(percentile(values, 95) * 1000, 2),
+                "p99_ms": round(percentile(values, 99) * 1000, 2),
+                "max_ms": round(values[-1] * 1000, 2),
+                "throughput_rps": round(len(values) / wall_seconds, 1) if wall_seconds else 0,
+                # None when storage operations are not observable (HTTP target / Firestore)
+                "storage_ops_per_request": {k: round(v / len(values), 2) for k, v in sorted(ops.items())} if ops is not None else None
+            }
+        return {
+            "wall_seconds": round(wall_seconds, 2),
+            "total_requests": total,
+            "throughput_rps": round(total / wall_seconds, 1) if wall_seconds else 0,
+            "endpoints": endpoints
+        }
+
+
+def print_report(report: Dict[str, Any]):
+    print(f"\nRequests: {report['total_requests']} in {report['wall_seconds']}s ({report['throughput_rps']} req/s)\n")
+    print(f"{'endpoint':<22}{'reqs':>7}{'err':>6}{'p50':>9}{'p95':>9}{'p99':>9}{'max':>9}{'rps':>8}  storage ops/req")
+    for endpoint, row in report["endpoints"].items():
+        errors = sum(row["errors"].values())
+        ops = row["storage_ops_per_request"]
+        ops = "n/a" if ops is None else (" ".join(f"{k}={v}" for k, v in ops.items()) or "none")
+        print(f"{endpoint:<22}{row['requests']:>7}{errors:>6}{row['p50_ms']:>9}{row['p95_ms']:>9}{row['p99_ms']:>9}{row['max_ms']:>9}{row['throughput_rps']:>8}  {ops}")
+
+
+class LoadRunner:
+    def __init__(self, client: httpx.AsyncClient, args, op_scope=None):
+        self.client = client
+        self.args = args
+        self.op_scope = op_scope  # storage.local.op_scope when running in-process
+        self.stats = LoadStats()
+        self.semaphore = asyncio.Semaphore(args.concurrency)
+        self.run_id = f"{int(time.time()) % 100000:05d}"
+
+    async def call(self, endpoint: str, method: str, url: str, **kwargs) -> Optional[httpx.Response]:
+        async with self.semaphore:
+            ops = {} if self.op_scope is not None else None
+            token = self.op_scope.set(ops) if ops is not None else None
+            started = time.perf_counter()
+            response = None
+            try:
+                response = await self.client.request(method, url, **kwargs)
+            except httpx.HTTPError:
+                pass
+            finally:
+                if token is not None:
+                    self.op_scope.reset(token)
+            self.stats.record(endpoint, time.perf_counter() - started, response.status_code if response is not None else None, ops)
+            return response
+
+    async def player(self, index: int, steps: List[str]):
+        args = self.args
+        await asyncio.sleep(random.uniform(0, args.ramp))
+        phone = f"lt{self.run_id}{index:06d}"
+        # Distinct client address per player, so per-IP rate limits see separate clients
+        headers = {"X-Forwarded-For": f"10.{index >> 16 & 255}.{index >> 8 & 255}.{index & 255}"}
+        week_id = None
+        questions: List[Dict[str, Any]] = []
+
+        for step in steps:
+            if step == "register":
+                r = await self.call("register", "POST", "/api/register", json={"name": f"Load Tester {index}", "phone": phone}, headers=headers)
+                if r is None or r.status_code != 200:
+                    return
+                week_id = r.json().get("week_id")
+            elif step == "config":
+                await self.call("config", "GET", "/api/config", headers=headers)
+            elif step == "questions":
+                r = await self.call("questions", "GET", "/api/questions", params={"week_id": week_id} if week_id else {}, headers=headers)
+                if r is not None and r.status_code == 200:
+                    questions = r.json()
+            elif step == "submit":
+                if not week_id:
+                    return
+                await asyncio.sleep(random.uniform(0, args.think))
+                answers = {q["id"]: random.choice(q["options"]) for q in questions if q.get("options")}
+                await self.call("submit", "POST", "/api/submit", json={
+                    "user_id": phone,
+                    "week_id": week_id,
+                    "answers": answers,
+                    "time_taken": random.randint(60, 600)
+                }, headers=headers)
+            elif step == "poll":
+                for _ in range(args.polls):
+                    await self.call("config", "GET", "/api/config", headers=headers)
+                    await asyncio.gather(
+                        self.call("leaderboard_weekly", "GET", "/api/leaderboard", params={"type": "weekly"}, headers=headers),
+                        self.call("leaderboard_overall", "GET", "/api/leaderboard", params={"type": "overall"}, headers=headers)
+                    )
+                    await asyncio.sleep(random.uniform(0.5, 1.5) * args.poll_interval)
+
+    async def run(self) -> Dict[str, Any]:
+        steps = SCENARIOS[self.args.scenario]
+        started = time.perf_counter()
+        await asyncio.gather(*(self.player(i, steps) for i in range(self.args.users)))
+        return self.stats.report(time.perf_counter() - started)
+
+
+async def seed_questions(client: httpx.AsyncClient, count: int):
+    """Creates `count` questions for the active week through the admin batch endpoint"""
+    r = await client.post("/api/register", json={"name": "Load Seeder", "phone": "loadtest-seeder"})
+    week_id = r.json()["week_id"]
+    questions = [{
+        "id": f"{week_id}-lt{i:02d}",
+        "text": f"Load test question {i}",
+        "options": [f"Option {c}" for c in "ABCD"],
+        "answer": f"Option {random.choice('ABCD')}",
+        "order": i,
+        "week_id": week_id
+    } for i in range(1, count + 1)]
+    r = await client.post("/api/admin/questions/batch", json={"questions": questions})
+    r.raise_for_status()
+
+
+async def main_async(args) -> Dict[str, Any]:
+    random.seed(args.seed)
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    timeout = httpx.Timeout(args.timeout)
+
+    if args.target == "asgi":
+        os.environ.setdefault("STORAGE_BACKEND", "memory")
+        import main as app_module
+        from storage.local import op_scope
+
+        transport = httpx.ASGITransport(app=app_module.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://loadtest", timeout=timeout) as client:
+            if not args.no_seed:
+                await seed_questions(client, args.questions)
+            is_local = os.environ["STORAGE_BACKEND"] != "firestore"
+            return await LoadRunner(client, args, op_scope if is_local else None).run()
+
+    async with httpx.AsyncClient(base_url=args.target, timeout=timeout, limits=limits) as client:
+        return await LoadRunner(client, args).run()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Quiz-night load generator", formatter_class=argparse.RawDescriptionHelpFormatter, epilog=__doc__)
+    parser.add_argument("--target", default="asgi", help="'asgi' to run the app in-process, or a base URL such as http://localhost:8080")
+    parser.add_argument("--scenario", choices=sorted(SCENARIOS), default="quiz-night")
+    parser.add_argument("--users", type=int, default=200, help="Virtual players")
+    parser.add_argument("--concurrency", type=int, default=100, help="Max in-flight requests")
+    parser.add_argument("--ramp", type=float, default=2.0, help="Seconds over which players arrive")
+    parser.add_argument("--think", type=float, default=2.0, help="Max seconds a player spends on the quiz before submitting")
+    parser.add_argument("--polls", type=int, default=3, help="Leaderboard refreshes per player")
+    parser.add_argument("--poll-interval", type=float, default=1.0, help="Seconds between leaderboard refreshes")
+    parser.add_argument("--questions", type=int, default=10, help="Questions seeded for the active week (in-process only)")
+    parser.add_argument("--no-seed", action="store_true", help="Do not seed questions (in-process only)")
+    parser.add_argument("--timeout", type=float, default=30.0, help="Per-request timeout in seconds")
+    parser.add_argument("--seed", type=int, default=89, help="Random seed")
+    parser.add_argument("--json", metavar="PATH", help="Write the report as JSON")
+    args = parser.parse_args()
+
+    report = asyncio.run(main_async(args))
+    report["config"] = {k: v for k, v in vars(args).items() if k != "json"}
+    print_report(report)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nReport written to {args.json}")
+
+
+if __name__ == "__main__":
+    main()
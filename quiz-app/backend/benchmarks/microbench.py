@@ -0,0 +1,205 @@
+"""
+Microbenchmarks for the hot paths in main.py.
+
+Runs each benchmark against fixed synthetic datasets (seed_db.seed_synthetic on
+the in-memory storage backend) at several sizes and reports min/median/mean
+timings. Results are written as JSON so runs can be compared; with --baseline
+the run fails (exit code 1) when a benchmark's median is slower than the
+baseline by more than --max-regression.
+
+Usage (from quiz-app/backend):
+    python -m benchmarks.microbench                              # sizes 100, 1000, 10000 users
+    python -m benchmarks.microbench --sizes 1000 --json after.json
+    python -m benchmarks.microbench --baseline before.json --max-regression 0.2
+    python -m benchmarks.microbench --filter leaderboard
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+os.environ["STORAGE_BACKEND"] = "memory"
+
+import main  # noqa: E402
+import seed_db  # noqa: E402
+from storage.instrumented import instrument_client  # noqa: E402
+from storage.local import AsyncLocalClient, LocalClient  # noqa: E402
+from storage.stores import MemoryStore  # noqa: E402
+
+WEEKS = 5
+QUESTIONS = 10
+SEED = 89
+
+
+class Dataset:
+    """A seeded in-memory store installed as main.db"""
+
+    def __init__(self, users: int):
+        self.users = users
+        store = MemoryStore()
+        seed_db.seed_synthetic(users, WEEKS, QUESTIONS, participation=0.7, legacy_fraction=0.05, seed=SEED,
+                               client=LocalClient(store))
+        main.db = instrument_client(AsyncLocalClient(store))
+        self.store = store
+        self.week_id = seed_db.recent_weeks(WEEKS)[-1][0]
+        self.legacy_week_id = seed_db.LEGACY_WEEK_ID
+        self.answer_key = {}
+        self.answers = {}
+        for q in LocalClient(store).collection("questions").where("week_id", "==", self.week_id).stream():
+            data = q.to_dict()
+            self.answer_key[q.id] = data["correct_answer"]
+            self.answers[q.id] = data["options"][0]
+        self._next_player = 0
+
+    def new_player(self) -> str:
+        """Registers a player without a submission for the current week"""
+        self._next_player += 1
+        phone = f"bench{self._next_player:08d}"
+        LocalClient(self.store).collection("users").document(phone).set({
+            "user_id": phone, "name": phone, "phone": phone, "cumulative_score": 0
+        })
+        return phone
+
+
+def clear_caches():
+    main.leaderboard_cache.clear()
+    main.questions_cache.clear()
+
+
+async def measure(fn: Callable[[], Awaitable[Any]], setup: Optional[Callable[[], Any]], min_rounds: int, min_time: float) -> List[float]:
+    timings = []
+    started = time.perf_counter()
+    while len(timings) < min_rounds or time.perf_counter() - started < min_time:
+        arg = setup() if setup else None
+        t0 = time.perf_counter()
+        await (fn(arg) if setup else fn())
+        timings.append(time.perf_counter() - t0)
+        if len(timings) >= 10000:
+            break
+    return timings
+
+
+def benchmarks(data: Dataset) -> Dict[str, tuple]:
+    """name -> (async fn, setup or None). setup's return value is passed to fn and excluded from timing."""
+
+    async def leaderboard_weekly_miss(_):
+        await main.get_leaderboard(type="weekly", week_id=data.week_id)
+
+    async def leaderboard_legacy_weekly_miss(_):
+        await main.get_leaderboard(type="weekly", week_id=data.legacy_week_id)
+
+    async def leaderboard_overall_miss(_):
+        await main.get_leaderboard(type="overall", week_id=data.week_id)
+
+    async def leaderboard_hit():
+        await main.get_leaderboard(type="weekly", week_id=data.week_id)
+
+    async def questions_miss(_):
+        await main.get_questions(week_id=data.week_id)
+
+    async def questions_hit():
+        await main.get_questions(week_id=data.week_id)
+
+    async def score_answers():
+        main.score_answers(data.answers, data.answer_key)
+
+    async def regrade_dry_run():
+        await main.regrade_week(data.week_id, dry_run=True)
+
+    async def submit(user_id):
+        await main.submit(main.SubmitAnswers(user_id=user_id, week_id=data.week_id, answers=data.answers, time_taken=300))
+
+    return {
+        "leaderboard_weekly_miss": (leaderboard_weekly_miss, clear_caches),
+        "leaderboard_legacy_weekly_miss": (leaderboard_legacy_weekly_miss, clear_caches),
+        "leaderboard_overall_miss": (leaderboard_overall_miss, clear_caches),
+        "leaderboard_hit": (leaderboard_hit, None),
+        "questions_miss": (questions_miss, clear_caches),
+        "questions_hit": (questions_hit, None),
+        "score_answers": (score_answers, None),
+        "submit": (submit, data.new_player),
+        "regrade_dry_run": (regrade_dry_run, None),
+    }
+
+
+async def run(sizes: List[int], name_filter: Optional[str], min_rounds: int, min_time: float) -> Dict[str, Any]:
+    results = {}
+    for size in sizes:
+        t0 = time.perf_counter()
+        data = Dataset(size)
+        print(f"\n== {size} users (dataset built in {time.perf_counter() - t0:.1f}s)")
+        clear_caches()
+        await main.get_leaderboard(type="weekly", week_id=data.week_id)  # warm leaderboard_hit
+        await main.get_questions(week_id=data.week_id)  # warm questions_hit
+        for name, (fn, setup) in benchmarks(data).items():
+            if name_filter and name_filter not in name:
+                continue
+            timings = await measure(fn, setup, min_rounds, min_time)
+            key = f"{name}[{size}]"
+            results[key] = {
+                "rounds": len(timings),
+                "min_ms": round(min(timings) * 1000, 4),
+                "median_ms": round(statistics.median(timings) * 1000, 4),
+                "mean_ms": round(statistics.fmean(timings) * 1000, 4),
+                "stdev_ms": round(statistics.pstdev(timings) * 1000, 4)
+            }
+            row = results[key]
+            print(f"  {name:<34}{row['median_ms']:>12.3f} ms median {row['min_ms']:>12.3f} ms min {row['rounds']:>7} rounds")
+    return results
+
+
+def compare(results: Dict[str, Any], baseline: Dict[str, Any], max_regression: float) -> List[str]:
+    regressions = []
+    for key, row in results.items():
+        before = baseline.get("results", {}).get(key)
+        if not before or not before["median_ms"]:
+            continue
+        change = row["median_ms"] / before["median_ms"] - 1
+        if change > max_regression:
+            regressions.append(f"{key}: {before['median_ms']:.3f} -> {row['median_ms']:.3f} ms (+{change:.0%})")
+    return regressions
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description="Microbenchmarks for leaderboard, scoring and cache paths")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 1000, 10000], help="Dataset sizes (users)")
+    parser.add_argument("--filter", help="Only run benchmarks whose name contains this string")
+    parser.add_argument("--min-rounds", type=int, default=5)
+    parser.add_argument("--min-time", type=float, default=0.5, help="Minimum seconds per benchmark")
+    parser.add_argument("--json", default="microbench.json", help="Results artifact path")
+    parser.add_argument("--baseline", help="Previous results JSON to compare against")
+    parser.add_argument("--max-regression", type=float, default=0.25, help="Allowed median slowdown vs baseline (0.25 = 25%%)")
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args.sizes, args.filter, args.min_rounds, args.min_time))
+    artifact = {
+        "timestamp": datetime.now().isoformat(),
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "config": {"sizes": args.sizes, "weeks": WEEKS, "questions": QUESTIONS, "seed": SEED},
+        "results": results
+    }
+    with open(args.json, "w") as f:
+        json.dump(artifact, f, indent=2)
+    print(f"\nResults written to {args.json}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.max_regression)
+        if regressions:
+            print(f"\nRegressions over {args.max_regression:.0%}:")
+            for line in regressions:
+                print(f"  {line}")
+            sys.exit(1)
+        print(f"\nNo regressions over {args.max_regression:.0%} against {args.baseline}")
+
+
+if __name__ == "__main__":
+    main_cli()
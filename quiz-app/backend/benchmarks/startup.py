@@ -0,0 +1,132 @@
+"""
+Cold-start benchmark.
+
+Starts the app in fresh interpreters and measures, per run, how long it takes
+to import main, run the lifespan startup (cache warm-up) and serve the first
+GET /api/questions, plus the wall time from spawning the process to that first
+response. Runs use a throwaway SQLite store seeded with seed_db.seed_synthetic,
+so the warm-up has real data to load without Firestore credentials.
+
+Usage (from quiz-app/backend):
+    python -m benchmarks.startup                    # 10 runs
+    python -m benchmarks.startup --runs 20 --json startup.json
+    python -m benchmarks.startup --imports 15       # also list the slowest imports of main
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PHASES = ("import", "lifespan", "first_request", "total")
+
+
+def run_child():
+    """Measures one cold start in this (fresh) interpreter and prints the timings as JSON"""
+    started = time.perf_counter()
+    import main
+    imported = time.perf_counter()
+
+    import httpx
+
+    async def serve_first_request():
+        async with main.app.router.lifespan_context(main.app):
+            warmed = time.perf_counter()
+            transport = httpx.ASGITransport(app=main.app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+                r = await client.get("/api/questions")
+            return warmed, time.perf_counter(), r.status_code
+
+    warmed, served, status = asyncio.run(serve_first_request())
+    print(json.dumps({
+        "import": imported - started,
+        "lifespan": warmed - imported,
+        "first_request": served - warmed,
+        "status": status
+    }))
+
+
+def seed_store(path: str):
+    os.environ["STORAGE_BACKEND"] = "sqlite"
+    os.environ["SQLITE_PATH"] = path
+    import seed_db
+    from storage.local import LocalClient
+    from storage.stores import SqliteStore
+    seed_db.seed_synthetic(users=200, weeks=2, questions=20, participation=0.8, legacy_fraction=0.0, seed=89,
+                           client=LocalClient(SqliteStore(path)))
+
+
+def measure(path: str) -> dict:
+    env = dict(os.environ, STORAGE_BACKEND="sqlite", SQLITE_PATH=path, LOG_LEVEL="WARNING")
+    spawned = time.perf_counter()
+    out = subprocess.run([sys.executable, "-m", "benchmarks.startup", "--child"], cwd=BACKEND_DIR, env=env,
+                         capture_output=True, text=True, check=True).stdout
+    total = time.perf_counter() - spawned
+    result = json.loads(out.strip().splitlines()[-1])
+    result["total"] = total
+    return result
+
+
+def slowest_imports(path: str, count: int):
+    """Top-level packages by cumulative import time (python -X importtime)"""
+    env = dict(os.environ, STORAGE_BACKEND="sqlite", SQLITE_PATH=path)
+    err = subprocess.run([sys.executable, "-X", "importtime", "-c", "import main"], cwd=BACKEND_DIR, env=env,
+                         capture_output=True, text=True, check=True).stderr
+    rows = []
+    for line in err.splitlines():
+        match = re.match(r"import time:\s+\d+ \|\s+(\d+) \| (\s*)(\S+)", line)
+        if match and len(match.group(2)) <= 2:  # depth 0/1: main and what it imports directly
+            rows.append((int(match.group(1)) / 1e6, match.group(3)))
+    return sorted(rows, reverse=True)[:count]
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description="Cold-start timings: import, lifespan warm-up and first request")
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--imports", type=int, default=0, help="Also list the N slowest imports of main")
+    parser.add_argument("--json", help="Also write the report as JSON")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child()
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "startup.db")
+        seed_store(path)
+        runs = [measure(path) for _ in range(args.runs)]
+        imports = slowest_imports(path, args.imports) if args.imports else []
+
+    report = {phase: {
+        "median": statistics.median(r[phase] for r in runs),
+        "min": min(r[phase] for r in runs),
+        "max": max(r[phase] for r in runs)
+    } for phase in PHASES}
+    report["runs"] = args.runs
+
+    print(f"\nCold start over {args.runs} runs (seconds)")
+    print(f"{'phase':<15}{'median':>10}{'min':>10}{'max':>10}")
+    for phase in PHASES:
+        stats = report[phase]
+        print(f"{phase:<15}{stats['median']:>10.3f}{stats['min']:>10.3f}{stats['max']:>10.3f}")
+    if imports:
+        print("\nSlowest imports")
+        for seconds, name in imports:
+            print(f"  {seconds:>8.3f}  {name}")
+
+    if args.json:
+        report["imports"] = [{"module": name, "seconds": seconds} for seconds, name in imports]
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,139 @@
+"""
+Conversion Script: compact submission answers (see grading.py)
+
+Rewrites existing submissions from the `answers` map (question id -> option
+text) to the packed `answers_packed` byte string, one byte per question in
+question order, or back with --expand. Submissions that cannot be packed
+losslessly (an answer that is not one of the week's options) keep their map.
+Packed submissions whose questions were edited since (answers_layout no longer
+matches) cannot be expanded and are counted separately.
+
+New submissions are only packed when the backend runs with COMPACT_ANSWERS=1;
+converting without it is fine, since every reader accepts both formats.
+
+Usage:
+    python convert_answers.py --week 2025-W02            # Preview one week (dry run)
+    python convert_answers.py --all --execute            # Pack every week with submissions
+    python convert_answers.py --all --expand --execute   # Back to answer maps
+"""
+
+from dotenv import load_dotenv
+from storage import create_client, fields
+from grading import (PACKED_ANSWERS_FIELD, PACKED_FIELDS, PACKED_LAYOUT_FIELD, PackedLayoutMismatch, check_layout,
+                     packed_answer_fields, unpack_answers)
+import os
+import json
+import argparse
+
+load_dotenv()
+
+# Initialize Firestore Client (or a local stand-in, see storage/__init__.py)
+DB_NAME = os.getenv("DB_NAME")
+db = create_client(use_async=False)
+
+BATCH_SIZE = 500
+
+
+def week_questions(week_id):
+    rows = []
+    for doc in db.collection("questions").where("week_id", "==", week_id).order_by("order").stream():
+        q = doc.to_dict()
+        q["id"] = doc.id
+        rows.append(q)
+    return rows
+
+
+def submission_week_ids():
+    """Week ids that have submissions (most weeks have no 'weeks' document)"""
+    weeks = set()
+    for sub_doc in db.collection_group("submissions").select(["week_id"]).stream():
+        user_ref = sub_doc.reference.parent.parent
+        if user_ref is not None and user_ref.parent.id == "users":
+            weeks.add(sub_doc.to_dict().get("week_id") or sub_doc.id)
+    return weeks
+
+
+def convert_week(week_id, expand=False, dry_run=True):
+    questions = week_questions(week_id)
+    stats = {"converted": 0, "skipped": 0, "mismatched": 0, "bytes_before": 0, "bytes_after": 0}
+    batch = db.batch()
+    pending = 0
+
+    query = db.collection_group("submissions").where("week_id", "==", week_id).select(["answers", *PACKED_FIELDS])
+    for sub_doc in query.stream():
+        user_ref = sub_doc.reference.parent.parent
+        if user_ref is None or user_ref.parent.id != "users":
+            continue
+        data = sub_doc.to_dict()
+
+        if expand:
+            packed = data.get(PACKED_ANSWERS_FIELD)
+            if packed is None:
+                stats["skipped"] += 1
+                continue
+            try:
+                check_layout(data, questions)
+            except PackedLayoutMismatch:
+                stats["mismatched"] += 1
+                continue
+            answers = unpack_answers(packed, questions)
+            update = {"answers": answers, PACKED_ANSWERS_FIELD: fields.DELETE_FIELD,
+                      PACKED_LAYOUT_FIELD: fields.DELETE_FIELD}
+        else:
+            answers = data.get("answers")
+            packed_fields = packed_answer_fields(answers, questions) if answers is not None else None
+            if packed_fields is None:
+                stats["skipped"] += 1
+                continue
+            packed = packed_fields[PACKED_ANSWERS_FIELD]
+            update = {**packed_fields, "answers": fields.DELETE_FIELD}
+
+        # Approximate stored size: map as JSON vs one byte per question
+        map_size = len(json.dumps(answers, ensure_ascii=False).encode())
+        stats["bytes_before"] += len(packed) if expand else map_size
+        stats["bytes_after"] += map_size if expand else len(packed)
+        stats["converted"] += 1
+
+        if not dry_run:
+            batch.update(sub_doc.reference, update)
+            pending += 1
+            if pending >= BATCH_SIZE:
+                batch.commit()
+                batch = db.batch()
+                pending = 0
+
+    if pending:
+        batch.commit()
+
+    print(f"📦 {week_id}: {stats['converted']} converted, {stats['skipped']} skipped, "
+          f"{stats['mismatched']} packed against other questions, "
+          f"answers {stats['bytes_before']:,} -> {stats['bytes_after']:,} bytes")
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert submission answers between map and packed formats")
+    parser.add_argument("--week", action="append", default=[], metavar="WEEK_ID", help="Week to convert (repeatable)")
+    parser.add_argument("--all", action="store_true", help="Convert every week with submissions")
+    parser.add_argument("--expand", action="store_true", help="Convert packed answers back to answer maps")
+    parser.add_argument("--execute", action="store_true", help="Actually write the changes (dry run otherwise)")
+    args = parser.parse_args()
+
+    weeks = list(args.week)
+    if args.all:
+        weeks += [week_id for week_id in submission_week_ids() if week_id not in weeks]
+    if not weeks:
+        parser.print_help()
+        return
+
+    action = "Expanding" if args.expand else "Packing"
+    print(f"{'🚀 ' + action if args.execute else '🔍 DRY RUN - ' + action.lower()} answers for {len(weeks)} week(s)")
+    for week_id in sorted(weeks):
+        convert_week(week_id, expand=args.expand, dry_run=not args.execute)
+
+    if not args.execute:
+        print("\n💡 Run with --execute to write the changes")
+
+
+if __name__ == "__main__":
+    main()
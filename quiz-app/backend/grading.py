@@ -0,0 +1,165 @@
+"""
+Bulk grading over a compact answer matrix.
+
+Each submission becomes one row of bytes: the option index picked for every
+question of the week, in question order (UNANSWERED for skipped or unlisted
+answers). Rows are concatenated into a single row-major bytes object, so a
+question's column is a strided slice (`matrix[j::width]`), done in C.
+
+Scoring a column is a `bytes.translate` to 0/1 per row. Columns are summed as
+big integers with one byte lane per row: every lane holds at most one point
+per question, so lanes never carry into each other while there are fewer than
+256 questions. The sum's bytes are the per-row scores.
+
+The same row is the compact stored form of a submission's answers
+(PACKED_ANSWERS_FIELD, see pack_answers): one byte per question instead of a
+map of question ids to option text. It only decodes against the same question
+ids, order and options, so each packed submission also stores a hash of them
+(PACKED_LAYOUT_FIELD); after the week's questions are reordered or edited,
+decoding raises PackedLayoutMismatch instead of returning the wrong answers.
+"""
+
+import hashlib
+import json
+from typing import Any, Dict, List, Optional, Tuple
+
+UNANSWERED = 255
+MAX_QUESTIONS = 254  # Keeps both option indices and lane sums below 256
+PACKED_ANSWERS_FIELD = "answers_packed"
+PACKED_LAYOUT_FIELD = "answers_layout"
+PACKED_FIELDS = [PACKED_ANSWERS_FIELD, PACKED_LAYOUT_FIELD]  # For query select()s
+
+
+class PackedLayoutMismatch(ValueError):
+    """The week's questions changed since the answers were packed"""
+
+
+def answers_layout(questions: List[Dict[str, Any]]) -> str:
+    """Hash of the question ids, order and options that packed rows index into"""
+    layout = json.dumps([[q["id"], q.get("options", [])] for q in questions], ensure_ascii=False)
+    return hashlib.sha256(layout.encode()).hexdigest()[:16]
+
+
+def answer_key_indices(questions: List[Dict[str, Any]]) -> List[Optional[int]]:
+    """Option index of each question's correct answer (None if it is not one of the options)"""
+    indices = []
+    for question in questions:
+        options = question.get("options", [])
+        correct = question.get("correct_answer")
+        indices.append(options.index(correct) if correct in options else None)
+    return indices
+
+
+def option_lookups(questions: List[Dict[str, Any]]) -> List[Tuple[str, Dict[str, int]]]:
+    """(question id, option text -> index) per question, in question order"""
+    lookups = []
+    for question in questions:
+        index = {}
+        for i, option in enumerate(question.get("options", [])[:UNANSWERED]):
+            index.setdefault(option, i)
+        lookups.append((question["id"], index))
+    return lookups
+
+
+def encode_row(answers: Dict[str, str], lookups: List[Tuple[str, Dict[str, int]]]) -> bytes:
+    """Option indices of one submission (question id -> option text), in question order"""
+    return bytes([index.get(answers.get(qid), UNANSWERED) for qid, index in lookups])
+
+
+def pack_answers(answers: Dict[str, str], questions: List[Dict[str, Any]]) -> Optional[bytes]:
+    """
+    Packed form of a submission's answers, or None if it cannot be stored losslessly
+    (an answer that is not one of the options, or a question id outside the week).
+    """
+    if len(questions) > MAX_QUESTIONS:
+        return None
+    lookups = option_lookups(questions)
+    known = {qid for qid, _ in lookups}
+    if any(qid not in known for qid in answers):
+        return None
+    row = encode_row(answers, lookups)
+    answered = sum(1 for index in row if index != UNANSWERED)
+    return row if answered == len(answers) else None
+
+
+def packed_answer_fields(answers: Dict[str, str], questions: List[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """Submission fields storing `answers` packed, or None if they cannot be packed losslessly"""
+    packed = pack_answers(answers, questions)
+    if packed is None:
+        return None
+    return {PACKED_ANSWERS_FIELD: packed, PACKED_LAYOUT_FIELD: answers_layout(questions)}
+
+
+def check_layout(data: Dict[str, Any], questions: List[Dict[str, Any]], layout: Optional[str] = None):
+    """Raises PackedLayoutMismatch if a packed submission was packed against other questions"""
+    if data.get(PACKED_LAYOUT_FIELD) != (layout or answers_layout(questions)):
+        raise PackedLayoutMismatch("Questions changed since these answers were packed")
+
+
+def unpack_answers(packed: bytes, questions: List[Dict[str, Any]]) -> Dict[str, str]:
+    answers = {}
+    for question, index in zip(questions, packed):
+        options = question.get("options", [])
+        if index != UNANSWERED and index < len(options):
+            answers[question["id"]] = options[index]
+    return answers
+
+
+def submission_answers(data: Dict[str, Any], questions: List[Dict[str, Any]]) -> Dict[str, str]:
+    """Answers map of a submission document in either storage format (may raise PackedLayoutMismatch)"""
+    packed = data.get(PACKED_ANSWERS_FIELD)
+    if packed is not None:
+        check_layout(data, questions)
+        return unpack_answers(packed, questions)
+    return data.get("answers") or {}
+
+
+class AnswerMatrix:
+    """Row-major matrix of option indices, one row per submission"""
+
+    def __init__(self, questions: List[Dict[str, Any]]):
+        if len(questions) > MAX_QUESTIONS:
+            raise ValueError(f"At most {MAX_QUESTIONS} questions per week can be graded in bulk")
+        self.questions = questions
+        self.width = len(questions)
+        self._lookups = option_lookups(questions)
+        self._layout = answers_layout(questions)
+        self._rows: List[bytes] = []
+        self._matrix: Optional[bytes] = None
+
+    def __len__(self):
+        return len(self._rows)
+
+    def append_answers(self, answers: Dict[str, str]):
+        self.append_row(encode_row(answers, self._lookups))
+
+    def append_submission(self, data: Dict[str, Any]):
+        """Adds a submission document; packed answers are used as-is (may raise PackedLayoutMismatch)"""
+        packed = data.get(PACKED_ANSWERS_FIELD)
+        if packed is not None:
+            check_layout(data, self.questions, self._layout)
+        if packed is not None and len(packed) == self.width:
+            self.append_row(bytes(packed))
+        else:
+            self.append_answers(submission_answers(data, self.questions))
+
+    def append_row(self, row: bytes):
+        self._rows.append(row)
+        self._matrix = None
+
+    def column(self, j: int) -> bytes:
+        if self._matrix is None:
+            self._matrix = b"".join(self._rows)
+        return self._matrix[j::self.width]
+
+    def scores(self, key: List[Optional[int]]) -> bytes:
+        """Score of every row against `key` (option index per question), one byte per row"""
+        rows = len(self._rows)
+        total = 0
+        for j, correct in enumerate(key):
+            if correct is None:
+                continue
+            hits = bytearray(256)
+            hits[correct] = 1
+            total += int.from_bytes(self.column(j).translate(hits), "big")
+        return total.to_bytes(rows, "big") if rows else b""
@@ -0,0 +1,75 @@
+"""
+Streaming top-K leaderboard builder.
+
+Documents are consumed straight from an async query stream and decoded once
+each; only the best `k` entries are kept, in a min-heap whose root is the
+worst entry kept. Ordering is score descending, then time ascending (earlier
+documents win exact ties, as with a stable sort), so memory is O(k) and CPU
+O(n log k) however many documents match.
+
+When the stream is ordered by score descending (`ordered=True`), it is closed
+as soon as a score falls below the worst kept entry: nothing after it can rank.
+"""
+
+import heapq
+import itertools
+from contextlib import aclosing
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple
+
+LEADERBOARD_SIZE = 50
+
+Entry = Dict[str, Any]
+
+
+class TopK:
+    """Best `k` entries by (score desc, time asc)"""
+
+    def __init__(self, k: int = LEADERBOARD_SIZE):
+        self.k = k
+        self._heap: List[Tuple[float, float, int, Entry]] = []  # (score, -time, -seq, entry): root is the worst
+        self._seq = itertools.count()
+
+    def __len__(self):
+        return len(self._heap)
+
+    def can_enter(self, score: float) -> bool:
+        """False if an entry with this score cannot be kept whatever its time"""
+        return len(self._heap) < self.k or score >= self._heap[0][0]
+
+    def push(self, entry: Entry, score: float, time: float):
+        item = (score, -time, -next(self._seq), entry)
+        if len(self._heap) < self.k:
+            heapq.heappush(self._heap, item)
+        elif item > self._heap[0]:
+            heapq.heapreplace(self._heap, item)
+
+    def best_first(self) -> List[Entry]:
+        return [item[3] for item in sorted(self._heap, reverse=True)]
+
+
+# decode(snapshot) -> (entry, score, time), or None to skip the document; time may be None
+# when it is expensive, in which case complete(snapshot, entry) fills the entry and returns it
+Decoder = Callable[[Any], Optional[Tuple[Entry, float, Optional[float]]]]
+
+
+async def stream_top_k(docs: AsyncIterator[Any], decode: Decoder, k: int = LEADERBOARD_SIZE, ordered: bool = False,
+                       complete: Optional[Callable[[Any, Entry], Awaitable[float]]] = None) -> List[Entry]:
+    """
+    Top `k` entries of a document stream, best first. `complete` is only called
+    for documents whose score can still enter the board.
+    """
+    top = TopK(k)
+    async with aclosing(docs):
+        async for doc in docs:
+            decoded = decode(doc)
+            if decoded is None:
+                continue
+            entry, score, time = decoded
+            if not top.can_enter(score):
+                if ordered:
+                    break
+                continue
+            if time is None:
+                time = await complete(doc, entry)
+            top.push(entry, score, time)
+    return top.best_first()
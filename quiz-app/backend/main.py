@@ -1,82 +1,263 @@
 import uuid
 import os
 import time
-from typing import List, Dict, Any, Optional
-from fastapi import FastAPI, HTTPException, Query
+import math
+import asyncio
+import csv
+import json
+import codecs
+from contextlib import asynccontextmanager
+from typing import List, Dict, Any, Optional, AsyncIterator, Literal, Annotated
+from fastapi import FastAPI, HTTPException, Query, Request, Response, Header
+from fastapi.exception_handlers import http_exception_handler
+from fastapi.responses import PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
-import firebase_admin
-from firebase_admin import credentials, firestore
+from pydantic import BaseModel, ValidationError
+from google.api_core import exceptions
 from dotenv import load_dotenv
-from datetime import datetime
-import pytz
+from datetime import datetime, timezone
+import logging
 
 from ai.genai import generate_questions_by_ai
+from schema import QuizQuestion
+from analytics import (ANSWER_STATS_COLLECTION, SCORE_STATS_COLLECTION, SCORE_STATS_SHARDS, OVERALL_SCOPE, USER_STATS_FIELD,
+                       random_shard_id, answer_stats_delta, merge_answer_shards, answer_distribution, score_stats_delta,
+                       merge_score_shards, score_moves_delta, score_distribution, user_stats_fields, user_stats_view)
+from grading import (AnswerMatrix, PackedLayoutMismatch, answer_key_indices, packed_answer_fields, submission_answers,
+                     PACKED_ANSWERS_FIELD, PACKED_FIELDS)
+from storage import create_client, fields
+from storage.circuit import UNAVAILABLE_ERRORS, CircuitBreaker, storage_unavailable
+from storage.instrumented import instrument_client, set_circuit_breaker, set_latency_observer, track_ops
+import metrics
+from profiler import profiler, ProfilingMiddleware, PROFILER_TOKEN, DEFAULT_INTERVAL, MAX_WINDOW_SECONDS
+from structured_logging import configure_logging, RequestContextMiddleware
+from ratelimit import RateLimitMiddleware
+from leaderboard import LEADERBOARD_SIZE, stream_top_k
+from weeks import INACTIVE, WeekScheduler, WeekTimeline, iso_week_id, week_offset
 
 load_dotenv()
+configure_logging()
+logger = logging.getLogger("quiz")
 
 # Utility for standardizing time
 def get_current_utc_time():
-    return datetime.now(pytz.utc)
+    return datetime.now(timezone.utc)
 
 def get_current_iso_week() -> str:
-    """Returns absolute current ISO week identifier, e.g., '2024-W51' (based on system time)"""
-    now = datetime.now()
+    """Returns absolute current ISO week identifier, e.g., '2024-W51' (UTC, like the week timeline)"""
+    now = get_current_utc_time()
     iso_cal = now.isocalendar()
     # Use iso_cal[0] (ISO year) not now.year, because Dec 31 may belong to Week 1 of next year
     return f"{iso_cal[0]}-W{iso_cal[1]:02d}"
 
-# Initialize Firebase Admin
-try:
-    if not firebase_admin._apps:
-        # Check for local credentials
-        cred_path = os.getenv("GOOGLE_APPLICATION_CREDENTIALS")
-        if cred_path:
-             print(f"Loading credentials from {cred_path}")
-             cred = credentials.Certificate(cred_path)
-             firebase_admin.initialize_app(cred)
-        else:
-             print("No local credentials found. Using Application Default Credentials (Cloud Run).")
-             firebase_admin.initialize_app()
+# Initialize Firestore Client (or a local stand-in, see storage/__init__.py)
+DB_NAME = os.getenv("DB_NAME")
+# Cloud Firestore is created on first use, so importing the app stays cheap
+db = instrument_client(create_client(lazy=True))
+set_latency_observer(lambda operation, seconds: metrics.STORAGE_LATENCY.observe(operation, value=seconds))
 
-except Exception as e:
-    print(f"Warning: Failed to initialize Firebase: {e}")
+def on_circuit_state_change(state: str):
+    logger.warning("Storage circuit %s", state, extra={"circuit_state": state})
+    metrics.STORAGE_CIRCUIT_OPEN.set(value=0 if state == "closed" else 1)
 
-# Initialize Firestore Client
-DB_NAME = os.getenv("DB_NAME")
-db = firestore.AsyncClient(database=DB_NAME)
+# Every storage call gets a deadline; repeated failures open the circuit and reads fall back to stale caches
+storage_breaker = CircuitBreaker(
+    failure_threshold=int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", "5")),
+    reset_timeout=float(os.getenv("CIRCUIT_RESET_SECONDS", "10")),
+    deadline=float(os.getenv("STORAGE_DEADLINE", "5")),
+    on_state_change=on_circuit_state_change,
+)
+set_circuit_breaker(storage_breaker)
+
+WARMUP_TIMEOUT = 10  # seconds; startup proceeds with cold caches if warm-up takes longer
+
+async def warm_caches():
+    """Loads the quiz config and the active week's questions into the caches before the first request"""
+    started = time.perf_counter()
+    await get_quiz_settings()
+    week_id = await get_active_week_id()
+    if week_id != INACTIVE:
+        await get_week_questions(week_id)
+    logger.info("Caches warmed in %.3fs", time.perf_counter() - started, extra={"week_id": week_id})
+
+async def on_week_start(week_id: str):
+    """Warm-up when a week opens: fresh questions in the cache, leaderboards rebuilt on next read"""
+    questions_cache.pop(week_id, None)
+    questions = await get_week_questions(week_id)
+    expire_cache(leaderboard_cache)
+    logger.info("Week started", extra={"week_id": week_id, "questions": len(questions)})
+
+async def on_week_end(week_id: str):
+    """Finalisation when a week closes: its final leaderboard is built once and served from the cache"""
+    distribution_cache.pop(week_id, None)
+    cache_key = f"weekly_{week_id}"
+    board = await single_flight(leaderboard_rebuilds, cache_key, lambda: build_leaderboard("weekly", week_id, cache_key))
+    logger.info("Week finalised", extra={"week_id": week_id, "leaderboard_entries": len(board)})
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    try:
+        await asyncio.wait_for(warm_caches(), WARMUP_TIMEOUT)
+    except Exception:
+        logger.warning("Cache warm-up failed, starting with cold caches", exc_info=True)
+    week_scheduler.start()
+    yield
+    await week_scheduler.stop()
+
+app = FastAPI(lifespan=lifespan)
+
+def storage_unavailable_error(detail: Any = "Storage temporarily unavailable") -> HTTPException:
+    """503 asking the client to come back when the storage circuit lets calls through again"""
+    retry_after = max(1, math.ceil(storage_breaker.retry_after()))
+    return HTTPException(status_code=503, detail=detail, headers={"Retry-After": str(retry_after)})
+
+def request_error(exc: Exception, detail: Any = None) -> HTTPException:
+    """HTTPException for a failed request: 503 with Retry-After if storage is unavailable, else 500"""
+    if storage_unavailable(exc):
+        return storage_unavailable_error(detail or "Storage temporarily unavailable")
+    return HTTPException(status_code=500, detail=detail or str(exc))
+
+async def storage_unavailable_handler(request: Request, exc: Exception):
+    # Storage errors no endpoint handled (e.g. a read with the circuit open)
+    return await http_exception_handler(request, storage_unavailable_error())
+
+for error_class in UNAVAILABLE_ERRORS:
+    app.add_exception_handler(error_class, storage_unavailable_handler)
 
-app = FastAPI()
+# --- DB OPERATION ACCOUNTING ---
+DEBUG_DB_OPS = os.getenv("DEBUG_DB_OPS", "").lower() in ("1", "true", "yes")
+N_PLUS_ONE_THRESHOLD = int(os.getenv("N_PLUS_ONE_THRESHOLD", "10"))  # Sequential point reads before a request is flagged
+endpoint_db_ops: Dict[str, Dict[str, int]] = {}  # Key: "GET /api/leaderboard" -> summed counters
+
+@app.middleware("http")
+async def account_db_ops(request: Request, call_next):
+    """
+    Counts storage operations per request (see storage/instrumented.py).
+    Aggregates them per endpoint, adds X-DB-* headers when DEBUG_DB_OPS is set
+    and flags requests with long runs of sequential point reads (N+1 lookups).
+    """
+    ops = track_ops()
+    response = await call_next(request)
+
+    route = request.scope.get("route")
+    endpoint = f"{request.method} {getattr(route, 'path', request.url.path)}"
+    counts = ops.as_dict()
+    totals = endpoint_db_ops.setdefault(endpoint, {"requests": 0, "n_plus_one_flags": 0})
+    totals["requests"] += 1
+    for key, value in counts.items():
+        if key == "max_point_read_streak":
+            totals[key] = max(totals.get(key, 0), value)
+        else:
+            totals[key] = totals.get(key, 0) + value
+
+    if ops.max_point_read_streak > N_PLUS_ONE_THRESHOLD:
+        totals["n_plus_one_flags"] += 1
+        logger.warning("N+1 suspected: %d sequential point reads on '%s' in %s",
+                       ops.max_point_read_streak, ops.max_streak_collection, endpoint,
+                       extra={"endpoint": endpoint, "db_ops": counts})
+
+    if DEBUG_DB_OPS:
+        logger.debug("DB ops for %s", endpoint, extra={"endpoint": endpoint, "db_ops": counts})
+        response.headers["X-DB-Reads"] = str(ops.reads)
+        response.headers["X-DB-Writes"] = str(ops.writes)
+        response.headers["X-DB-Queries"] = str(ops.queries)
+        response.headers["X-DB-Docs"] = str(ops.docs)
+        response.headers["X-DB-Point-Read-Streak"] = str(ops.max_point_read_streak)
+    return response
 
 # --- CACHES ---
 CACHE_TTL = 30  # seconds
 leaderboard_cache: Dict[str, tuple[list, float]] = {} # Key: "weekly_{week_id}" or "overall"
+leaderboard_rebuilds: Dict[str, asyncio.Future] = {} # Same keys -> rebuild in progress
+LEADERBOARD_MAX_REBUILDS = 2  # Distinct leaderboards rebuilt at once; more get a 429
+questions_cache: Dict[str, tuple[list, float]] = {} # Key: week_id -> full question rows (incl. correct_answer)
+config_cache: Dict[str, tuple[Optional[dict], float]] = {} # Key: "quiz_settings" -> config doc (None if missing)
+distribution_cache: Dict[str, tuple[dict, float]] = {} # Key: week_id or "overall" -> summed score_stats shards
+USER_STATS_CACHE_SIZE = 5000
+user_stats_cache: Dict[str, tuple[dict, float]] = {} # Key: user_id -> {"name", "stats"}, least recently used first
+
+# Completed submissions by idempotency key, so client retries are answered without storage calls.
+# Keys are also persisted on the submission document for retries that land on another instance.
+IDEMPOTENCY_TTL = 15 * 60  # seconds
+IDEMPOTENCY_MAX_KEYS = 10000
+idempotency_cache: Dict[str, tuple[dict, float]] = {} # Key: "{user_id}:{week_id}:{idempotency key}" -> response
+idempotency_inflight: Dict[str, asyncio.Future] = {} # Same key -> response of the attempt still running
+
+# Store submission answers as packed option indices (see grading.py) instead of a question id -> option text map
+COMPACT_ANSWERS = os.getenv("COMPACT_ANSWERS", "").lower() in ("1", "true", "yes")
+
+# Firestore rejects batches with more than 500 writes
+FIRESTORE_BATCH_LIMIT = 500
+BATCH_COMMIT_CONCURRENCY = 4
+
+# Week windows from the 'weeks' collection, kept in memory and followed by week_scheduler (see weeks.py)
+week_timeline = WeekTimeline()
+week_timeline_loads: Dict[str, asyncio.Future] = {} # "weeks" -> timeline load in progress
+SUBMIT_GRACE_SECONDS = 120  # After a week ends, on top of the quiz timer (players who started just before the end)
+DEFAULT_TIMER_MINUTES = 10
+week_scheduler = WeekScheduler(week_timeline, lambda: load_week_timeline(), on_start=on_week_start, on_end=on_week_end,
+                               clock=get_current_utc_time)
 
 # --- HELPERS ---
 
+def expire_cache(cache: Dict[str, tuple]):
+    """Marks every entry as expired but keeps it, so it can still be served stale (see serve_stale)"""
+    for key, (data, _) in list(cache.items()):
+        cache[key] = (data, 0.0)
+
+def stale_entry(cache: Dict[str, tuple], key: str, cache_name: str, response: Optional[Response]):
+    """Cached value for `key` regardless of age, with X-Stale set on the response; None if never cached"""
+    if key not in cache:
+        return None
+    data, ts = cache[key]
+    metrics.STALE_RESPONSES.inc(cache_name)
+    if response is not None:
+        response.headers["X-Stale"] = "true"
+    return data
+
+def serve_stale(cache: Dict[str, tuple], key: str, cache_name: str, response: Optional[Response], exc: Exception):
+    """
+    Last known good value for a read endpoint whose storage call failed with `exc`.
+    Errors other than storage being unavailable are re-raised; with nothing cached the
+    request fails fast with 503 and Retry-After.
+    """
+    if not storage_unavailable(exc):
+        raise exc
+    if key in cache:
+        logger.info("Serving stale %s for %s: %s", cache_name, key, exc)
+        return stale_entry(cache, key, cache_name, response)
+    raise storage_unavailable_error()
+
+async def load_week_timeline():
+    """Reads the 'weeks' collection (one small query) into week_timeline"""
+    docs = []
+    async for doc in db.collection("weeks").stream():
+        docs.append({"week_id": doc.id, **doc.to_dict()})
+    week_timeline.load(docs)
+
+async def ensure_week_timeline():
+    """Loads the timeline if startup could not; while storage is down, weeks default to their ISO calendar week"""
+    if week_timeline.loaded:
+        return
+    try:
+        await single_flight(week_timeline_loads, "weeks", load_week_timeline)
+    except Exception as e:
+        if not storage_unavailable(e):
+            raise
+
 async def get_active_week_id() -> str:
     """
-    Determines the PREFERRED active week.
-    1. Checks if there is a week explicitly scheduled for NOW in 'weeks' collection.
-    2. If not, falls back to calendar week.
+    Determines the PREFERRED active week from the in-memory week timeline (no storage reads):
+    1. A week scheduled in 'weeks' whose start_time/end_time window contains NOW.
+    2. If not, the calendar week, unless it has a 'weeks' document (then "inactive").
     """
-    now = get_current_utc_time()
-    
-    # Check for active scheduled week
-    # Note: This query might require a composite index if we have many weeks. 
-    # For small scale, streaming all weeks or caching config is fine.
-    # Optimization: Read from 'config/current_week' if we want to force it globally.
-    
-    # Heuristic: Check if the current ISO week exists in 'weeks' and if it has override times
-    iso_week = get_current_iso_week()
-    week_doc = await db.collection("weeks").document(iso_week).get()
-    
-    if week_doc.exists:
-        data = week_doc.to_dict()
-        if data.get("is_active") is False:
-            return "inactive" # Explicitly disabled
-            
-    return iso_week
+    await ensure_week_timeline()
+    return week_timeline.active_week(get_current_utc_time())
+
+async def get_latest_week_id() -> str:
+    """The active week, or between weeks the one that just ended (default week for leaderboards and stats)"""
+    await ensure_week_timeline()
+    return week_timeline.latest_week(get_current_utc_time())
 
 async def get_week_config(week_id: str):
     doc = await db.collection("weeks").document(week_id).get()
@@ -84,17 +265,105 @@ async def get_week_config(week_id: str):
         return doc.to_dict()
     return None
 
+async def get_week_questions(week_id: str) -> List[Dict[str, Any]]:
+    """Full question rows of a week ordered by `order`, served from questions_cache when fresh"""
+    current_time = time.time()
+    if week_id in questions_cache:
+        data, ts = questions_cache[week_id]
+        if current_time - ts < CACHE_TTL:
+            metrics.record_cache("questions", True)
+            return data
+    metrics.record_cache("questions", False)
+
+    questions_ref = db.collection("questions").where("week_id", "==", week_id).order_by("order")
+    rows = []
+    async for doc in questions_ref.stream():
+        q = doc.to_dict()
+        q["id"] = doc.id
+        rows.append(q)
+
+    questions_cache[week_id] = (rows, current_time)
+    return rows
+
+def score_answers(answers: Dict[str, str], correct_answers: Dict[str, str]) -> int:
+    """Number of answers matching the answer key (question id -> option text)"""
+    return sum(1 for qid, selected_option in answers.items() if correct_answers.get(qid) == selected_option)
+
+async def commit_writes(writes: List[tuple], chunk_size: int = FIRESTORE_BATCH_LIMIT,
+                        missing: Optional[list] = None) -> int:
+    """
+    Commits (op, doc_ref, data) writes in batches of at most `chunk_size`,
+    running up to BATCH_COMMIT_CONCURRENCY commits at once.
+    op is one of "set", "merge" (set with merge=True), "update", "delete" (data is ignored for deletes).
+    Chunks commit independently: a failure does not roll back chunks already written.
+    With a `missing` list, a chunk failing because an update targets a missing document
+    is retried write by write; those updates are skipped and their refs appended to it.
+    """
+    semaphore = asyncio.Semaphore(BATCH_COMMIT_CONCURRENCY)
+
+    async def commit_chunk(chunk):
+        batch = db.batch()
+        for op, ref, data in chunk:
+            if op == "delete":
+                batch.delete(ref)
+            elif op == "update":
+                batch.update(ref, data)
+            elif op == "merge":
+                batch.set(ref, data, merge=True)
+            else:
+                batch.set(ref, data)
+        async with semaphore:
+            try:
+                await batch.commit()
+            except exceptions.NotFound:
+                if missing is None or len(chunk) == 1:
+                    raise
+            else:
+                return
+        for write in chunk:
+            try:
+                await commit_chunk([write])
+            except exceptions.NotFound:
+                missing.append(write[1])
+
+    chunks = [writes[i:i + chunk_size] for i in range(0, len(writes), chunk_size)]
+    await asyncio.gather(*(commit_chunk(chunk) for chunk in chunks))
+    return len(writes)
+
+async def get_quiz_settings() -> Optional[Dict[str, Any]]:
+    """The config/quiz_settings document (None if missing), served from config_cache when fresh"""
+    current_time = time.time()
+    if "quiz_settings" in config_cache:
+        data, ts = config_cache["quiz_settings"]
+        if current_time - ts < CACHE_TTL:
+            metrics.record_cache("config", True)
+            return data
+    metrics.record_cache("config", False)
+
+    doc = await db.collection("config").document("quiz_settings").get()
+    data = doc.to_dict() if doc.exists else None
+    config_cache["quiz_settings"] = (data, current_time)
+    return data
+
+async def submission_grace_seconds() -> int:
+    """Quiz timer plus SUBMIT_GRACE_SECONDS (the config is cached and read by submit anyway)"""
+    try:
+        config = await get_quiz_settings()
+    except Exception:
+        config = None
+    minutes = (config or {}).get("timer_duration_minutes", DEFAULT_TIMER_MINUTES)
+    return int(minutes * 60) + SUBMIT_GRACE_SECONDS
+
 async def is_tester_phone(phone: str) -> bool:
     """Check if the given phone number is in the tester list"""
     try:
-        doc = await db.collection("config").document("quiz_settings").get()
-        if doc.exists:
-            config = doc.to_dict()
+        config = await get_quiz_settings()
+        if config:
             tester_phones = config.get("tester_phones", [])
             return phone in tester_phones
         return False
     except Exception as e:
-        print(f"Error checking tester status: {e}")
+        logger.warning("Error checking tester status: %s", e)
         return False
 
 # --- MODELS ---
@@ -134,6 +403,269 @@ class QuestionCreate(BaseModel):
 class QuestionBatchCreate(BaseModel):
     questions: List[QuestionCreate]
 
+# --- QUESTION PIPELINE ---
+
+# AI output uses letter keys ('a'-'d') for the correct choice; stored questions use the option text
+LETTER_TO_INDEX = {"a": 0, "b": 1, "c": 2, "d": 3}
+
+def normalize_ai_questions(question_sets: List[Dict[str, Any]], week_id: str, limit: Optional[int] = None) -> tuple[List[QuestionCreate], List[Dict[str, Any]]]:
+    """
+    Converts raw `QuizQuestions.question_sets` items into stored `QuestionCreate` rows.
+    - Validates each item against schema.QuizQuestion
+    - Trims text/choices, drops duplicates and items without 4 distinct choices
+    - Maps the letter key to the option text (the stored answer format)
+    - Assigns deterministic ids and sequential orders for the week
+    Returns (questions, rejected) where rejected lists {index, error} for skipped items.
+    """
+    questions: List[QuestionCreate] = []
+    rejected: List[Dict[str, Any]] = []
+    seen_texts = set()
+
+    for idx, raw in enumerate(question_sets):
+        if limit is not None and len(questions) >= limit:
+            break
+        try:
+            item = dict(raw)
+            if isinstance(item.get("correct_answer"), str):
+                item["correct_answer"] = item["correct_answer"].strip().lower()
+            parsed = QuizQuestion.model_validate(item)
+        except ValidationError as e:
+            rejected.append({"index": idx, "error": str(e)})
+            continue
+        except (TypeError, ValueError) as e:
+            rejected.append({"index": idx, "error": f"Malformed item: {e}"})
+            continue
+
+        text = parsed.question.strip()
+        options = [c.strip() for c in parsed.choices]
+
+        if not text:
+            rejected.append({"index": idx, "error": "Empty question text"})
+            continue
+        if len(options) != 4 or any(not o for o in options) or len(set(options)) != 4:
+            rejected.append({"index": idx, "error": "Expected 4 distinct, non-empty choices"})
+            continue
+        if text.lower() in seen_texts:
+            rejected.append({"index": idx, "error": "Duplicate question"})
+            continue
+        seen_texts.add(text.lower())
+
+        order = len(questions) + 1
+        questions.append(QuestionCreate(
+            id=f"{week_id}-q{order:02d}",
+            text=text,
+            options=options,
+            answer=options[LETTER_TO_INDEX[parsed.correct_answer]],
+            order=order,
+            week_id=week_id
+        ))
+
+    return questions, rejected
+
+def question_to_doc(question: QuestionCreate) -> Dict[str, Any]:
+    """Stored Firestore representation of a question"""
+    return {
+        "text": question.text,
+        "options": question.options,
+        "correct_answer": question.answer,
+        "order": question.order,
+        "week_id": question.week_id
+    }
+
+async def save_questions_batch(questions: List[QuestionCreate]) -> Dict[str, Any]:
+    """
+    Makes the stored questions of each week in `questions` match the given set.
+    Diffs against the stored documents and only writes added/changed questions
+    and deletes removed ones, in chunked concurrent batches.
+    """
+    by_week: Dict[str, List[QuestionCreate]] = {}
+    for question in questions:
+        by_week.setdefault(question.week_id, []).append(question)
+
+    writes = []
+    stats = {"added": 0, "updated": 0, "deleted": 0, "unchanged": 0}
+    for week_id, week_questions in by_week.items():
+        existing = {doc.id: doc async for doc in db.collection("questions").where("week_id", "==", week_id).stream()}
+        desired = {q.id: question_to_doc(q) for q in week_questions}
+
+        for qid, doc in existing.items():
+            if qid not in desired:
+                writes.append(("delete", doc.reference, None))
+                stats["deleted"] += 1
+
+        for qid, data in desired.items():
+            if qid not in existing:
+                stats["added"] += 1
+            elif existing[qid].to_dict() != data:
+                stats["updated"] += 1
+            else:
+                stats["unchanged"] += 1
+                continue
+            writes.append(("set", db.collection("questions").document(qid), data))
+
+    logger.info("Saving questions for weeks %s", sorted(by_week), extra={"weeks": sorted(by_week), **stats})
+    await commit_writes(writes)
+
+    # Refresh the per-week question caches once with the saved sets (no re-read)
+    current_time = time.time()
+    for week_id, week_questions in by_week.items():
+        rows = [{**question_to_doc(q), "id": q.id} for q in sorted(week_questions, key=lambda q: q.order)]
+        questions_cache[week_id] = (rows, current_time)
+
+    return {"status": "success", **stats}
+
+# --- BULK IMPORT ---
+
+IMPORT_MAX_ERRORS = 200  # Row errors reported back; the rest are only counted
+OPTION_COLUMNS = ["option_a", "option_b", "option_c", "option_d"]
+
+async def iter_body_lines(request: Request) -> AsyncIterator[str]:
+    """Decodes the request body incrementally and yields it line by line"""
+    decoder = codecs.getincrementaldecoder("utf-8-sig")()
+    pending = ""
+    async for chunk in request.stream():
+        pending += decoder.decode(chunk)
+        *lines, pending = pending.split("\n")
+        for line in lines:
+            yield line + "\n"
+    pending += decoder.decode(b"", final=True)
+    if pending:
+        yield pending
+
+def in_quoted_field(line: str, in_quotes: bool) -> bool:
+    """
+    Whether a CSV record is still inside a quoted field after `line`. Follows
+    csv.reader: a quote only opens a quoted field at the start of a field, so
+    quotes inside unquoted fields (12" long) are literal.
+    """
+    if not in_quotes and '"' not in line:
+        return False
+    field_start = not in_quotes
+    i = 0
+    while i < len(line):
+        char = line[i]
+        if in_quotes:
+            if char == '"':
+                if line[i + 1:i + 2] == '"':
+                    i += 1  # Escaped quote
+                else:
+                    in_quotes = False
+        elif char == ",":
+            field_start = True
+        elif char == '"' and field_start:
+            in_quotes, field_start = True, False
+        else:
+            field_start = False
+        i += 1
+    return in_quotes
+
+def parse_csv_record(record: str):
+    try:
+        return next(csv.reader([record]))
+    except csv.Error as e:
+        return ValueError(f"Invalid CSV: {e}")
+
+async def iter_csv_records(lines: AsyncIterator[str]) -> AsyncIterator[tuple[int, Any]]:
+    """
+    Yields (line_no, fields) per CSV record without buffering the file, or an
+    Exception for a record csv.reader rejects. A record spans several lines
+    while a quoted field is open (quoted newline).
+    """
+    record = ""
+    in_quotes = False
+    start_line = line_no = 0
+    async for line in lines:
+        line_no += 1
+        if not record:
+            start_line = line_no
+        record += line
+        in_quotes = in_quoted_field(line, in_quotes)
+        if in_quotes:
+            continue
+        if record.strip():
+            yield start_line, parse_csv_record(record)
+        record = ""
+    if record.strip():
+        yield start_line, parse_csv_record(record)
+
+async def iter_import_rows(request: Request, format: str) -> AsyncIterator[tuple[int, Any]]:
+    """Yields (line_no, row) where row is a dict, or an Exception for unparseable lines"""
+    lines = iter_body_lines(request)
+    if format == "jsonl":
+        line_no = 0
+        async for line in lines:
+            line_no += 1
+            if not line.strip():
+                continue
+            try:
+                yield line_no, json.loads(line)
+            except json.JSONDecodeError as e:
+                yield line_no, ValueError(f"Invalid JSON: {e.msg}")
+        return
+
+    header = None
+    async for line_no, values in iter_csv_records(lines):
+        if isinstance(values, Exception):
+            yield line_no, values
+            continue
+        if header is None:
+            header = [h.strip().lower() for h in values]
+            continue
+        if len(values) != len(header):
+            yield line_no, ValueError(f"Expected {len(header)} columns, got {len(values)}")
+            continue
+        yield line_no, dict(zip(header, values))
+
+def parse_import_row(row: Dict[str, Any]) -> QuestionCreate:
+    """
+    Builds a QuestionCreate from an imported row.
+    Options come from `options` (list, JSON array or '|'-separated) or option_a..option_d.
+    `answer` (or `correct_answer`) may be the option text or a letter 'a'-'d'.
+    `id` defaults to '{week_id}-q{order:02d}'.
+    """
+    if not isinstance(row, dict):
+        raise ValueError("Row must be an object")
+    row = {k: v.strip() if isinstance(v, str) else v for k, v in row.items()}
+
+    options = row.get("options")
+    if options is not None and not isinstance(options, (list, str)):
+        raise ValueError("options must be a list or a string")
+    if isinstance(options, str):
+        options = json.loads(options) if options.startswith("[") else options.split("|")
+        if not isinstance(options, list):
+            raise ValueError("options must be a list or a string")
+    if not options:
+        options = [row[c] for c in OPTION_COLUMNS if row.get(c)]
+    options = [str(o).strip() for o in options]
+
+    answer = row.get("answer") or row.get("correct_answer") or ""
+    if isinstance(answer, str) and answer.lower() in LETTER_TO_INDEX and answer not in options:
+        index = LETTER_TO_INDEX[answer.lower()]
+        if index < len(options):
+            answer = options[index]
+
+    order = row.get("order")
+    week_id = row.get("week_id")
+    question_id = row.get("id")
+    if not question_id and week_id and str(order or "").isdigit():
+        question_id = f"{week_id}-q{int(order):02d}"
+
+    question = QuestionCreate(
+        id=question_id or "",
+        text=row.get("text") or row.get("question") or "",
+        options=options,
+        answer=answer,
+        order=order,
+        week_id=week_id or ""
+    )
+    if not question.id or not question.week_id or not question.text:
+        raise ValueError("id, week_id and text are required")
+    if len(options) < 2 or len(set(options)) != len(options):
+        raise ValueError("Expected at least 2 distinct options")
+    if question.answer not in question.options:
+        raise ValueError("answer must be one of the options")
+    return question
+
 # --- ENDPOINTS ---
 
 @app.post("/api/register")
@@ -166,59 +698,123 @@ async def register(user: UserRegister):
         "name": user.name,
         "phone": user.phone,
         "cumulative_score": 0, # New Field
-        "created_at": firestore.SERVER_TIMESTAMP
+        "created_at": fields.SERVER_TIMESTAMP
     }
     
     try:
         await doc_ref.set(user_data)
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+        raise request_error(e)
     
     return {"user_id": user_id, "has_submitted": False, "week_id": week_id}
 
 @app.get("/api/questions")
-async def get_questions(week_id: Optional[str] = None):
+async def get_questions(week_id: Optional[str] = None, response: Response = None):
     # If no week_id provided, get for CURRENT active week
     target_week = week_id if week_id else await get_active_week_id()
     
-    if target_week == "inactive":
+    if target_week == INACTIVE:
         return []
 
     # Fetch questions for this week
-    questions_ref = db.collection("questions").where("week_id", "==", target_week).order_by("order")
-    docs = [doc async for doc in questions_ref.stream()]
-    
+    try:
+        rows = await get_week_questions(target_week)
+    except Exception as e:
+        rows = serve_stale(questions_cache, target_week, "questions", response, e)
+
     public_questions = []
-    for doc in docs:
-        q = doc.to_dict()
+    for q in rows:
         public_questions.append({
-            "id": doc.id,
+            "id": q["id"],
             "text": q["text"],
             "options": q["options"]
         })
     return public_questions
 
+async def single_flight(inflight: Dict[str, asyncio.Future], key: str, run):
+    """
+    Awaits run() once per key at a time: callers arriving while it runs get the
+    same result (or exception) instead of starting another run.
+    """
+    if key in inflight:
+        return await asyncio.shield(inflight[key])
+    future = asyncio.get_running_loop().create_future()
+    inflight[key] = future
+    try:
+        result = await run()
+        future.set_result(result)
+        return result
+    except BaseException as e:
+        future.set_exception(e)
+        future.exception()  # Marks it retrieved when nobody else is waiting
+        raise
+    finally:
+        inflight.pop(key, None)
+
+def remember_user_stats(user_id: str, entry: dict):
+    user_stats_cache.pop(user_id, None)
+    user_stats_cache[user_id] = (entry, time.time())
+    if len(user_stats_cache) > USER_STATS_CACHE_SIZE:
+        del user_stats_cache[next(iter(user_stats_cache))]  # Least recently used
+
+def remember_idempotent_response(cache_key: str, response: dict):
+    idempotency_cache[cache_key] = (response, time.time())
+    if len(idempotency_cache) > IDEMPOTENCY_MAX_KEYS:
+        del idempotency_cache[next(iter(idempotency_cache))]  # Oldest first (insertion order)
+
 @app.post("/api/submit")
-async def submit(submission: SubmitAnswers):
-    global leaderboard_cache
-    
-    # Verify week is valid/active
-    # (Skipping strict time validation for now to simplify, but implied by architecture)
-    
+async def submit(submission: SubmitAnswers, idempotency_key: Annotated[Optional[str], Header(max_length=128)] = None):
+    """
+    Scores and stores a submission. Clients may send an Idempotency-Key header and
+    reuse it on retries: a retry of a completed submission returns the original
+    response, and a retry arriving while the first attempt runs waits for it (or,
+    on another instance, fails to create the submission and returns the stored one).
+    """
+    if not idempotency_key:
+        return await process_submission(submission)
+
+    cache_key = f"{submission.user_id}:{submission.week_id}:{idempotency_key}"
+    cached = idempotency_cache.get(cache_key)
+    if cached and time.time() - cached[1] < IDEMPOTENCY_TTL:
+        return cached[0]
+
+    async def run():
+        response = await process_submission(submission, idempotency_key)
+        remember_idempotent_response(cache_key, response)
+        return response
+    return await single_flight(idempotency_inflight, cache_key, run)
+
+async def replay_submission(sub_ref, idempotency_key: Optional[str]) -> Optional[dict]:
+    """Response of the stored submission if it was made with this Idempotency-Key (on any instance), else None"""
+    if not idempotency_key:
+        return None
+    sub_doc = await sub_ref.get()
+    stored = sub_doc.to_dict() if sub_doc.exists else {}
+    if stored.get("idempotency_key") != idempotency_key:
+        return None
+    return {"score": stored.get("score", 0)}
+
+async def process_submission(submission: SubmitAnswers, idempotency_key: Optional[str] = None) -> dict:
     week_id = submission.week_id
-    
-    # Calculate score
-    questions_ref = db.collection("questions").where("week_id", "==", week_id)
-    docs = [doc async for doc in questions_ref.stream()]
-    correct_answers = {doc.id: doc.to_dict().get("correct_answer") for doc in docs}
-
-    score = 0
-    for qid, selected_option in submission.answers.items():
-        if correct_answers.get(qid) == selected_option:
-            score += 1
+    user_ref = db.collection("users").document(submission.user_id)
+    sub_ref = user_ref.collection("submissions").document(week_id)
+
+    # Verify the week is open (in-memory timeline, no reads)
+    await ensure_week_timeline()
+    now = get_current_utc_time()
+    if not week_timeline.accepting(week_id, now) and not week_timeline.accepting(week_id, now, await submission_grace_seconds()):
+        # A retry of a submission stored before the window closed still gets its result
+        replay = await replay_submission(sub_ref, idempotency_key)
+        if replay is not None:
+            return replay
+        raise HTTPException(status_code=403, detail=f"Submissions for week {week_id} are closed")
     
     try:
-        user_ref = db.collection("users").document(submission.user_id)
+        # Calculate score
+        questions = await get_week_questions(week_id)
+        correct_answers = {q["id"]: q.get("correct_answer") for q in questions}
+        score = score_answers(submission.answers, correct_answers)
+
         user_doc = await user_ref.get()
         if not user_doc.exists:
             raise HTTPException(status_code=404, detail="User not found")
@@ -227,53 +823,103 @@ async def submit(submission: SubmitAnswers):
         is_tester = await is_tester_phone(submission.user_id)
         
         # 1. Save Submission in Sub-collection
-        sub_ref = user_ref.collection("submissions").document(week_id)
-        sub_doc = await sub_ref.get()
+        old_score = 0
+        old_time = None
+        previous_answers = None
         
-        if sub_doc.exists:
-            if is_tester:
-                # Tester: Allow re-submission by overwriting
-                print(f"[TESTER] {submission.user_id} is re-submitting for week {week_id}")
-                old_score = sub_doc.to_dict().get("score", 0)
-                # First, subtract old score from cumulative
-                await user_ref.update({
-                    "cumulative_score": firestore.Increment(-old_score)
-                })
-            else:
-                raise HTTPException(status_code=400, detail="Already submitted for this week")
-             
-        await sub_ref.set({
+        if is_tester:
+            # Tester: Allow re-submission by overwriting
+            sub_doc = await sub_ref.get()
+            if sub_doc.exists:
+                stored = sub_doc.to_dict()
+                if idempotency_key and stored.get("idempotency_key") == idempotency_key:
+                    return {"score": stored.get("score", 0)}
+                logger.info("Tester re-submitting", extra={"user_id": submission.user_id, "week_id": week_id})
+                old_score = stored.get("score", 0)
+                old_time = stored.get("time_taken", 0)
+                try:
+                    previous_answers = submission_answers(stored, questions)
+                except PackedLayoutMismatch:
+                    # Packed against since-edited questions: its answer counts cannot be subtracted
+                    logger.warning("Replaced submission has a stale answer layout",
+                                   extra={"user_id": submission.user_id, "week_id": week_id})
+                    previous_answers = {}
+        
+        # Submission, score and answer counters are committed together
+        batch = db.batch()
+        submission_doc = {
             "week_id": week_id,
             "score": score,
             "answers": submission.answers,
             "time_taken": submission.time_taken,
-            "submitted_at": firestore.SERVER_TIMESTAMP
-        })
+            "submitted_at": fields.SERVER_TIMESTAMP
+        }
+        if idempotency_key:
+            submission_doc["idempotency_key"] = idempotency_key
+        packed = packed_answer_fields(submission.answers, questions) if COMPACT_ANSWERS else None
+        if packed is not None:
+            del submission_doc["answers"]
+            submission_doc.update(packed)
+        if previous_answers is not None:
+            batch.set(sub_ref, submission_doc)
+        else:
+            # Fails the whole batch if the week was submitted meanwhile, so nothing is counted twice
+            batch.create(sub_ref, submission_doc)
         
-        # 2. Update Cumulative Score (Atomically increment) and mark as submitted
-        await user_ref.update({
-            "cumulative_score": firestore.Increment(score),
-            "submitted": True  # Mark user as having submitted at least once
+        # 2. Update Cumulative Score (Atomically increment, net of a replaced tester submission), mark as submitted
+        #    and record the week in the player's summary (field-level, see analytics.py)
+        user_data = user_doc.to_dict()
+        batch.update(user_ref, {
+            "cumulative_score": fields.Increment(score - old_score),
+            "submitted": True,  # Mark user as having submitted at least once
+            **user_stats_fields(week_id, score, submission.time_taken,
+                                (old_score, old_time) if previous_answers is not None else None)
         })
         
-        # Invalidate caches
-        leaderboard_cache = {} 
+        # 3. Per-question answer counters (see analytics.py)
+        batch.set(db.collection(ANSWER_STATS_COLLECTION).document(random_shard_id(week_id)),
+                  answer_stats_delta(week_id, questions, submission.answers, previous_answers), merge=True)
+        
+        # 4. Score / time histograms for the week and overall (cumulative score per player)
+        cumulative = user_data.get("cumulative_score", 0)
+        time_change = (old_time, submission.time_taken)
+        score_stats_ref = db.collection(SCORE_STATS_COLLECTION)
+        batch.set(score_stats_ref.document(random_shard_id(week_id, SCORE_STATS_SHARDS)),
+                  score_stats_delta(week_id, (old_score if previous_answers is not None else None, score), time_change),
+                  merge=True)
+        batch.set(score_stats_ref.document(random_shard_id(OVERALL_SCOPE, SCORE_STATS_SHARDS)),
+                  score_stats_delta(OVERALL_SCOPE, (cumulative if user_data.get("submitted") else None,
+                                                   cumulative - old_score + score), time_change),
+                  merge=True)
+        try:
+            await batch.commit()
+        except exceptions.AlreadyExists:
+            # Already submitted, or a retry racing the first attempt (e.g. on another instance)
+            replay = await replay_submission(sub_ref, idempotency_key)
+            if replay is not None:
+                return replay
+            raise HTTPException(status_code=400, detail="Already submitted for this week")
+        
+        # Invalidate caches (expired entries are kept as a fallback while storage is down)
+        expire_cache(leaderboard_cache)
+        user_stats_cache.pop(submission.user_id, None)
         
+    except HTTPException:
+        raise
     except Exception as e:
-        print(f"Submit Error: {e}")
-        raise HTTPException(status_code=500, detail=str(e))
+        logger.exception("Submit failed", extra={"user_id": submission.user_id, "week_id": submission.week_id})
+        # A 503 is safe to retry: a resent Idempotency-Key is answered from the stored submission
+        raise request_error(e)
     
     return {"score": score}
 
 @app.get("/api/leaderboard")
-async def get_leaderboard(type: str = "weekly", week_id: Optional[str] = None):
+async def get_leaderboard(type: str = "weekly", week_id: Optional[str] = None, response: Response = None):
     """
     type: 'weekly' or 'overall'
     week_id: required if type is 'weekly', defaults to current if missing
     """
-    global leaderboard_cache
-    
-    target_week = week_id if week_id else await get_active_week_id()
+    target_week = week_id if week_id else await get_latest_week_id()
     cache_key = f"{type}_{target_week}" if type == 'weekly' else "overall"
     
     # Cache Check
@@ -281,19 +927,72 @@ async def get_leaderboard(type: str = "weekly", week_id: Optional[str] = None):
     if cache_key in leaderboard_cache:
         data, ts = leaderboard_cache[cache_key]
         if current_time - ts < CACHE_TTL:
+            metrics.record_cache("leaderboard", True)
             return data
+    metrics.record_cache("leaderboard", False)
 
+    # Concurrent misses for the same board share one rebuild; distinct rebuilds are capped
+    if cache_key not in leaderboard_rebuilds and len(leaderboard_rebuilds) >= LEADERBOARD_MAX_REBUILDS:
+        if cache_key in leaderboard_cache:
+            return stale_entry(leaderboard_cache, cache_key, "leaderboard", response)
+        metrics.RATE_LIMITED.inc("/api/leaderboard")
+        raise HTTPException(status_code=429, detail="Leaderboard is busy, please retry", headers={"Retry-After": "1"})
+    try:
+        return await single_flight(leaderboard_rebuilds, cache_key, lambda: build_leaderboard(type, target_week, cache_key))
+    except HTTPException:
+        raise
+    except Exception as e:
+        return serve_stale(leaderboard_cache, cache_key, "leaderboard", response, e)
+
+def decode_overall_entry(doc):
+    """Overall board entry from a user document; avg time comes from the player summary when there is one"""
+    u = doc.to_dict()
+    entry = {"name": u.get("name", "Unknown"), "score": u.get("cumulative_score", 0), "avg_time": 0,
+             "weeks_played": 0, "week_id": "All-Time"}
+    stats = u.get(USER_STATS_FIELD) or {}
+    if stats.get("weeks_played"):
+        entry["weeks_played"] = stats["weeks_played"]
+        entry["avg_time"] = round(stats.get("time_sum", 0) / entry["weeks_played"])
+    elif u.get("submitted"):
+        return entry, entry["score"], None  # Summary not backfilled yet: complete_overall_entry reads submissions
+    return entry, entry["score"], entry["avg_time"]
+
+async def complete_overall_entry(doc, entry) -> int:
+    """Average time over the user's submissions (only for users who can still make the board)"""
+    total_time = 0
+    weeks_count = 0
+    async for sub in doc.reference.collection("submissions").select(["time_taken"]).stream():
+        total_time += sub.to_dict().get("time_taken", 0)
+        weeks_count += 1
+    entry["weeks_played"] = weeks_count
+    entry["avg_time"] = round(total_time / weeks_count) if weeks_count > 0 else 0
+    return entry["avg_time"]
+
+def decode_legacy_weekly_entry(doc, week_id: str):
+    u = doc.to_dict()
+    entry = {
+        "user_id": doc.id,
+        "name": u.get("name", "Unknown"),
+        "score": u.get("score", 0),
+        "time_taken": u.get("time_taken", 0),
+        "week_id": week_id
+    }
+    return entry, entry["score"], u.get("time_taken", float('inf'))
+
+async def build_leaderboard(type: str, target_week: str, cache_key: str) -> List[Dict[str, Any]]:
+    """Reads and ranks a leaderboard and stores it in leaderboard_cache"""
+    current_time = time.time()
     try:
         users_list = []
         
         if type == "overall":
             # Try new structure (cumulative_score) first
-            users_ref = db.collection("users").order_by("cumulative_score", direction=firestore.Query.DESCENDING)
-            docs = [doc async for doc in users_ref.stream()]
+            users_ref = db.collection("users").order_by("cumulative_score", direction=fields.DESCENDING)
+            top_user = [doc async for doc in users_ref.limit(1).stream()]
 
-            # Fallback: If no cumulative_score data, use old 'score' field
-            if len(docs) == 0 or all(d.to_dict().get("cumulative_score", 0) == 0 for d in docs):
-                users_ref = db.collection("users").where("submitted", "==", True).order_by("score", direction=firestore.Query.DESCENDING).limit(50)
+            # Fallback: If no cumulative_score data, use old 'score' field (the top score is 0 when none is set)
+            if not top_user or top_user[0].to_dict().get("cumulative_score", 0) == 0:
+                users_ref = db.collection("users").where("submitted", "==", True).order_by("score", direction=fields.DESCENDING).limit(LEADERBOARD_SIZE)
                 docs = [doc async for doc in users_ref.stream()]
                 for doc in docs:
                     u = doc.to_dict()
@@ -306,34 +1005,13 @@ async def get_leaderboard(type: str = "weekly", week_id: Optional[str] = None):
                         "week_id": "All-Time"
                     })
             else:
-                # New structure: Calculate avg time from submissions
-                for doc in docs:
-                    u = doc.to_dict()
-                    
-                    # Fetch user's submissions to calculate average time
-                    submissions = [sub async for sub in doc.reference.collection("submissions").stream()]
-                    total_time = 0
-                    weeks_count = len(submissions)
-                    
-                    for sub in submissions:
-                        s_data = sub.to_dict()
-                        total_time += s_data.get("time_taken", 0)
-                    
-                    avg_time = round(total_time / weeks_count) if weeks_count > 0 else 0
-                    
-                    users_list.append({
-                        "name": u.get("name", "Unknown"),
-                        "score": u.get("cumulative_score", 0),
-                        "avg_time": avg_time,
-                        "weeks_played": weeks_count,
-                        "week_id": "All-Time"
-                    })
-                
-                # Sort by score DESC, then avg_time ASC (tiebreaker)
-                users_list.sort(key=lambda x: (-x["score"], x["avg_time"]))
+                # New structure: streamed top K by score DESC, then avg_time ASC (tiebreaker).
+                # The stream is ordered by score, so it stops at the first score below the board.
+                users_list = await stream_top_k(users_ref.stream(), decode_overall_entry, ordered=True,
+                                                complete=complete_overall_entry)
         else:
             # Weekly Leaderboard - Try new submissions structure first
-            submissions_query = db.collection_group("submissions").where("week_id", "==", target_week).order_by("score", direction=firestore.Query.DESCENDING).order_by("time_taken", direction=firestore.Query.ASCENDING).limit(50)
+            submissions_query = db.collection_group("submissions").where("week_id", "==", target_week).order_by("score", direction=fields.DESCENDING).order_by("time_taken", direction=fields.ASCENDING).limit(LEADERBOARD_SIZE)
             
             subs = [sub async for sub in submissions_query.stream()]
             
@@ -364,20 +1042,9 @@ async def get_leaderboard(type: str = "weekly", week_id: Optional[str] = None):
                 # FALLBACK: Old structure - query users directly (pre-migration data)
                 # Filter by week_id stored directly on user doc (old format)
                 users_ref = db.collection("users").where("submitted", "==", True).where("week_id", "==", target_week)
-                docs = [doc async for doc in users_ref.stream()]
                 
-                # Sort by score DESC, time_taken ASC
-                sorted_docs = sorted(docs, key=lambda d: (-d.to_dict().get("score", 0), d.to_dict().get("time_taken", float('inf'))))
-                
-                for doc in sorted_docs[:50]:
-                    u = doc.to_dict()
-                    users_list.append({
-                        "user_id": doc.id,
-                        "name": u.get("name", "Unknown"),
-                        "score": u.get("score", 0),
-                        "time_taken": u.get("time_taken", 0),
-                        "week_id": target_week
-                    })
+                # Top K by score DESC, time_taken ASC, without holding every match
+                users_list = await stream_top_k(users_ref.stream(), lambda doc: decode_legacy_weekly_entry(doc, target_week))
 
         # Rank
         for i, u in enumerate(users_list):
@@ -387,75 +1054,115 @@ async def get_leaderboard(type: str = "weekly", week_id: Optional[str] = None):
         return users_list
         
     except Exception as e:
-        print(f"LB Error: {e}")
-        raise HTTPException(status_code=500, detail=str(e))
+        if storage_unavailable(e):
+            raise  # get_leaderboard falls back to the last good copy
+        logger.exception("Leaderboard failed", extra={"leaderboard_type": type, "week_id": target_week})
+        raise request_error(e)
+
+
+@app.get("/api/users/{user_id}/stats")
+async def get_user_stats(user_id: str, response: Response = None):
+    """A player's weekly history, streaks and personal best, from the summary kept on their user document"""
+    current_time = time.time()
+    entry = user_stats_cache.get(user_id)
+    if entry and current_time - entry[1] < CACHE_TTL:
+        metrics.record_cache("user_stats", True)
+        user_stats_cache[user_id] = user_stats_cache.pop(user_id)  # Most recently used
+        entry = entry[0]
+    else:
+        metrics.record_cache("user_stats", False)
+        try:
+            user_doc = await db.collection("users").document(user_id).get()
+        except Exception as e:
+            entry = serve_stale(user_stats_cache, user_id, "user_stats", response, e)
+        else:
+            if not user_doc.exists:
+                raise HTTPException(status_code=404, detail="User not found")
+            user_data = user_doc.to_dict()
+            entry = {"name": user_data.get("name", "Unknown"), "stats": user_data.get(USER_STATS_FIELD)}
+            remember_user_stats(user_id, entry)
+
+    return {"user_id": user_id, "name": entry["name"], **user_stats_view(entry["stats"], get_current_iso_week())}
 
+@app.get("/api/stats/distribution")
+async def get_score_distribution(type: Literal["weekly", "overall"] = "weekly", week_id: Optional[str] = None,
+                                 score: Optional[int] = None):
+    """
+    Score and time-taken distribution from the score_stats histograms (no submissions scan).
+    With `score`, also returns the percentage of players with a lower score.
+    """
+    scope = OVERALL_SCOPE if type == "overall" else (week_id or await get_latest_week_id())
+    current_time = time.time()
+    cached = distribution_cache.get(scope)
+    if cached and current_time - cached[1] < CACHE_TTL:
+        metrics.record_cache("distribution", True)
+        totals = cached[0]
+    else:
+        metrics.record_cache("distribution", False)
+        try:
+            totals = merge_score_shards([doc.to_dict() async for doc in
+                                         db.collection(SCORE_STATS_COLLECTION).where("scope", "==", scope).stream()])
+        except Exception as e:
+            raise request_error(e)
+        distribution_cache[scope] = (totals, current_time)
+    return {"type": type, "scope": scope, **score_distribution(totals, score)}
 
 @app.get("/api/admin/weeks")
 async def get_weeks():
-    # Return list of weeks + metadata
-    # Also generate next 4 weeks for UI convenience
-    
-    current = get_current_iso_week()
+    """Current ISO week, 2 weeks back and 4 forward, with their windows from the week timeline"""
+    await ensure_week_timeline()
+    now = get_current_utc_time()
+    current = iso_week_id(now)
+    active = week_timeline.active_week(now)
+
     weeks = []
-    
-    # TODO: Fetch from 'weeks' collection to get overrides
-    # For now, generate basic list centered on current
-    
-    # Simple logic: just string maniupulation for now or fetch existing from questions?
-    # Better: List all weeks that have Questions created OR are in 'weeks' collection
-    
-    # 1. Get distinct weeks from Questions? (No distinct in firestore)
-    # 2. Just return current +/- 4 weeks
-    
-    now = datetime.now()
-    year, week, _ = now.isocalendar()
-    
-    for i in range(-2, 5): # 2 weeks back, 4 weeks forward
-        # Logic to calculate week string
-        # Simplified:
-        w = week + i
-        y = year
-        if w > 52:
-            w -= 52
-            y += 1
-        elif w < 1:
-            w += 52
-            y -= 1
-            
-        wid = f"{y}-W{w:02d}"
-        weeks.append({"week_id": wid, "is_current": (wid == current)})
-        
+    for i in range(-2, 5):
+        window = week_timeline.window(week_offset(current, i))
+        weeks.append({
+            "week_id": window.week_id,
+            "is_current": window.week_id == current,
+            "is_open": window.week_id == active,
+            "is_active": window.is_active,
+            "configured": window.configured,
+            "start_time": window.start,
+            "end_time": window.end
+        })
     return weeks
 
+@app.post("/api/admin/weeks")
+async def update_week(config: WeekConfig):
+    """Create or update a week's window; the scheduler picks it up immediately"""
+    if config.start_time and config.end_time and config.end_time <= config.start_time:
+        raise HTTPException(status_code=400, detail="end_time must be after start_time")
+    settings = config.model_dump(exclude_none=True)
+    try:
+        await db.collection("weeks").document(config.week_id).set(settings)
+    except Exception as e:
+        raise request_error(e)
+    week_timeline.set_week(settings)
+    week_scheduler.wake()
+    window = week_timeline.window(config.week_id)
+    return {"status": "success", "week_id": config.week_id, "start_time": window.start, "end_time": window.end}
+
 # --- ADMIN Q MANAGEMENT ---
 
 @app.post("/api/admin/questions")
 async def add_question(question: QuestionCreate):
     try:
-        await db.collection("questions").document(question.id).set({
-            "text": question.text,
-            "options": question.options,
-            "correct_answer": question.answer,
-            "order": question.order,
-            "week_id": question.week_id
-        })
+        await db.collection("questions").document(question.id).set(question_to_doc(question))
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+        raise request_error(e)
+    questions_cache.pop(question.week_id, None)
     return {"status": "created"}
 
 @app.get("/api/admin/questions-full")
 async def get_questions_full(week_id: Optional[str] = None):
     target_week = week_id if week_id else await get_active_week_id()
     
-    questions_ref = db.collection("questions").where("week_id", "==", target_week).order_by("order")
-    docs = [doc async for doc in questions_ref.stream()]
-    
     full_questions = []
-    for doc in docs:
-        q = doc.to_dict()
+    for q in await get_week_questions(target_week):
         full_questions.append({
-            "id": doc.id,
+            "id": q["id"],
             "text": q["text"],
             "options": q["options"],
             "correct_answer": q["correct_answer"],
@@ -464,17 +1171,22 @@ async def get_questions_full(week_id: Optional[str] = None):
     return full_questions
 
 @app.get("/api/config")
-async def get_config():
+async def get_config(response: Response = None):
     """Get quiz configuration from Firestore"""
     try:
-        doc = await db.collection("config").document("quiz_settings").get()
-        if doc.exists:
-            data = doc.to_dict()
+        try:
+            data = await get_quiz_settings()
+        except Exception as e:
+            data = serve_stale(config_cache, "quiz_settings", "config", response, e)
+        if data:
+            data = dict(data)
             # Ensure tester_phones is always present
             if "tester_phones" not in data:
                 data["tester_phones"] = []
             return data
         return {"timer_duration_minutes": 10, "quiz_active": True, "leaderboard_active": False, "tester_phones": []}
+    except HTTPException:
+        raise  # Storage unavailable and nothing cached: 503 like the other read endpoints
     except Exception as e:
         return {"timer_duration_minutes": 10, "quiz_active": True, "leaderboard_active": False, "tester_phones": []}
 
@@ -482,21 +1194,86 @@ async def get_config():
 async def update_config(config: QuizConfig):
     """Update quiz configuration in Firestore"""
     try:
-        await db.collection("config").document("quiz_settings").set({
+        settings = {
             "timer_duration_minutes": config.timer_duration_minutes,
             "quiz_active": config.quiz_active,
             "leaderboard_active": config.leaderboard_active,
             "tester_phones": config.tester_phones
-        })
+        }
+        await db.collection("config").document("quiz_settings").set(settings)
+        config_cache["quiz_settings"] = (settings, time.time())
         return {"status": "success"}
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+        raise request_error(e)
 
 @app.delete("/api/admin/questions/{question_id}")
 async def delete_question(question_id: str):
     await db.collection("questions").document(question_id).delete()
+    # The question's week is unknown here without an extra read
+    questions_cache.clear()
     return {"status": "deleted"}
 
+@app.get("/api/admin/db-ops")
+async def get_db_ops():
+    """Storage operations per endpoint since startup: totals and per-request averages"""
+    result = {}
+    for endpoint, totals in sorted(endpoint_db_ops.items()):
+        requests = totals["requests"]
+        result[endpoint] = {
+            **totals,
+            "avg_reads": round(totals.get("reads", 0) / requests, 2),
+            "avg_writes": round(totals.get("writes", 0) / requests, 2),
+            "avg_queries": round(totals.get("queries", 0) / requests, 2),
+            "avg_docs": round(totals.get("docs", 0) / requests, 2)
+        }
+    return result
+
+@app.get("/metrics")
+async def get_metrics():
+    """Prometheus text exposition of request, cache, storage and Gemini metrics"""
+    return Response(content=metrics.render_latest(), media_type=metrics.CONTENT_TYPE_LATEST)
+
+# --- PROFILING (admin diagnostics, see profiler.py) ---
+
+def check_profiler_token(token: Optional[str]):
+    if not PROFILER_TOKEN:
+        raise HTTPException(status_code=404, detail="Profiler disabled (set PROFILER_TOKEN)")
+    if token != PROFILER_TOKEN:
+        raise HTTPException(status_code=403, detail="Invalid admin token")
+
+@app.post("/api/admin/profile/start")
+async def start_profile(seconds: float = Query(default=30, gt=0, le=MAX_WINDOW_SECONDS), interval_ms: float = Query(default=DEFAULT_INTERVAL * 1000, ge=1, le=100), x_admin_token: Optional[str] = Header(default=None)):
+    """Samples the event loop for `seconds` (or until /stop); fetch the result from /api/admin/profiles/{id}"""
+    check_profiler_token(x_admin_token)
+    profile = profiler.start(f"window {seconds}s", interval=interval_ms / 1000)
+    asyncio.get_running_loop().call_later(seconds, profiler.stop, profile.id)
+    return {"id": profile.id, "seconds": seconds}
+
+@app.post("/api/admin/profile/stop")
+async def stop_profile(profile_id: str, x_admin_token: Optional[str] = Header(default=None)):
+    check_profiler_token(x_admin_token)
+    profile = profiler.stop(profile_id)
+    if profile is None:
+        raise HTTPException(status_code=404, detail="No active profile with this id")
+    return profile.summary()
+
+@app.get("/api/admin/profiles")
+async def list_profiles(x_admin_token: Optional[str] = Header(default=None)):
+    check_profiler_token(x_admin_token)
+    return {
+        "active": [{"id": p.id, "label": p.label, "samples": p.samples} for p in profiler.active()],
+        "completed": [p.summary() for p in reversed(profiler.completed)]
+    }
+
+@app.get("/api/admin/profiles/{profile_id}")
+async def get_profile(profile_id: str, x_admin_token: Optional[str] = Header(default=None)):
+    """Collapsed stacks (flamegraph.pl / speedscope compatible)"""
+    check_profiler_token(x_admin_token)
+    profile = profiler.get(profile_id)
+    if profile is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return PlainTextResponse(profile.folded(), headers={"Content-Disposition": f'attachment; filename="{profile.id}.folded"'})
+
 @app.get("/api/admin/submission/{user_id}")
 async def get_user_submission(user_id: str, week_id: str):
     """Fetch a specific user's submission details for a given week"""
@@ -508,54 +1285,261 @@ async def get_user_submission(user_id: str, week_id: str):
             raise HTTPException(status_code=404, detail="Submission not found")
         
         data = sub_doc.to_dict()
+        answers = data.get("answers", {})
+        if PACKED_ANSWERS_FIELD in data:
+            try:
+                answers = submission_answers(data, await get_week_questions(week_id))
+            except PackedLayoutMismatch as e:
+                raise HTTPException(status_code=409, detail=str(e))
         return {
             "user_id": user_id,
             "week_id": week_id,
             "score": data.get("score", 0),
             "time_taken": data.get("time_taken", 0),
-            "answers": data.get("answers", {})
+            "answers": answers
         }
     except HTTPException:
         raise
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+        raise request_error(e)
+
+@app.get("/api/admin/answer-stats/{week_id}")
+async def get_answer_stats(week_id: str):
+    """Per-question answer distribution of a week, summed from the sharded counters (one query)"""
+    try:
+        shards = [doc.to_dict() async for doc in
+                  db.collection(ANSWER_STATS_COLLECTION).where("week_id", "==", week_id).stream()]
+        participants, counts = merge_answer_shards(shards)
+        questions = await get_week_questions(week_id)
+        return {
+            "week_id": week_id,
+            "participants": participants,
+            "questions": answer_distribution(questions, participants, counts)
+        }
+    except Exception as e:
+        raise request_error(e)
+
+@app.post("/api/admin/regrade/{week_id}")
+async def regrade_week(week_id: str, dry_run: bool = True):
+    """
+    Re-scores every submission of a week against the current answer key (after a
+    correct_answer fix). Submissions are streamed into a compact answer matrix and
+    scored column by column (see grading.py); only changed scores and the matching
+    cumulative_score deltas are written, in chunked batches, without reading users.
+    dry_run=True (default) reports what would change without writing.
+    Players' cumulative scores, summaries and the overall histogram move with them;
+    the overall moves are computed afterwards from one batched read of the players'
+    new cumulative scores. Players whose user document is missing are skipped and
+    reported (only known when writing).
+    """
+    started = time.perf_counter()
+    questions_cache.pop(week_id, None)  # Grade against the stored key
+    questions = await get_week_questions(week_id)
+    if not questions:
+        raise HTTPException(status_code=404, detail=f"No questions for week {week_id}")
+
+    missing_users = []
+    try:
+        matrix = AnswerMatrix(questions)
+        refs = []
+        old_scores = []
+        times = []
+        layout_mismatches = []  # Packed against since-edited questions: cannot be regraded
+        query = db.collection_group("submissions").where("week_id", "==", week_id).select(["answers", *PACKED_FIELDS, "score", "time_taken"])
+        async for sub_doc in query.stream():
+            user_ref = sub_doc.reference.parent.parent
+            if user_ref is None or user_ref.parent.id != "users":
+                continue
+            data = sub_doc.to_dict()
+            try:
+                matrix.append_submission(data)
+            except PackedLayoutMismatch:
+                layout_mismatches.append(sub_doc.reference.parent.parent.id)
+                continue
+            refs.append(sub_doc.reference)
+            old_scores.append(data.get("score", 0))
+            times.append(data.get("time_taken", 0))
+        new_scores = matrix.scores(answer_key_indices(questions))
+        changed = [(sub_ref, old, new, t) for sub_ref, old, new, t in zip(refs, old_scores, new_scores, times) if old != new]
+        moves = [(old, new) for _, old, new, _ in changed]
+
+        # Blind writes: the score, and the user's cumulative score and summary (field-level, see analytics.py)
+        writes = []
+        for sub_ref, old_score, new_score, time_taken in changed:
+            writes.append(("update", sub_ref, {"score": new_score}))
+            writes.append(("update", sub_ref.parent.parent, {
+                "cumulative_score": fields.Increment(new_score - old_score),
+                **user_stats_fields(week_id, new_score, time_taken, (old_score, time_taken))
+            }))
+        if moves:
+            writes.append(("merge", db.collection(SCORE_STATS_COLLECTION).document(random_shard_id(week_id, SCORE_STATS_SHARDS)),
+                           score_moves_delta(week_id, moves)))
+
+        if moves and not dry_run:
+            missing_refs = []
+            await commit_writes(writes, missing=missing_refs)
+            missing_users = [ref.id for ref in missing_refs]
+            await move_overall_scores(changed, set(missing_users))
+            for sub_ref, _, _, _ in changed:
+                user_stats_cache.pop(sub_ref.parent.parent.id, None)
+            expire_cache(leaderboard_cache)
+            distribution_cache.clear()
+        if layout_mismatches:
+            logger.warning("Regrade skipped %d submissions packed against other questions", len(layout_mismatches),
+                           extra={"week_id": week_id, "user_ids": layout_mismatches[:20]})
+        if missing_users:
+            logger.warning("Regrade skipped %d players without a user document", len(missing_users),
+                           extra={"week_id": week_id, "user_ids": missing_users[:20]})
+    except Exception as e:
+        logger.exception("Regrade failed", extra={"week_id": week_id})
+        raise request_error(e)
+
+    elapsed = time.perf_counter() - started
+    result = {
+        "week_id": week_id,
+        "dry_run": dry_run,
+        "submissions": len(refs),
+        "changed": len(moves),
+        "missing_users": missing_users,
+        "layout_mismatches": layout_mismatches,
+        "points_added": sum(new - old for old, new in moves if new > old),
+        "points_removed": sum(old - new for old, new in moves if new < old),
+        "elapsed_seconds": round(elapsed, 3)
+    }
+    logger.info("Regraded week %s", week_id, extra=result)
+    return result
+
+async def move_overall_scores(changed: List[tuple], missing_users: set):
+    """
+    Moves regraded players in the overall histogram. Their cumulative scores were
+    incremented blindly, so the old ones are the new ones (read in batches) minus the delta.
+    """
+    deltas = {}
+    for sub_ref, old_score, new_score, _ in changed:
+        if sub_ref.parent.parent.id not in missing_users:
+            deltas[sub_ref.parent.parent.id] = (sub_ref.parent.parent, new_score - old_score)
+    users = list(deltas.values())
+    semaphore = asyncio.Semaphore(BATCH_COMMIT_CONCURRENCY)
+
+    async def read_chunk(chunk):
+        async with semaphore:
+            return [(snapshot.id, snapshot.to_dict().get("cumulative_score", 0))
+                    async for snapshot in db.get_all([ref for ref, _ in chunk], field_paths=["cumulative_score"])
+                    if snapshot.exists]
+    chunks = [users[i:i + FIRESTORE_BATCH_LIMIT] for i in range(0, len(users), FIRESTORE_BATCH_LIMIT)]
+    overall_moves = []
+    for results in await asyncio.gather(*(read_chunk(chunk) for chunk in chunks)):
+        for user_id, cumulative in results:
+            overall_moves.append((cumulative - deltas[user_id][1], cumulative))
+    if overall_moves:
+        await db.collection(SCORE_STATS_COLLECTION).document(random_shard_id(OVERALL_SCOPE, SCORE_STATS_SHARDS)).set(
+            score_moves_delta(OVERALL_SCOPE, overall_moves), merge=True)
 
 @app.post("/api/admin/generate-questions")
-async def generate_question(week_id: str):
+async def generate_question(week_id: str, commit: bool = False, count: Optional[int] = Query(default=None, ge=1)):
+    """
+    Generates questions with Gemini.
+    commit=False: returns the raw AI question sets for preview (admin picks and saves them).
+    commit=True: normalises the AI output and saves the first `count` valid questions for the week.
+    """
     current_iso_week_id = get_current_iso_week()
 
     if current_iso_week_id > week_id:
-        print(f"Trying to generate questions for past week ({week_id}). Current is {current_iso_week_id}")
+        logger.warning("Refusing to generate questions for past week %s (current is %s)", week_id, current_iso_week_id)
         raise HTTPException(status_code=403, detail="Cannot generate questions for past weeks")
 
-    return await generate_questions_by_ai()
+    started = time.perf_counter()
+    try:
+        question_sets = await generate_questions_by_ai()
+    except Exception:
+        metrics.GEMINI_LATENCY.observe("error", value=time.perf_counter() - started)
+        raise
+    metrics.GEMINI_LATENCY.observe("success", value=time.perf_counter() - started)
+    if not commit:
+        return question_sets
+
+    questions, rejected = normalize_ai_questions(question_sets, week_id, limit=count)
+    if not questions:
+        raise HTTPException(status_code=422, detail={"message": "No valid questions generated", "rejected": rejected})
+
+    try:
+        await save_questions_batch(questions)
+    except Exception as e:
+        raise request_error(e)
+
+    return {
+        "status": "success",
+        "week_id": week_id,
+        "questions": [q.model_dump() for q in questions],
+        "answer_key": {q.id: q.answer for q in questions},
+        "rejected": rejected
+    }
 
 @app.post("/api/admin/questions/batch")
 async def add_questions_batch(question_batch: QuestionBatchCreate):
-    batch = db.batch()
+    if not question_batch.questions:
+        raise HTTPException(status_code=400, detail="No questions provided")
     try:
-        question_week_id = question_batch.questions[0].week_id
-        print(f"Checking and deleting existing questions of week {question_week_id}")
-        
-        # Firestore batch.delete() doesn't support queries. 
-        # We must fetch the document references first.
-        existing_qs = [doc async for doc in db.collection("questions").where("week_id", "==", question_week_id).stream()]
-        for doc in existing_qs:
-            batch.delete(doc.reference)
-
-        print(f"Adding new questions to week {question_week_id}")
-        for question in question_batch.questions:
-            batch.set(db.collection("questions").document(question.id), {
-                "text": question.text,
-                "options": question.options,
-                "correct_answer": question.answer,
-                "order": question.order,
-                "week_id": question.week_id
-            })
-        await batch.commit()
-        return {"status": "success"}
+        return await save_questions_batch(question_batch.questions)
+    except Exception as e:
+        logger.exception("Batch question save failed", extra={"count": len(question_batch.questions)})
+        raise request_error(e)
+
+@app.post("/api/admin/questions/import")
+async def import_questions(request: Request, format: Literal["csv", "jsonl"] = "csv", dry_run: bool = False):
+    """
+    Bulk upserts questions for any number of weeks from a CSV or JSONL request body.
+    Rows are validated as they stream in; valid rows are written in chunked concurrent
+    batches, invalid rows are reported with their line number. Existing questions not
+    present in the file are left untouched.
+    """
+    flush_size = FIRESTORE_BATCH_LIMIT * BATCH_COMMIT_CONCURRENCY
+    pending = []
+    seen_ids = set()
+    weeks = set()
+    errors = []
+    stats = {"rows": 0, "imported": 0, "invalid": 0}
+
+    try:
+        async for line_no, row in iter_import_rows(request, format):
+            stats["rows"] += 1
+            try:
+                if isinstance(row, Exception):
+                    raise row
+                question = parse_import_row(row)
+                if question.id in seen_ids:
+                    raise ValueError(f"Duplicate id '{question.id}'")
+            except (ValidationError, ValueError) as e:
+                stats["invalid"] += 1
+                if len(errors) < IMPORT_MAX_ERRORS:
+                    errors.append({"line": line_no, "error": str(e)})
+                continue
+
+            seen_ids.add(question.id)
+            weeks.add(question.week_id)
+            pending.append(("set", db.collection("questions").document(question.id), question_to_doc(question)))
+            if len(pending) >= flush_size:
+                if not dry_run:
+                    await commit_writes(pending)
+                stats["imported"] += len(pending)
+                pending = []
+
+        if not dry_run:
+            await commit_writes(pending)
+        stats["imported"] += len(pending)
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+        logger.exception("Question import failed", extra=stats)
+        raise request_error(e, {"message": str(e), **stats})
+    finally:
+        for week_id in weeks:
+            questions_cache.pop(week_id, None)
+
+    return {
+        "status": "dry_run" if dry_run else "success",
+        **stats,
+        "weeks": sorted(weeks),
+        "errors": errors
+    }
 
 
 # CORS
@@ -567,10 +1551,20 @@ origins = [
     "https://united89-club.web.app"
 ]
 
+# Inside CORS, so 429 responses still carry CORS headers
+app.add_middleware(RateLimitMiddleware, on_reject=lambda route: metrics.RATE_LIMITED.inc(route))
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=origins,
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["Retry-After"],
 )
+
+app.add_middleware(ProfilingMiddleware)
+app.add_middleware(RequestContextMiddleware)
+
+# Outermost, so it times everything including the other middleware
+app.add_middleware(metrics.MetricsMiddleware)
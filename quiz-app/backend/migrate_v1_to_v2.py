@@ -5,97 +5,251 @@ This script migrates existing user data to the new weekly structure.
 It is NON-DESTRUCTIVE: original data is preserved, new fields are added.
 
 Usage:
-    python migrate_v1_to_v2.py --backup          # Export current data to JSON
+    python migrate_v1_to_v2.py --backup          # Export current data to gzipped JSONL
+    python migrate_v1_to_v2.py --restore FILE    # Restore a backup (dry run by default)
     python migrate_v1_to_v2.py --migrate         # Run migration (dry run by default)
-    python migrate_v1_to_v2.py --migrate --execute  # Actually execute migration
+    python migrate_v1_to_v2.py --migrate --execute  # Actually execute migration (resumes from checkpoint)
     python migrate_v1_to_v2.py --validate        # Validate migration was successful
 
 Safety Features:
-    - Backup creates a timestamped JSON file of all user data
+    - Backup creates a timestamped .jsonl.gz file of all user data
     - Dry run mode shows what would change without making changes
     - Validation confirms all users have been migrated correctly
+    - Executed migrations checkpoint the last processed user id and resume after a crash
     - Original fields (score, answers, etc.) are NEVER deleted
 """
 
-import firebase_admin
-from firebase_admin import credentials, firestore
+from firebase_admin import firestore
 from dotenv import load_dotenv
+from storage import create_client, fields
 import os
 import json
+import gzip
+import time
+import base64
 import argparse
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 
 load_dotenv()
 
-# Initialize Firebase (Standalone script)
-try:
-    if not firebase_admin._apps:
-        cred_path = os.getenv("GOOGLE_APPLICATION_CREDENTIALS")
-        if cred_path:
-            cred = credentials.Certificate(cred_path)
-            firebase_admin.initialize_app(cred)
-        else:
-            firebase_admin.initialize_app()
-except Exception as e:
-    print(f"❌ Failed to initialize Firebase: {e}")
-    exit(1)
-
+# Initialize Firestore Client (or a local stand-in, see storage/__init__.py)
 DB_NAME = os.getenv("DB_NAME")
-db = firestore.Client(database=DB_NAME)
+db = create_client(use_async=False)
 
 # Configuration
 LEGACY_WEEK_ID = "2025-W51"  # The week ID for existing data (Week 52 of 2025)
+CHECKPOINT_FILE = f"migration_checkpoint_{DB_NAME or 'default'}.json"  # Overridden by --checkpoint
+CHECKPOINT_EVERY = 500  # Users between flush + checkpoint
+MAX_WRITE_ATTEMPTS = 5  # BulkWriter retries per failed write
+BACKUP_COLLECTIONS = ["users", "questions", "weeks", "config"]
+BACKUP_FETCH_WORKERS = 8  # Concurrent submissions subcollection reads during backup
+RESTORE_FLUSH_EVERY = 2000  # Documents buffered in the BulkWriter before a flush
+
+
+def load_checkpoint():
+    """Returns the saved checkpoint dict, or None if there is nothing to resume."""
+    if not os.path.exists(CHECKPOINT_FILE):
+        return None
+    with open(CHECKPOINT_FILE) as f:
+        return json.load(f)
+
+
+def save_checkpoint(last_user_id, stats):
+    """Atomically records the last user whose writes have been flushed."""
+    tmp_file = CHECKPOINT_FILE + ".tmp"
+    with open(tmp_file, "w") as f:
+        json.dump({
+            "last_user_id": last_user_id,
+            "legacy_week_id": LEGACY_WEEK_ID,
+            "stats": stats,
+            "saved_at": datetime.now().isoformat()
+        }, f)
+    os.replace(tmp_file, CHECKPOINT_FILE)
+
+
+def clear_checkpoint():
+    if os.path.exists(CHECKPOINT_FILE):
+        os.remove(CHECKPOINT_FILE)
+
+
+def create_bulk_writer(failures):
+    """BulkWriter that retries failed writes a few times and collects the ones that give up."""
+    writer = db.bulk_writer()
+
+    def on_error(error, _writer):
+        if error.attempts < MAX_WRITE_ATTEMPTS:
+            return True
+        reference = getattr(error.operation, "reference", None)
+        failures.append(f"{reference.path if reference else error.operation}: {error.message}")
+        return False
+
+    writer.on_write_error(on_error)
+    return writer
+
+
+def encode_value(value):
+    """JSON-safe encoding of Firestore values that round-trips through decode_value."""
+    if isinstance(value, datetime):
+        return {"__type__": "datetime", "value": value.isoformat()}
+    if isinstance(value, bytes):
+        return {"__type__": "bytes", "value": base64.b64encode(value).decode("ascii")}
+    if isinstance(value, firestore.DocumentReference):
+        return {"__type__": "ref", "value": value.path}
+    if isinstance(value, dict):
+        return {k: encode_value(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [encode_value(v) for v in value]
+    return value
+
+
+def decode_value(value):
+    if isinstance(value, dict):
+        kind = value.get("__type__")
+        if kind == "datetime":
+            return datetime.fromisoformat(value["value"])
+        if kind == "bytes":
+            return base64.b64decode(value["value"])
+        if kind == "ref":
+            return db.document(value["value"])
+        return {k: decode_value(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [decode_value(v) for v in value]
+    return value
+
+
+def write_record(f, doc):
+    f.write(json.dumps({"path": doc.reference.path, "data": encode_value(doc.to_dict())}, default=str))
+    f.write("\n")
 
 
 def backup_data():
-    """Export all user and question data to a JSON file for safety."""
+    """
+    Export all users (with submissions), questions, weeks and config to a gzipped JSONL file.
+
+    One record per line: {"path": "users/<id>/submissions/<week>", "data": {...}}, preceded
+    by a {"_meta": {...}} header. Documents are written as they are read and the submissions
+    of up to BACKUP_FETCH_WORKERS users are fetched concurrently, so memory stays constant.
+    """
     print("📦 Starting Backup...")
+    started = time.monotonic()
+    counts = {name: 0 for name in BACKUP_COLLECTIONS}
+    counts["submissions"] = 0
     
-    backup_data = {
-        "backup_timestamp": datetime.now().isoformat(),
-        "database": DB_NAME,
-        "users": [],
-        "questions": []
-    }
-    
-    # Backup Users
-    users_ref = db.collection("users")
-    for doc in users_ref.stream():
-        user_data = doc.to_dict()
-        user_data["_id"] = doc.id
-        
-        # Also backup any existing submissions
-        submissions = []
-        for sub_doc in doc.reference.collection("submissions").stream():
-            sub_data = sub_doc.to_dict()
-            sub_data["_id"] = sub_doc.id
-            submissions.append(sub_data)
-        user_data["_submissions"] = submissions
-        
-        backup_data["users"].append(user_data)
-    
-    # Backup Questions
-    questions_ref = db.collection("questions")
-    for doc in questions_ref.stream():
-        q_data = doc.to_dict()
-        q_data["_id"] = doc.id
-        backup_data["questions"].append(q_data)
-    
-    # Write to file
     timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    filename = f"backup_{DB_NAME}_{timestamp}.json"
-    
-    with open(filename, 'w') as f:
-        json.dump(backup_data, f, indent=2, default=str)
+    filename = f"backup_{DB_NAME}_{timestamp}.jsonl.gz"
+
+    def fetch_submissions(user_ref):
+        return list(user_ref.collection("submissions").stream())
+
+    with gzip.open(filename, "wt", encoding="utf-8") as f, ThreadPoolExecutor(max_workers=BACKUP_FETCH_WORKERS) as pool:
+        f.write(json.dumps({"_meta": {
+            "backup_timestamp": datetime.now().isoformat(),
+            "database": DB_NAME,
+            "format": "jsonl-v2"
+        }}) + "\n")
+
+        # Backup Users: write each user as read, keep a bounded window of in-flight submission reads
+        in_flight = deque()
+
+        def drain(limit):
+            while len(in_flight) > limit:
+                future = in_flight.popleft()
+                for sub_doc in future.result():
+                    write_record(f, sub_doc)
+                    counts["submissions"] += 1
+
+        for doc in db.collection("users").stream():
+            write_record(f, doc)
+            counts["users"] += 1
+            in_flight.append(pool.submit(fetch_submissions, doc.reference))
+            drain(BACKUP_FETCH_WORKERS * 2)
+        drain(0)
+
+        # Backup remaining top-level collections
+        for name in BACKUP_COLLECTIONS[1:]:
+            for doc in db.collection(name).stream():
+                write_record(f, doc)
+                counts[name] += 1
     
+    elapsed = time.monotonic() - started
     print(f"✅ Backup complete!")
-    print(f"   - {len(backup_data['users'])} users backed up")
-    print(f"   - {len(backup_data['questions'])} questions backed up")
+    print(f"   - {counts['users']} users backed up ({counts['submissions']} submissions)")
+    print(f"   - {counts['questions']} questions backed up")
+    print(f"   - {counts['weeks']} weeks, {counts['config']} config documents backed up")
+    print(f"   - Took {elapsed:.1f}s")
     print(f"   - Saved to: {filename}")
     return filename
 
 
-def migrate_v1_to_v2(dry_run=True):
+def restore_data(filename, dry_run=True):
+    """
+    Load a --backup file back into Firestore.
+
+    Streams the gzipped JSONL file and writes each document with a BulkWriter,
+    flushing every RESTORE_FLUSH_EVERY documents so memory stays constant.
+    Documents are overwritten with the backed-up contents; documents not in the
+    backup are left untouched.
+    """
+    mode = "🔍 DRY RUN" if dry_run else "🚀 EXECUTING"
+    print(f"\n{mode}: Restore from {filename}")
+    print("-" * 50)
+
+    counts = {}
+    failures = []
+    writer = None if dry_run else create_bulk_writer(failures)
+    started = time.monotonic()
+    restored = 0
+
+    with gzip.open(filename, "rt", encoding="utf-8") as f:
+        for line_no, line in enumerate(f, start=1):
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            if "_meta" in record:
+                meta = record["_meta"]
+                print(f"   Backup of database {meta.get('database')} taken at {meta.get('backup_timestamp')}")
+                continue
+
+            path = record["path"]
+            parts = path.split("/")
+            kind = parts[-2] if len(parts) > 2 else parts[0]
+            counts[kind] = counts.get(kind, 0) + 1
+            restored += 1
+
+            if not dry_run:
+                writer.set(db.document(path), decode_value(record["data"]))
+                if restored % RESTORE_FLUSH_EVERY == 0:
+                    writer.flush()
+                    if failures:
+                        break
+                    print(f"  💾 {restored} documents restored (line {line_no})")
+
+    if writer is not None:
+        writer.close()
+
+    elapsed = time.monotonic() - started
+    print("\n" + "=" * 50)
+    print("📊 RESTORE SUMMARY")
+    print("=" * 50)
+    for kind, count in sorted(counts.items()):
+        print(f"  {kind + ':':<20}{count}")
+    print(f"  Elapsed:            {elapsed:.1f}s ({restored / elapsed if elapsed else 0:.0f} docs/s)")
+
+    if failures:
+        print(f"\n❌ {len(failures)} writes failed:")
+        for failure in failures[:20]:
+            print(f"  {failure}")
+    elif dry_run:
+        print("\n⚠️  This was a DRY RUN. No changes were made.")
+        print("    Run with --execute to restore.")
+    else:
+        print("\n✅ Restore Complete!")
+    return counts
+
+
+def migrate_v1_to_v2(dry_run=True, restart=False):
     """
     Migrate user data to the new weekly structure.
     
@@ -107,85 +261,140 @@ def migrate_v1_to_v2(dry_run=True):
     What this does NOT do:
     - Delete any existing fields
     - Overwrite any existing data
+
+    Users are streamed in document id order and written through a BulkWriter
+    (parallel, rate-limited batches). When executing, the last flushed user id is
+    checkpointed to CHECKPOINT_FILE every CHECKPOINT_EVERY users so an interrupted
+    run resumes where it stopped. Pass restart=True to ignore the checkpoint.
     """
     mode = "🔍 DRY RUN" if dry_run else "🚀 EXECUTING"
     print(f"\n{mode}: Migration V1 -> V2")
     print(f"Legacy Week ID: {LEGACY_WEEK_ID}")
     print("-" * 50)
     
-    users_ref = db.collection("users")
-    docs = list(users_ref.stream())  # Convert to list to get count
-    
     stats = {
-        "total_users": len(docs),
+        "total_users": 0,
         "already_migrated": 0,
         "users_migrated": 0,
         "submissions_created": 0,
         "questions_migrated": 0
     }
-    
-    for doc in docs:
+
+    users_ref = db.collection("users").order_by("__name__")
+
+    checkpoint = None
+    if not dry_run:
+        if restart:
+            clear_checkpoint()
+        checkpoint = load_checkpoint()
+    if checkpoint:
+        if checkpoint.get("legacy_week_id") != LEGACY_WEEK_ID:
+            print(f"❌ Checkpoint {CHECKPOINT_FILE} was written for week {checkpoint.get('legacy_week_id')}. Use --restart.")
+            return None
+        stats.update(checkpoint.get("stats", {}))
+        print(f"↪️  Resuming after user {checkpoint['last_user_id']} ({stats['total_users']} users already processed)")
+        users_ref = users_ref.start_after({"__name__": db.collection("users").document(checkpoint["last_user_id"])})
+
+    failures = []
+    writer = None if dry_run else create_bulk_writer(failures)
+    started = time.monotonic()
+    processed = 0
+    writes = 0
+    last_user_id = None
+
+    for doc in users_ref.stream():
         user_data = doc.to_dict()
         user_id = doc.id
+        stats["total_users"] += 1
+        processed += 1
+        last_user_id = user_id
         
         # Check if already migrated
         if "cumulative_score" in user_data:
             print(f"  ⏩ Skipping {user_id}: Already migrated")
             stats["already_migrated"] += 1
-            continue
-            
-        current_score = user_data.get("score", 0)
-        submitted = user_data.get("submitted", False)
-        user_name = user_data.get("name", "Unknown")
-        
-        print(f"  📝 Migrating: {user_name} ({user_id}) - Score: {current_score}")
-        
-        # Count submissions that will be created (for both dry run and actual run)
-        if submitted:
-            stats["submissions_created"] += 1
-        
-        if not dry_run:
-            batch = db.batch()
+        else:
+            current_score = user_data.get("score", 0)
+            submitted = user_data.get("submitted", False)
+            user_name = user_data.get("name", "Unknown")
             
-            # A. Add cumulative_score to user document
-            batch.update(db.collection("users").document(user_id), {
-                "cumulative_score": current_score,
-            })
+            print(f"  📝 Migrating: {user_name} ({user_id}) - Score: {current_score}")
             
-            # B. Create submission record for legacy week (if they submitted)
+            # Count submissions that will be created (for both dry run and actual run)
             if submitted:
-                submission_ref = db.collection("users").document(user_id).collection("submissions").document(LEGACY_WEEK_ID)
-                submission_data = {
-                    "week_id": LEGACY_WEEK_ID,
-                    "user_name": user_name,  # Denormalized for leaderboard queries
-                    "score": current_score,
-                    "answers": user_data.get("answers", {}),
-                    "time_taken": user_data.get("time_taken", 0),
-                    "submitted_at": user_data.get("submitted_at", firestore.SERVER_TIMESTAMP),
-                    "migrated_at": firestore.SERVER_TIMESTAMP,
-                    "migrated": True
-                }
-                batch.set(submission_ref, submission_data)
-                
-            batch.commit()
+                stats["submissions_created"] += 1
             
-        stats["users_migrated"] += 1
+            if not dry_run:
+                # A. Add cumulative_score to user document
+                writer.update(doc.reference, {
+                    "cumulative_score": current_score,
+                })
+                writes += 1
+                
+                # B. Create submission record for legacy week (if they submitted)
+                if submitted:
+                    submission_ref = doc.reference.collection("submissions").document(LEGACY_WEEK_ID)
+                    submission_data = {
+                        "week_id": LEGACY_WEEK_ID,
+                        "user_name": user_name,  # Denormalized for leaderboard queries
+                        "score": current_score,
+                        "answers": user_data.get("answers", {}),
+                        "time_taken": user_data.get("time_taken", 0),
+                        "submitted_at": user_data.get("submitted_at", fields.SERVER_TIMESTAMP),
+                        "migrated_at": fields.SERVER_TIMESTAMP,
+                        "migrated": True
+                    }
+                    writer.set(submission_ref, submission_data)
+                    writes += 1
+                
+            stats["users_migrated"] += 1
+
+        if not dry_run and processed % CHECKPOINT_EVERY == 0:
+            # Only checkpoint once everything up to this user is durably written
+            writer.flush()
+            if failures:
+                break
+            save_checkpoint(last_user_id, stats)
+            elapsed = time.monotonic() - started
+            print(f"  💾 Checkpoint at {last_user_id} - {processed / elapsed:.0f} users/s")
+
+    if writer is not None:
+        writer.flush()
+        if failures:
+            writer.close()
+            print(f"\n❌ {len(failures)} writes failed; progress saved up to the last checkpoint:")
+            for failure in failures[:20]:
+                print(f"  {failure}")
+            return stats
+        if last_user_id:
+            save_checkpoint(last_user_id, stats)
 
     # Migrate Questions
     print("\n📚 Migrating Questions...")
     questions_ref = db.collection("questions")
-    q_docs = list(questions_ref.stream())
     
-    for q_doc in q_docs:
+    for q_doc in questions_ref.stream():
         q_data = q_doc.to_dict()
         if "week_id" not in q_data:
             print(f"  📝 Assigning {q_doc.id} to {LEGACY_WEEK_ID}")
             if not dry_run:
-                db.collection("questions").document(q_doc.id).update({"week_id": LEGACY_WEEK_ID})
+                writer.update(q_doc.reference, {"week_id": LEGACY_WEEK_ID})
+                writes += 1
             stats["questions_migrated"] += 1
         else:
             print(f"  ⏩ Skipping {q_doc.id}: Already has week_id ({q_data['week_id']})")
 
+    if writer is not None:
+        writer.close()  # Flushes remaining writes
+        if failures:
+            print(f"\n❌ {len(failures)} question writes failed:")
+            for failure in failures[:20]:
+                print(f"  {failure}")
+            return stats
+        clear_checkpoint()
+
+    elapsed = time.monotonic() - started
+
     # Summary
     print("\n" + "=" * 50)
     print("📊 MIGRATION SUMMARY")
@@ -195,6 +404,7 @@ def migrate_v1_to_v2(dry_run=True):
     print(f"  Users Migrated:     {stats['users_migrated']}")
     print(f"  Submissions Created:{stats['submissions_created']}")
     print(f"  Questions Migrated: {stats['questions_migrated']}")
+    print(f"  Elapsed:            {elapsed:.1f}s ({processed / elapsed if elapsed else 0:.0f} users/s, {writes / elapsed if elapsed else 0:.0f} writes/s)")
     
     if dry_run:
         print("\n⚠️  This was a DRY RUN. No changes were made.")
@@ -205,6 +415,23 @@ def migrate_v1_to_v2(dry_run=True):
     return stats
 
 
+def iter_user_submissions(week_id=None):
+    """
+    Streams every submission with a single collection-group scan.
+    Yields (user_id, submission_doc); submissions outside users/{id}/submissions are skipped.
+    Filtering by week_id needs the collection-group index on submissions.week_id
+    (already required by the weekly leaderboard).
+    """
+    query = db.collection_group("submissions")
+    if week_id is not None:
+        query = query.where("week_id", "==", week_id)
+    for sub_doc in query.stream():
+        user_ref = sub_doc.reference.parent.parent
+        if user_ref is None or user_ref.parent.id != "users":
+            continue
+        yield user_ref.id, sub_doc
+
+
 def validate_migration():
     """
     Validate that the migration was successful.
@@ -214,19 +441,26 @@ def validate_migration():
     2. Users with submitted=True have a submission document
     3. Cumulative scores match original scores
     4. All questions have week_id
+
+    Submissions are read with one collection-group scan and joined in memory
+    against a streamed users scan (two queries in total instead of one per user).
     """
     print("\n🔎 VALIDATING MIGRATION")
     print("-" * 50)
     
     issues = []
     validated = 0
+    total_users = 0
+
+    # user_id -> [(week doc id, score)]
+    submission_scores = {}
+    for user_id, sub_doc in iter_user_submissions():
+        submission_scores.setdefault(user_id, []).append((sub_doc.id, sub_doc.to_dict().get("score")))
     
-    users_ref = db.collection("users")
-    docs = list(users_ref.stream())
-    
-    print(f"Checking {len(docs)} users...")
+    print(f"Loaded {sum(len(v) for v in submission_scores.values())} submissions. Checking users...")
     
-    for doc in docs:
+    for doc in db.collection("users").stream():
+        total_users += 1
         user_data = doc.to_dict()
         user_id = doc.id
         user_name = user_data.get("name", "Unknown")
@@ -244,15 +478,14 @@ def validate_migration():
         
         # Check 3: If submitted, should have submission document
         if user_data.get("submitted", False):
-            submissions = list(doc.reference.collection("submissions").stream())
+            submissions = submission_scores.get(user_id, [])
             if len(submissions) == 0:
                 issues.append(f"❌ User {user_name} ({user_id}): Submitted but no submission documents found")
             else:
                 # Verify submission score matches
-                for sub in submissions:
-                    sub_data = sub.to_dict()
-                    if sub_data.get("score") != original_score:
-                        issues.append(f"⚠️  User {user_name} ({user_id}): Submission score mismatch in week {sub.id}")
+                for sub_id, sub_score in submissions:
+                    if sub_score != original_score:
+                        issues.append(f"⚠️  User {user_name} ({user_id}): Submission score mismatch in week {sub_id}")
         
         validated += 1
     
@@ -274,7 +507,7 @@ def validate_migration():
     print("\n" + "=" * 50)
     print("📊 VALIDATION SUMMARY")
     print("=" * 50)
-    print(f"  Users Validated:    {validated}/{len(docs)}")
+    print(f"  Users Validated:    {validated}/{total_users}")
     print(f"  Questions Checked:  {len(q_docs)}")
     print(f"  Issues Found:       {len(issues)}")
     
@@ -297,25 +530,22 @@ def check_database():
     print("-" * 50)
     
     # Check Users
-    users_ref = db.collection("users")
-    user_docs = list(users_ref.stream())
+    user_count = 0
+    users_with_cumulative = 0
+    for doc in db.collection("users").stream():
+        user_count += 1
+        if "cumulative_score" in doc.to_dict():
+            users_with_cumulative += 1
     
-    print(f"\n👤 USERS: {len(user_docs)} total")
+    print(f"\n👤 USERS: {user_count} total")
     
-    users_with_cumulative = 0
+    # Check submissions (single collection-group scan)
     users_with_submissions = 0
     submission_week_ids = {}
-    
-    for doc in user_docs:
-        user_data = doc.to_dict()
-        if "cumulative_score" in user_data:
-            users_with_cumulative += 1
-        
-        # Check submissions
-        for sub_doc in doc.reference.collection("submissions").stream():
-            users_with_submissions += 1
-            week_id = sub_doc.id
-            submission_week_ids[week_id] = submission_week_ids.get(week_id, 0) + 1
+    for _, sub_doc in iter_user_submissions():
+        users_with_submissions += 1
+        week_id = sub_doc.id
+        submission_week_ids[week_id] = submission_week_ids.get(week_id, 0) + 1
     
     print(f"   - With cumulative_score: {users_with_cumulative}")
     print(f"   - With submissions: {users_with_submissions}")
@@ -360,6 +590,9 @@ def fix_week_ids(old_week_id: str, new_week_id: str, dry_run: bool = True):
     """
     Update all occurrences of old_week_id to new_week_id.
     Fixes both submissions and questions.
+
+    Submissions are found with one filtered collection-group query and questions
+    with one filtered query; all writes go through a BulkWriter.
     """
     mode = "🔍 DRY RUN" if dry_run else "🚀 EXECUTING"
     print(f"\n{mode}: Fix Week IDs")
@@ -367,44 +600,43 @@ def fix_week_ids(old_week_id: str, new_week_id: str, dry_run: bool = True):
     print("-" * 50)
     
     fixes = {"submissions": 0, "questions": 0}
+    failures = []
+    writer = None if dry_run else create_bulk_writer(failures)
     
     # Fix Submissions
     print("\n📝 Checking submissions...")
-    users_ref = db.collection("users")
-    for user_doc in users_ref.stream():
-        sub_ref = user_doc.reference.collection("submissions").document(old_week_id)
-        sub_doc = sub_ref.get()
+    for user_id, sub_doc in iter_user_submissions(week_id=old_week_id):
+        sub_data = sub_doc.to_dict()
+        user_name = sub_data.get("user_name", user_id)
+        print(f"   📝 Fixing submission for {user_name}")
         
-        if sub_doc.exists:
-            sub_data = sub_doc.to_dict()
-            user_name = sub_data.get("user_name", user_doc.id)
-            print(f"   📝 Fixing submission for {user_name}")
-            
-            if not dry_run:
-                # Create new document with correct week_id
-                new_sub_ref = user_doc.reference.collection("submissions").document(new_week_id)
-                new_data = sub_data.copy()
-                new_data["week_id"] = new_week_id
-                new_data["fixed_from"] = old_week_id  # Track the fix
-                new_sub_ref.set(new_data)
-                
-                # Delete old document
-                sub_ref.delete()
+        if not dry_run:
+            # Create new document with correct week_id
+            new_sub_ref = sub_doc.reference.parent.document(new_week_id)
+            new_data = sub_data.copy()
+            new_data["week_id"] = new_week_id
+            new_data["fixed_from"] = old_week_id  # Track the fix
+            writer.set(new_sub_ref, new_data)
             
-            fixes["submissions"] += 1
+            # Delete old document
+            if sub_doc.id != new_week_id:
+                writer.delete(sub_doc.reference)
+        
+        fixes["submissions"] += 1
     
     # Fix Questions
     print("\n❓ Checking questions...")
-    questions_ref = db.collection("questions")
+    questions_ref = db.collection("questions").where("week_id", "==", old_week_id)
     for q_doc in questions_ref.stream():
-        q_data = q_doc.to_dict()
-        if q_data.get("week_id") == old_week_id:
-            print(f"   📝 Fixing question {q_doc.id}")
-            
-            if not dry_run:
-                q_doc.reference.update({"week_id": new_week_id})
-            
-            fixes["questions"] += 1
+        print(f"   📝 Fixing question {q_doc.id}")
+        
+        if not dry_run:
+            writer.update(q_doc.reference, {"week_id": new_week_id})
+        
+        fixes["questions"] += 1
+
+    if writer is not None:
+        writer.close()
     
     # Summary
     print("\n" + "=" * 50)
@@ -413,7 +645,11 @@ def fix_week_ids(old_week_id: str, new_week_id: str, dry_run: bool = True):
     print(f"   Submissions fixed: {fixes['submissions']}")
     print(f"   Questions fixed:   {fixes['questions']}")
     
-    if dry_run:
+    if failures:
+        print(f"\n❌ {len(failures)} writes failed:")
+        for failure in failures[:20]:
+            print(f"  {failure}")
+    elif dry_run:
         print("\n⚠️  This was a DRY RUN. No changes were made.")
         print("    Run with --execute to apply fixes.")
     else:
@@ -423,6 +659,7 @@ def fix_week_ids(old_week_id: str, new_week_id: str, dry_run: bool = True):
 
 
 def main():
+    global CHECKPOINT_FILE
     parser = argparse.ArgumentParser(
         description="Migration script for Weekly Quiz System (V1 -> V2)",
         formatter_class=argparse.RawDescriptionHelpFormatter,
@@ -431,8 +668,11 @@ Examples:
   python migrate_v1_to_v2.py --backup              # Create backup first (recommended)
   python migrate_v1_to_v2.py --check               # See what's currently in the database
   python migrate_v1_to_v2.py --migrate             # Preview migration (dry run)
-  python migrate_v1_to_v2.py --migrate --execute   # Execute the migration
+  python migrate_v1_to_v2.py --migrate --execute   # Execute the migration (resumes if interrupted)
+  python migrate_v1_to_v2.py --migrate --execute --restart  # Execute, ignoring the saved checkpoint
   python migrate_v1_to_v2.py --validate            # Verify migration success
+  python migrate_v1_to_v2.py --restore backup.jsonl.gz            # Preview a restore (dry run)
+  python migrate_v1_to_v2.py --restore backup.jsonl.gz --execute  # Restore a backup
   python migrate_v1_to_v2.py --fix-week 2024-W51 2025-W52          # Fix wrong week IDs (dry run)
   python migrate_v1_to_v2.py --fix-week 2024-W51 2025-W52 --execute # Actually fix week IDs
   
@@ -445,17 +685,22 @@ Recommended workflow:
         """
     )
     
-    parser.add_argument("--backup", action="store_true", help="Export all data to JSON backup file")
+    parser.add_argument("--backup", action="store_true", help="Export all data to a gzipped JSONL backup file")
+    parser.add_argument("--restore", metavar="FILE", help="Restore a .jsonl.gz backup (dry run unless --execute is also specified)")
     parser.add_argument("--check", action="store_true", help="Check what week IDs exist in database")
     parser.add_argument("--migrate", action="store_true", help="Run migration (dry run unless --execute is also specified)")
-    parser.add_argument("--execute", action="store_true", help="Actually execute changes (use with --migrate or --fix-week)")
+    parser.add_argument("--execute", action="store_true", help="Actually execute changes (use with --migrate, --fix-week or --restore)")
+    parser.add_argument("--restart", action="store_true", help="Ignore any saved migration checkpoint and start from the first user")
+    parser.add_argument("--checkpoint", metavar="FILE", help=f"Migration checkpoint file (default: {CHECKPOINT_FILE})")
     parser.add_argument("--validate", action="store_true", help="Validate migration was successful")
     parser.add_argument("--fix-week", nargs=2, metavar=("OLD_WEEK", "NEW_WEEK"), help="Fix week IDs from OLD to NEW")
     
     args = parser.parse_args()
+    if args.checkpoint:
+        CHECKPOINT_FILE = args.checkpoint
     
     # Show help if no arguments
-    if not any([args.backup, args.check, args.migrate, args.validate, args.fix_week]):
+    if not any([args.backup, args.restore, args.check, args.migrate, args.validate, args.fix_week]):
         parser.print_help()
         print("\n💡 Start with: python migrate_v1_to_v2.py --check")
         return
@@ -469,12 +714,15 @@ Recommended workflow:
     if args.backup:
         backup_data()
     
+    if args.restore:
+        restore_data(args.restore, dry_run=not args.execute)
+    
     if args.check:
         check_database()
     
     if args.migrate:
         dry_run = not args.execute
-        migrate_v1_to_v2(dry_run=dry_run)
+        migrate_v1_to_v2(dry_run=dry_run, restart=args.restart)
     
     if args.fix_week:
         old_week, new_week = args.fix_week
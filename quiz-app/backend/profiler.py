@@ -0,0 +1,156 @@
+"""
+On-demand sampling profiler for the event loop thread.
+
+A background thread samples the event loop thread's Python stack every few
+milliseconds while at least one profiling session is open, and folds the stacks
+into the "collapsed" format (`outer;inner;leaf <count>`) read by flamegraph.pl,
+speedscope and inferno. Nothing runs while no session is open, so unprofiled
+requests pay only for a header lookup.
+
+Sessions are opened either for a time window (admin endpoints in main.py) or
+for a single request carrying `X-Profile: <PROFILER_TOKEN>`. Samples cover
+everything the event loop runs during the session, including other requests
+served concurrently.
+"""
+
+import os
+import sys
+import threading
+import time
+import uuid
+from collections import Counter, deque
+from datetime import datetime, timezone
+from typing import Deque, Dict, Optional
+
+PROFILER_TOKEN = os.getenv("PROFILER_TOKEN")  # Profiling is disabled unless set
+PROFILE_DIR = os.getenv("PROFILE_DIR")  # Optional directory to also write .folded files to
+DEFAULT_INTERVAL = 0.005  # seconds between samples
+MAX_WINDOW_SECONDS = 300
+MAX_STORED_PROFILES = 20
+
+
+class Profile:
+    def __init__(self, label: str, interval: float):
+        self.id = uuid.uuid4().hex[:12]
+        self.label = label
+        self.interval = interval
+        self.started_at = datetime.now(timezone.utc)
+        self.duration = 0.0
+        self.samples = 0
+        self.stacks: Counter = Counter()
+        self._started = time.perf_counter()
+
+    def folded(self) -> str:
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+    def summary(self) -> Dict:
+        leaves = Counter()
+        for stack, count in self.stacks.items():
+            leaves[stack.rsplit(";", 1)[-1]] += count
+        return {
+            "id": self.id,
+            "label": self.label,
+            "started_at": self.started_at.isoformat(),
+            "duration_seconds": round(self.duration, 3),
+            "samples": self.samples,
+            "interval_ms": self.interval * 1000,
+            "top_frames": [{"frame": frame, "samples": count} for frame, count in leaves.most_common(10)]
+        }
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class SamplingProfiler:
+    """Samples one thread's stack into every open session"""
+
+    def __init__(self):
+        self._target_thread_id: Optional[int] = None
+        self._sessions: Dict[str, Profile] = {}
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self.completed: Deque[Profile] = deque(maxlen=MAX_STORED_PROFILES)
+
+    def start(self, label: str, interval: float = DEFAULT_INTERVAL) -> Profile:
+        """Opens a session sampling the calling thread (call from the event loop)"""
+        profile = Profile(label, interval)
+        with self._lock:
+            self._target_thread_id = threading.get_ident()
+            self._sessions[profile.id] = profile
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+                self._thread.start()
+        return profile
+
+    def stop(self, profile_id: str) -> Optional[Profile]:
+        with self._lock:
+            profile = self._sessions.pop(profile_id, None)
+        if profile is None:
+            return None
+        profile.duration = time.perf_counter() - profile._started
+        self.completed.append(profile)
+        if PROFILE_DIR:
+            os.makedirs(PROFILE_DIR, exist_ok=True)
+            with open(os.path.join(PROFILE_DIR, f"{profile.started_at:%Y%m%d_%H%M%S}_{profile.id}.folded"), "w") as f:
+                f.write(profile.folded())
+        return profile
+
+    def active(self):
+        with self._lock:
+            return list(self._sessions.values())
+
+    def get(self, profile_id: str) -> Optional[Profile]:
+        return next((p for p in self.completed if p.id == profile_id), None)
+
+    def _run(self):
+        while True:
+            with self._lock:
+                sessions = list(self._sessions.values())
+                target = self._target_thread_id
+            if not sessions:
+                return
+            frame = sys._current_frames().get(target)
+            if frame is not None:
+                stack = []
+                while frame is not None:
+                    stack.append(_frame_label(frame))
+                    frame = frame.f_back
+                key = ";".join(reversed(stack))
+                for profile in sessions:
+                    profile.stacks[key] += 1
+                    profile.samples += 1
+            time.sleep(min(p.interval for p in sessions))
+
+
+profiler = SamplingProfiler()
+
+
+class ProfilingMiddleware:
+    """Profiles single requests that carry `X-Profile: <PROFILER_TOKEN>`; the profile id is returned in `X-Profile-Id`"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not PROFILER_TOKEN:
+            await self.app(scope, receive, send)
+            return
+        token = next((v for k, v in scope["headers"] if k == b"x-profile"), None)
+        if token is None or token.decode("latin-1") != PROFILER_TOKEN:
+            await self.app(scope, receive, send)
+            return
+
+        profile = profiler.start(f"{scope['method']} {scope['path']}")
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                message.setdefault("headers", [])
+                message["headers"] = list(message["headers"]) + [(b"x-profile-id", profile.id.encode())]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            profiler.stop(profile.id)
@@ -0,0 +1,117 @@
+"""
+In-process admission control for the public endpoints.
+
+Each limited route has its own token-bucket budget per client. Clients are
+identified by the phone number in the request body where the route has one
+(register, submit), otherwise by IP: the last X-Forwarded-For entry (added by
+the Cloud Run front end) or the socket peer. Requests over budget get an
+immediate 429 with Retry-After, before any handler or storage work runs.
+
+Buckets live in this process only; with several instances each one enforces
+the budget separately. Set RATE_LIMIT_ENABLED=0 to turn limiting off.
+"""
+
+import json
+import math
+import os
+import time
+from typing import Dict, Optional, Tuple
+
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "1").lower() not in ("0", "false", "no")
+MAX_BODY_BYTES = 64 * 1024  # Larger bodies are not parsed for a client key (IP is used)
+
+
+class TokenBucketLimiter:
+    """Token buckets keyed by client: `burst` tokens, refilled at `rate` tokens per second"""
+
+    def __init__(self, rate: float, burst: int, max_clients: int = 50000):
+        self.rate = rate
+        self.burst = burst
+        self.max_clients = max_clients
+        self._buckets: Dict[str, Tuple[float, float]] = {}  # client -> (tokens, last update)
+
+    def acquire(self, client: str, now: Optional[float] = None) -> float:
+        """Takes a token; returns 0 if allowed, otherwise the seconds until one is available"""
+        now = time.monotonic() if now is None else now
+        tokens, updated = self._buckets.get(client, (self.burst, now))
+        tokens = min(self.burst, tokens + (now - updated) * self.rate)
+        if tokens >= 1:
+            self._buckets[client] = (tokens - 1, now)
+            if len(self._buckets) > self.max_clients:
+                self._evict_full(now)
+            return 0.0
+        self._buckets[client] = (tokens, now)
+        return (1 - tokens) / self.rate
+
+    def _evict_full(self, now: float):
+        """Drops buckets that have refilled completely (equivalent to a new client)"""
+        refill = self.burst / self.rate
+        self._buckets = {k: v for k, v in self._buckets.items() if now - v[1] < refill}
+
+
+# (method, path) -> (limiter, JSON body field identifying the client or None for IP)
+ROUTE_BUDGETS: Dict[Tuple[str, str], Tuple[TokenBucketLimiter, Optional[str]]] = {
+    ("POST", "/api/register"): (TokenBucketLimiter(rate=1 / 30, burst=5), "phone"),
+    ("POST", "/api/submit"): (TokenBucketLimiter(rate=1 / 5, burst=5), "user_id"),
+    # Keyed by IP, and a whole venue may share one, so this only stops runaway polling loops
+    ("GET", "/api/leaderboard"): (TokenBucketLimiter(rate=5, burst=60), None),
+}
+
+
+def client_ip(scope) -> str:
+    for name, value in scope["headers"]:
+        if name == b"x-forwarded-for":
+            return value.decode("latin-1").rsplit(",", 1)[-1].strip()
+    client = scope.get("client")
+    return client[0] if client else "unknown"
+
+
+class RateLimitMiddleware:
+    """Pure ASGI middleware applying ROUTE_BUDGETS; `on_reject(route)` is called for every 429"""
+
+    def __init__(self, app, on_reject=None):
+        self.app = app
+        self.on_reject = on_reject
+
+    async def __call__(self, scope, receive, send):
+        budget = ROUTE_BUDGETS.get((scope.get("method"), scope.get("path"))) if scope["type"] == "http" else None
+        if budget is None or not RATE_LIMIT_ENABLED:
+            await self.app(scope, receive, send)
+            return
+
+        limiter, body_field = budget
+        client = None
+        if body_field:
+            # Read the (small) JSON body for the client key, then replay it to the app
+            messages = []
+            size = 0
+            while True:
+                message = await receive()
+                messages.append(message)
+                size += len(message.get("body", b""))
+                if message["type"] != "http.request" or not message.get("more_body") or size > MAX_BODY_BYTES:
+                    break
+            if size <= MAX_BODY_BYTES:
+                try:
+                    value = json.loads(b"".join(m.get("body", b"") for m in messages)).get(body_field)
+                    client = f"{body_field}:{value}" if value else None
+                except (ValueError, AttributeError):
+                    pass
+
+            async def replay():
+                return messages.pop(0) if messages else await receive()
+            receive = replay
+
+        retry_after = limiter.acquire(client or f"ip:{client_ip(scope)}")
+        if not retry_after:
+            await self.app(scope, receive, send)
+            return
+
+        if self.on_reject:
+            self.on_reject(scope["path"])
+        await send({
+            "type": "http.response.start",
+            "status": 429,
+            "headers": [(b"content-type", b"application/json"), (b"retry-after", str(math.ceil(retry_after)).encode())]
+        })
+        await send({"type": "http.response.body", "body": b'{"detail":"Too many requests"}'})
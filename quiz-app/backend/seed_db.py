@@ -1,25 +1,33 @@
+"""
+Seeds the database.
+
+Usage:
+    python seed_db.py                      # Toy set: 5 questions + quiz settings for the current week
+    python seed_db.py --synthetic --users 10000 --weeks 10 --questions 10   # Scale-test data
+
+Synthetic mode writes realistic users, weeks, questions and submissions
+(skill-based score distribution, spread of time_taken, a share of legacy v1
+users) in chunked batch writes. The same --seed produces the same data.
+It refuses to write to Cloud Firestore unless --allow-firestore is given;
+use STORAGE_BACKEND=sqlite (or a test DB_NAME) instead.
+"""
+
 import os
-import firebase_admin
-from firebase_admin import credentials, firestore
+import math
+import random
+import argparse
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, date, time, timedelta, timezone
+from firebase_admin import firestore
 from dotenv import load_dotenv
+from storage import create_client, get_storage_backend
 
 load_dotenv()
 
-# Initialize Firebase
-try:
-    if not firebase_admin._apps:
-        cred_path = os.getenv("GOOGLE_APPLICATION_CREDENTIALS")
-        if cred_path:
-             cred = credentials.Certificate(cred_path)
-             firebase_admin.initialize_app(cred)
-        else:
-             firebase_admin.initialize_app()
-except Exception as e:
-    print(f"Failed to initialize Firebase: {e}")
-    exit(1)
-
+# Initialize Firestore Client (or a local stand-in, see storage/__init__.py)
 DB_NAME = os.getenv("DB_NAME")
-db = firestore.Client(database=DB_NAME)
+db = create_client(use_async=False)
 
 QUESTIONS = [
     {
@@ -72,10 +80,8 @@ def seed_data():
     # Seed Questions
     print("Seeding questions...")
     
-    # Get current week ID for seeding
-    from datetime import datetime
-    now = datetime.now()
-    current_week_id = f"{now.year}-W{now.isocalendar()[1]:02d}"
+    # Get current week ID for seeding (ISO year, not calendar year)
+    current_week_id = iso_week_id(date.today())
     print(f"Assigning questions to week: {current_week_id}")
 
     batch = db.batch()
@@ -91,5 +97,205 @@ def seed_data():
     batch.commit()
     print("Seeding complete!")
 
+# --- SYNTHETIC DATA ---
+
+BATCH_SIZE = 500  # Firestore batch write limit
+COMMIT_WORKERS = 4
+LEGACY_WEEK_ID = "2025-W51"  # Matches migrate_v1_to_v2.LEGACY_WEEK_ID
+
+
+def iso_week_id(day: date) -> str:
+    iso_year, iso_week, _ = day.isocalendar()
+    return f"{iso_year}-W{iso_week:02d}"
+
+
+def recent_weeks(count: int):
+    """(week_id, monday) for the last `count` ISO weeks, oldest first, ending with the current week"""
+    today = date.today()
+    monday = today - timedelta(days=today.weekday())
+    return [(iso_week_id(monday - timedelta(weeks=i)), monday - timedelta(weeks=i)) for i in reversed(range(count))]
+
+
+class ChunkedWriter:
+    """Buffers set() calls into batches of BATCH_SIZE and commits them on a small thread pool"""
+
+    def __init__(self, client):
+        self.db = client
+        self.batch = client.batch()
+        self.pending_ops = 0
+        self.written = 0
+        self.pool = ThreadPoolExecutor(max_workers=COMMIT_WORKERS)
+        self.in_flight = deque()
+
+    def set(self, ref, data):
+        self.batch.set(ref, data)
+        self.pending_ops += 1
+        if self.pending_ops >= BATCH_SIZE:
+            self._submit()
+
+    def _submit(self):
+        if not self.pending_ops:
+            return
+        self.in_flight.append(self.pool.submit(self.batch.commit))
+        self.written += self.pending_ops
+        self.batch = self.db.batch()
+        self.pending_ops = 0
+        # Bound memory: wait for the oldest commits once enough are queued
+        while len(self.in_flight) > COMMIT_WORKERS * 2:
+            self.in_flight.popleft().result()
+
+    def close(self):
+        self._submit()
+        while self.in_flight:
+            self.in_flight.popleft().result()
+        self.pool.shutdown()
+
+
+def seed_synthetic(users: int, weeks: int, questions: int, participation: float, legacy_fraction: float, seed: int, client=None):
+    """
+    Populates users, weeks, questions and submissions for scale testing.
+    Each player gets a skill in [0, 1]; per-question correctness, attendance and
+    time_taken are drawn from it, so scores and ranks look like a real club.
+    `client` defaults to the module's db (pass a sync client to seed another store).
+    """
+    client = client or db
+    rng = random.Random(seed)
+    started = datetime.now()
+    week_list = recent_weeks(weeks)
+    writer = ChunkedWriter(client)
+    timer_seconds = 10 * 60
+    print(f"Seeding synthetic data into {get_storage_backend()} ({DB_NAME}): "
+          f"{users} users, {weeks} weeks x {questions} questions, seed {seed}")
+
+    writer.set(client.collection("config").document("quiz_settings"), {
+        "timer_duration_minutes": timer_seconds // 60,
+        "quiz_active": True,
+        "leaderboard_active": True,
+        "tester_phones": []
+    })
+
+    # Weeks + questions; answer keys are kept to build submissions
+    answer_keys = {}
+    for week_id, monday in week_list:
+        writer.set(client.collection("weeks").document(week_id), {
+            "week_id": week_id,
+            "is_active": True,
+            "start_time": datetime.combine(monday, time(0, 0), tzinfo=timezone.utc),
+            "end_time": datetime.combine(monday + timedelta(days=7), time(0, 0), tzinfo=timezone.utc),
+            "topic": "General Knowledge"
+        })
+        key = []
+        for order in range(1, questions + 1):
+            qid = f"{week_id}-q{order:02d}"
+            options = [f"{week_id} Q{order} option {c}" for c in "ABCD"]
+            correct = rng.choice(options)
+            key.append((qid, options, correct))
+            writer.set(client.collection("questions").document(qid), {
+                "text": f"Synthetic question {order} for {week_id}?",
+                "options": options,
+                "correct_answer": correct,
+                "order": order,
+                "week_id": week_id
+            })
+        answer_keys[week_id] = (monday, key)
+
+    stats = {"users": 0, "legacy_users": 0, "submissions": 0}
+    for i in range(users):
+        phone = f"9{i:09d}"
+        name = f"Player {i}"
+        skill = rng.betavariate(2.5, 2)  # Skewed towards competent players
+        speed = rng.lognormvariate(0, 0.35)  # >1 is slower than average
+        user_ref = client.collection("users").document(phone)
+
+        if rng.random() < legacy_fraction:
+            # Legacy v1 user: single score on the user doc, no submissions subcollection
+            score = sum(rng.random() < skill for _ in range(questions))
+            writer.set(user_ref, {
+                "user_id": phone,
+                "name": name,
+                "phone": phone,
+                "score": score,
+                "answers": {},
+                "time_taken": min(timer_seconds, int(rng.gauss(300, 90) * speed) + 30),
+                "submitted": True,
+                "week_id": LEGACY_WEEK_ID,
+                "submitted_at": started
+            })
+            stats["legacy_users"] += 1
+            continue
+
+        cumulative = 0
+        played = 0
+        for week_id, (monday, key) in answer_keys.items():
+            if rng.random() >= participation:
+                continue
+            answers = {}
+            score = 0
+            for qid, options, correct in key:
+                if rng.random() < 0.15 + 0.8 * skill:
+                    answers[qid] = correct
+                    score += 1
+                else:
+                    answers[qid] = rng.choice([o for o in options if o != correct])
+            time_taken = max(20, min(timer_seconds, int(rng.gauss(45, 15) * questions * speed / max(skill, 0.2) ** 0.3)))
+            submitted_at = datetime.combine(monday, time(20, 0), tzinfo=timezone.utc) + timedelta(
+                days=rng.randint(0, 6), seconds=int(abs(rng.gauss(0, 1800)))
+            )
+            writer.set(user_ref.collection("submissions").document(week_id), {
+                "week_id": week_id,
+                "user_name": name,
+                "score": score,
+                "answers": answers,
+                "time_taken": time_taken,
+                "submitted_at": submitted_at
+            })
+            cumulative += score
+            played += 1
+            stats["submissions"] += 1
+
+        writer.set(user_ref, {
+            "user_id": phone,
+            "name": name,
+            "phone": phone,
+            "cumulative_score": cumulative,
+            "submitted": played > 0,
+            "created_at": started
+        })
+        stats["users"] += 1
+        if (i + 1) % 10000 == 0:
+            print(f"  {i + 1} users generated ({writer.written} documents written)")
+
+    writer.close()
+    elapsed = (datetime.now() - started).total_seconds()
+    print(f"Synthetic seeding complete in {elapsed:.1f}s: {stats['users']} v2 users, "
+          f"{stats['legacy_users']} legacy users, {stats['submissions']} submissions, "
+          f"{writer.written} documents ({writer.written / elapsed if elapsed else math.inf:.0f} docs/s)")
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Seed the quiz database")
+    parser.add_argument("--synthetic", action="store_true", help="Generate scale-test data instead of the toy set")
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--weeks", type=int, default=10)
+    parser.add_argument("--questions", type=int, default=10, help="Questions per week")
+    parser.add_argument("--participation", type=float, default=0.7, help="Chance a player plays a given week")
+    parser.add_argument("--legacy-fraction", type=float, default=0.05, help="Share of legacy v1 users")
+    parser.add_argument("--seed", type=int, default=89, help="Random seed (same seed, same data)")
+    parser.add_argument("--allow-firestore", action="store_true", help="Allow synthetic writes to Cloud Firestore")
+    args = parser.parse_args()
+
+    if not args.synthetic:
+        seed_data()
+        return
+
+    if get_storage_backend() == "firestore" and not args.allow_firestore:
+        print("Refusing to write synthetic data to Cloud Firestore. "
+              "Use STORAGE_BACKEND=sqlite, or pass --allow-firestore with a test DB_NAME.")
+        exit(1)
+
+    seed_synthetic(args.users, args.weeks, args.questions, args.participation, args.legacy_fraction, args.seed)
+
+
 if __name__ == "__main__":
-    seed_data()
+    main()
@@ -0,0 +1,76 @@
+"""
+Storage backends for the quiz backend and scripts.
+
+Every backend exposes the google-cloud-firestore client API (the subset listed
+in storage/local.py), so handlers keep using db.collection(...) etc. unchanged.
+
+STORAGE_BACKEND selects the backend:
+- "firestore" (default): Cloud Firestore, database DB_NAME
+- "memory": process-local in-memory stand-in (no credentials needed)
+- "sqlite": local stand-in persisted to SQLITE_PATH (default: local.db)
+
+Write values (SERVER_TIMESTAMP, DELETE_FIELD, Increment, ArrayUnion,
+ArrayRemove) and query directions (ASCENDING, DESCENDING) are taken from
+`fields`, which resolves them for the configured backend on first use: the
+local backends have their own, so they never import the Firestore SDK.
+"""
+
+import os
+
+STORAGE_BACKENDS = ("firestore", "memory", "sqlite")
+
+
+def get_storage_backend() -> str:
+    backend = os.getenv("STORAGE_BACKEND", "firestore").lower()
+    if backend not in STORAGE_BACKENDS:
+        raise ValueError(f"Unknown STORAGE_BACKEND '{backend}'. Expected one of {STORAGE_BACKENDS}")
+    return backend
+
+
+class LazyClient:
+    """Builds the wrapped client on first attribute access, so importing the app does not initialise Firebase"""
+
+    def __init__(self, factory):
+        self._factory = factory
+        self._client = None
+
+    def __getattr__(self, name):
+        if self._client is None:
+            self._client = self._factory()
+        return getattr(self._client, name)
+
+
+class BackendFields:
+    """Write values and query directions of the configured backend, imported on first attribute access"""
+
+    def __init__(self):
+        self._module = None
+
+    def __getattr__(self, name):
+        if self._module is None:
+            if get_storage_backend() == "firestore":
+                from storage import firestore_backend as module
+            else:
+                from storage import local as module
+            self._module = module
+        return getattr(self._module, name)
+
+
+fields = BackendFields()
+
+
+def create_client(use_async: bool = True, backend: str = None, lazy: bool = False):
+    """
+    Creates a Firestore-compatible client for the configured backend.
+    lazy=True defers creating a Cloud Firestore client (and importing firebase_admin) until first use.
+    """
+    backend = backend or get_storage_backend()
+    if backend == "firestore":
+        if lazy:
+            return LazyClient(lambda: create_client(use_async=use_async, backend=backend))
+        from storage.firestore_backend import create_firestore_client
+        return create_firestore_client(database=os.getenv("DB_NAME"), use_async=use_async)
+
+    from storage.local import AsyncLocalClient, LocalClient, open_store
+    store = open_store(backend, os.getenv("SQLITE_PATH"))
+    return AsyncLocalClient(store) if use_async else LocalClient(store)
@@ -0,0 +1,121 @@
+"""
+Circuit breaker with deadlines for storage calls.
+
+Every guarded call gets a deadline. Timeouts and backend-side errors (5xx,
+throttling, dropped connections) count as failures; after `failure_threshold`
+consecutive failures the circuit opens and calls fail immediately with
+CircuitOpenError for `reset_timeout` seconds. It then lets a single trial call
+through (half-open): success closes the circuit, failure opens it again.
+
+Client errors such as NotFound or AlreadyExists mean the backend answered, so
+they count as successes.
+"""
+
+import asyncio
+import time
+from typing import Callable, Optional
+
+from google.api_core import exceptions
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling storage while the circuit is open"""
+
+
+BACKEND_FAILURES = (asyncio.TimeoutError, ConnectionError, exceptions.ServerError, exceptions.TooManyRequests,
+                    exceptions.RetryError)
+UNAVAILABLE_ERRORS = (CircuitOpenError, *BACKEND_FAILURES)  # See storage_unavailable
+
+
+def is_backend_failure(exc: BaseException) -> bool:
+    return isinstance(exc, BACKEND_FAILURES)
+
+
+def storage_unavailable(exc: BaseException) -> bool:
+    """True for errors meaning storage could not be reached (as opposed to bad requests)"""
+    return isinstance(exc, UNAVAILABLE_ERRORS)
+
+
+class CircuitBreaker:
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 10.0, deadline: float = 5.0,
+                 on_state_change: Optional[Callable[[str], None]] = None):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.deadline = deadline
+        self.on_state_change = on_state_change
+        self.failures = 0
+        self._state = CLOSED
+        self._opened_at = 0.0
+        self._trial_in_flight = False
+
+    @property
+    def state(self) -> str:
+        if self._state == OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+            self._set_state(HALF_OPEN)
+        return self._state
+
+    def retry_after(self) -> float:
+        """Seconds until the circuit lets a trial call through"""
+        if self._state != OPEN:
+            return 0.0
+        return max(0.0, self.reset_timeout - (time.monotonic() - self._opened_at))
+
+    def _set_state(self, state: str):
+        if state != self._state:
+            self._state = state
+            if self.on_state_change:
+                self.on_state_change(state)
+
+    def _before_call(self) -> bool:
+        """Raises CircuitOpenError if the call may not proceed; returns True for a half-open trial"""
+        state = self.state
+        if state == OPEN or (state == HALF_OPEN and self._trial_in_flight):
+            raise CircuitOpenError(f"Storage circuit is open, retry in {self.retry_after():.1f}s")
+        if state == HALF_OPEN:
+            self._trial_in_flight = True
+            return True
+        return False
+
+    def _record(self, failed: bool):
+        if failed:
+            self.failures += 1
+            if self._state == HALF_OPEN or self.failures >= self.failure_threshold:
+                self._opened_at = time.monotonic()
+                self._set_state(OPEN)
+        else:
+            self.failures = 0
+            self._set_state(CLOSED)
+
+    def guard(self) -> "_Guard":
+        """`async with breaker.guard(): ...` runs the body under the deadline, or raises CircuitOpenError"""
+        return _Guard(self)
+
+
+class _Guard:
+    __slots__ = ("_breaker", "_trial", "_timeout")
+
+    def __init__(self, breaker: CircuitBreaker):
+        self._breaker = breaker
+
+    async def __aenter__(self):
+        self._trial = self._breaker._before_call()
+        self._timeout = asyncio.timeout(self._breaker.deadline)
+        await self._timeout.__aenter__()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        try:
+            await self._timeout.__aexit__(exc_type, exc, tb)
+        except TimeoutError:
+            self._breaker._record(failed=True)  # Deadline exceeded
+            raise
+        finally:
+            if self._trial:
+                self._breaker._trial_in_flight = False
+        if exc is None or not isinstance(exc, asyncio.CancelledError):
+            self._breaker._record(failed=exc is not None and is_backend_failure(exc))
+        return False
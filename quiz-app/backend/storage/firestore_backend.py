@@ -0,0 +1,35 @@
+import os
+import logging
+import firebase_admin
+from firebase_admin import credentials, firestore
+# Write sentinels and transforms, see storage.fields
+from google.cloud.firestore_v1 import DELETE_FIELD, SERVER_TIMESTAMP, ArrayRemove, ArrayUnion, Increment  # noqa: F401
+
+ASCENDING = firestore.Query.ASCENDING
+DESCENDING = firestore.Query.DESCENDING
+
+logger = logging.getLogger(__name__)
+
+
+def initialize_firebase():
+    """Initialises the default Firebase app once (local credentials file or ADC)"""
+    try:
+        if not firebase_admin._apps:
+            # Check for local credentials
+            cred_path = os.getenv("GOOGLE_APPLICATION_CREDENTIALS")
+            if cred_path:
+                logger.info("Loading credentials from %s", cred_path)
+                cred = credentials.Certificate(cred_path)
+                firebase_admin.initialize_app(cred)
+            else:
+                logger.info("No local credentials found. Using Application Default Credentials (Cloud Run).")
+                firebase_admin.initialize_app()
+    except Exception as e:
+        logger.warning("Failed to initialize Firebase: %s", e)
+
+
+def create_firestore_client(database=None, use_async=True):
+    initialize_firebase()
+    if use_async:
+        return firestore.AsyncClient(database=database)
+    return firestore.Client(database=database)
@@ -0,0 +1,325 @@
+"""
+Operation accounting around an async Firestore-compatible client.
+
+`instrument_client(client)` returns a thin proxy that counts, for the current
+request (see `track_ops`), document reads, writes, queries and documents
+returned. It also tracks the longest run of *sequential* point reads - reads
+issued one after another with no other read in flight and no query or write in
+between - which is the signature of an N+1 lookup loop.
+
+When a circuit breaker is installed (see `set_circuit_breaker` and
+storage/circuit.py), every storage call - and every item of a stream - runs
+under its deadline and fails fast while the circuit is open.
+
+The proxy only wraps references, queries, snapshots and batches; everything
+else is forwarded to the underlying client objects untouched.
+"""
+
+import time
+from contextlib import nullcontext
+from contextvars import ContextVar
+from typing import Callable, Dict, Optional
+
+
+class OpStats:
+    __slots__ = ("reads", "writes", "queries", "docs", "point_read_streak", "max_point_read_streak",
+                 "streak_collection", "max_streak_collection", "_reads_in_flight")
+
+    def __init__(self):
+        self.reads = 0
+        self.writes = 0
+        self.queries = 0
+        self.docs = 0
+        self.point_read_streak = 0
+        self.max_point_read_streak = 0
+        self.streak_collection = None
+        self.max_streak_collection = None
+        self._reads_in_flight = 0
+
+    def read_started(self, collection_id: str):
+        self.reads += 1
+        if self._reads_in_flight == 0:
+            if collection_id != self.streak_collection:
+                self.point_read_streak = 0
+                self.streak_collection = collection_id
+            self.point_read_streak += 1
+            if self.point_read_streak > self.max_point_read_streak:
+                self.max_point_read_streak = self.point_read_streak
+                self.max_streak_collection = collection_id
+        self._reads_in_flight += 1
+
+    def read_finished(self):
+        self._reads_in_flight -= 1
+
+    def batch_read(self, docs: int):
+        """Documents fetched together with get_all (not a point read streak)"""
+        self.reads += docs
+        self.point_read_streak = 0
+
+    def query(self, docs: int):
+        self.queries += 1
+        self.docs += docs
+        self.point_read_streak = 0
+
+    def write(self, count: int = 1):
+        self.writes += count
+        self.point_read_streak = 0
+
+    def as_dict(self) -> Dict[str, int]:
+        return {
+            "reads": self.reads,
+            "writes": self.writes,
+            "queries": self.queries,
+            "docs": self.docs,
+            "max_point_read_streak": self.max_point_read_streak
+        }
+
+
+_current_ops: ContextVar[Optional[OpStats]] = ContextVar("current_ops", default=None)
+
+
+def track_ops() -> OpStats:
+    """Starts accounting for the current task (and tasks it spawns) and returns the counters"""
+    stats = OpStats()
+    _current_ops.set(stats)
+    return stats
+
+
+def current_ops() -> Optional[OpStats]:
+    return _current_ops.get()
+
+
+# Optional callback(operation, seconds) for storage call latency, e.g. a metrics histogram
+_latency_observer: Optional[Callable[[str, float], None]] = None
+
+
+def set_latency_observer(observer: Optional[Callable[[str, float], None]]):
+    global _latency_observer
+    _latency_observer = observer
+
+
+def _observe(operation: str, started: float):
+    if _latency_observer is not None:
+        _latency_observer(operation, time.perf_counter() - started)
+
+
+_circuit_breaker = None  # storage.circuit.CircuitBreaker guarding every call, if set
+
+
+def set_circuit_breaker(breaker):
+    global _circuit_breaker
+    _circuit_breaker = breaker
+
+
+def _guard():
+    return _circuit_breaker.guard() if _circuit_breaker is not None else nullcontext()
+
+
+def _unwrap(obj):
+    return getattr(obj, "_target", obj)
+
+
+class _Proxy:
+    __slots__ = ("_target",)
+
+    def __init__(self, target):
+        self._target = target
+
+    def __getattr__(self, name):
+        return getattr(self._target, name)
+
+
+class InstrumentedSnapshot(_Proxy):
+    __slots__ = ()
+
+    @property
+    def reference(self):
+        return InstrumentedDocument(self._target.reference)
+
+
+class InstrumentedQuery(_Proxy):
+    __slots__ = ()
+
+    def _chain(self, name, *args, **kwargs):
+        return InstrumentedQuery(getattr(self._target, name)(*args, **kwargs))
+
+    def where(self, *args, **kwargs):
+        return self._chain("where", *args, **kwargs)
+
+    def order_by(self, *args, **kwargs):
+        return self._chain("order_by", *args, **kwargs)
+
+    def limit(self, *args, **kwargs):
+        return self._chain("limit", *args, **kwargs)
+
+    def select(self, *args, **kwargs):
+        return self._chain("select", *args, **kwargs)
+
+    def start_after(self, *args, **kwargs):
+        return self._chain("start_after", *args, **kwargs)
+
+    async def stream(self, *args, **kwargs):
+        docs = 0
+        started = time.perf_counter()
+        iterator = self._target.stream(*args, **kwargs)
+        try:
+            while True:
+                async with _guard():
+                    try:
+                        snapshot = await iterator.__anext__()
+                    except StopAsyncIteration:
+                        break
+                docs += 1
+                yield InstrumentedSnapshot(snapshot)
+        finally:
+            await iterator.aclose()
+            _observe("query", started)
+            stats = _current_ops.get()
+            if stats is not None:
+                stats.query(docs)
+
+    async def get(self, *args, **kwargs):
+        started = time.perf_counter()
+        async with _guard():
+            snapshots = await self._target.get(*args, **kwargs)
+        _observe("query", started)
+        stats = _current_ops.get()
+        if stats is not None:
+            stats.query(len(snapshots))
+        return [InstrumentedSnapshot(s) for s in snapshots]
+
+
+class InstrumentedCollection(InstrumentedQuery):
+    __slots__ = ()
+
+    def document(self, *args, **kwargs):
+        return InstrumentedDocument(self._target.document(*args, **kwargs))
+
+    @property
+    def parent(self):
+        parent = self._target.parent
+        return InstrumentedDocument(parent) if parent is not None else None
+
+
+class InstrumentedDocument(_Proxy):
+    __slots__ = ()
+
+    @property
+    def parent(self):
+        return InstrumentedCollection(self._target.parent)
+
+    def collection(self, *args, **kwargs):
+        return InstrumentedCollection(self._target.collection(*args, **kwargs))
+
+    async def get(self, *args, **kwargs):
+        stats = _current_ops.get()
+        started = time.perf_counter()
+        if stats is None:
+            async with _guard():
+                snapshot = await self._target.get(*args, **kwargs)
+            _observe("get", started)
+            return InstrumentedSnapshot(snapshot)
+        stats.read_started(self._target.parent.id)
+        try:
+            async with _guard():
+                return InstrumentedSnapshot(await self._target.get(*args, **kwargs))
+        finally:
+            stats.read_finished()
+            _observe("get", started)
+
+    async def _write(self, name, *args, **kwargs):
+        started = time.perf_counter()
+        async with _guard():
+            result = await getattr(self._target, name)(*args, **kwargs)
+        _observe("write", started)
+        stats = _current_ops.get()
+        if stats is not None:
+            stats.write()
+        return result
+
+    async def set(self, *args, **kwargs):
+        return await self._write("set", *args, **kwargs)
+
+    async def create(self, *args, **kwargs):
+        return await self._write("create", *args, **kwargs)
+
+    async def update(self, *args, **kwargs):
+        return await self._write("update", *args, **kwargs)
+
+    async def delete(self, *args, **kwargs):
+        return await self._write("delete", *args, **kwargs)
+
+
+class InstrumentedBatch(_Proxy):
+    __slots__ = ("_count",)
+
+    def __init__(self, target):
+        super().__init__(target)
+        self._count = 0
+
+    def _add(self, name, reference, *args, **kwargs):
+        getattr(self._target, name)(_unwrap(reference), *args, **kwargs)
+        self._count += 1
+        return self
+
+    def set(self, reference, *args, **kwargs):
+        return self._add("set", reference, *args, **kwargs)
+
+    def create(self, reference, *args, **kwargs):
+        return self._add("create", reference, *args, **kwargs)
+
+    def update(self, reference, *args, **kwargs):
+        return self._add("update", reference, *args, **kwargs)
+
+    def delete(self, reference, *args, **kwargs):
+        return self._add("delete", reference, *args, **kwargs)
+
+    async def commit(self, *args, **kwargs):
+        started = time.perf_counter()
+        async with _guard():
+            result = await self._target.commit(*args, **kwargs)
+        _observe("commit", started)
+        stats = _current_ops.get()
+        if stats is not None:
+            stats.write(self._count)
+        return result
+
+
+class InstrumentedClient(_Proxy):
+    __slots__ = ()
+
+    def collection(self, *args, **kwargs):
+        return InstrumentedCollection(self._target.collection(*args, **kwargs))
+
+    def document(self, *args, **kwargs):
+        return InstrumentedDocument(self._target.document(*args, **kwargs))
+
+    def collection_group(self, *args, **kwargs):
+        return InstrumentedQuery(self._target.collection_group(*args, **kwargs))
+
+    def batch(self, *args, **kwargs):
+        return InstrumentedBatch(self._target.batch(*args, **kwargs))
+
+    async def get_all(self, references, *args, **kwargs):
+        docs = 0
+        started = time.perf_counter()
+        iterator = self._target.get_all([_unwrap(r) for r in references], *args, **kwargs)
+        try:
+            while True:
+                async with _guard():
+                    try:
+                        snapshot = await iterator.__anext__()
+                    except StopAsyncIteration:
+                        break
+                docs += 1
+                yield InstrumentedSnapshot(snapshot)
+        finally:
+            await iterator.aclose()
+            _observe("get_all", started)
+            stats = _current_ops.get()
+            if stats is not None:
+                stats.batch_read(docs)
+
+
+def instrument_client(client) -> InstrumentedClient:
+    return InstrumentedClient(client)
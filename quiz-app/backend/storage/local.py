@@ -0,0 +1,630 @@
+"""
+Local Firestore stand-in.
+
+Implements the subset of the google-cloud-firestore client API the backend and
+scripts use, on top of a MemoryStore or SqliteStore:
+- collection / document / collection_group references, get_all
+- where (==, !=, <, <=, >, >=, in, not-in, array-contains), order_by, limit,
+  start_after, select, stream/get
+- set (incl. merge), update (dotted paths), delete, batches, bulk writer
+- SERVER_TIMESTAMP, DELETE_FIELD, Increment, ArrayUnion, ArrayRemove (defined
+  here, so the local backends never import the Firestore SDK; callers get the
+  backend's own through storage.fields)
+
+Semantics follow Firestore where it matters for the app: filters and order_by
+skip documents missing the field, ties are broken by document path, update()
+of a missing document raises NotFound and a batch is limited to 500 writes.
+`AsyncLocalClient` mirrors firestore.AsyncClient, `LocalClient` firestore.Client.
+"""
+
+import uuid
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from google.api_core import exceptions
+
+from storage.stores import MemoryStore, SqliteStore
+
+ASCENDING = "ASCENDING"
+DESCENDING = "DESCENDING"
+MAX_BATCH_WRITES = 500
+_MISSING = object()
+
+# Optional extra counter for the current task (e.g. one request of a load test); see _LocalClient._record
+op_scope: ContextVar[Optional[Dict[str, int]]] = ContextVar("op_scope", default=None)
+
+
+# --- VALUES ---
+
+class _Sentinel:
+    def __init__(self, name: str):
+        self.name = name
+
+    def __repr__(self):
+        return self.name
+
+
+SERVER_TIMESTAMP = _Sentinel("SERVER_TIMESTAMP")
+DELETE_FIELD = _Sentinel("DELETE_FIELD")
+
+
+class Increment:
+    def __init__(self, value):
+        self.value = value
+
+
+class ArrayUnion:
+    def __init__(self, values):
+        self.values = list(values)
+
+
+class ArrayRemove:
+    def __init__(self, values):
+        self.values = list(values)
+
+
+def _copy(value):
+    if isinstance(value, dict):
+        return {k: _copy(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_copy(v) for v in value]
+    return value
+
+
+def _type_rank(value) -> int:
+    # Firestore cross-type ordering: null < bool < number < timestamp < string < bytes < reference < array < map
+    if value is None:
+        return 0
+    if isinstance(value, bool):
+        return 1
+    if isinstance(value, (int, float)):
+        return 2
+    if isinstance(value, datetime):
+        return 3
+    if isinstance(value, str):
+        return 4
+    if isinstance(value, bytes):
+        return 5
+    if isinstance(value, _DocumentReference):
+        return 6
+    if isinstance(value, list):
+        return 8
+    return 9
+
+
+def _sort_key(value) -> tuple:
+    rank = _type_rank(value)
+    if rank == 6:
+        return rank, value.path
+    if rank in (8, 9):
+        return rank, repr(value)
+    if rank == 0:
+        return rank, 0
+    return rank, value
+
+
+def _compare(a, b) -> int:
+    key_a, key_b = _sort_key(a), _sort_key(b)
+    return (key_a > key_b) - (key_a < key_b)
+
+
+def _get_field(data: Dict[str, Any], field_path: str):
+    value = data
+    for part in field_path.split("."):
+        if not isinstance(value, dict) or part not in value:
+            return _MISSING
+        value = value[part]
+    return value
+
+
+def _set_field(data: Dict[str, Any], field_path: str, value):
+    parts = field_path.split(".")
+    target = data
+    for part in parts[:-1]:
+        if not isinstance(target.get(part), dict):
+            target[part] = {}
+        target = target[part]
+    if value is DELETE_FIELD:
+        target.pop(parts[-1], None)
+    else:
+        target[parts[-1]] = value
+
+
+def _project(data: Dict[str, Any], field_paths: Iterable[str]) -> Dict[str, Any]:
+    projected = {}
+    for field_path in field_paths:
+        value = _get_field(data, field_path)
+        if value is not _MISSING:
+            _set_field(projected, field_path, value)
+    return projected
+
+
+def _transform(current, value, now):
+    """Resolves write sentinels against the current field value"""
+    if value is SERVER_TIMESTAMP:
+        return now
+    if isinstance(value, Increment):
+        base = current if isinstance(current, (int, float)) and not isinstance(current, bool) else 0
+        return base + value.value
+    if isinstance(value, ArrayUnion):
+        result = list(current) if isinstance(current, list) else []
+        for item in value.values:
+            if item not in result:
+                result.append(item)
+        return result
+    if isinstance(value, ArrayRemove):
+        return [item for item in current if item not in value.values] if isinstance(current, list) else []
+    if isinstance(value, dict):
+        return {k: _transform(_MISSING, v, now) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_transform(_MISSING, v, now) for v in value]
+    return value
+
+
+def _merge(target: Dict[str, Any], data: Dict[str, Any], now):
+    for key, value in data.items():
+        current = target.get(key, _MISSING)
+        # Like Firestore, an empty map is a leaf of the update mask and replaces the field
+        if isinstance(value, dict) and value and isinstance(current, dict):
+            _merge(current, value, now)
+        elif value is DELETE_FIELD:
+            target.pop(key, None)
+        else:
+            target[key] = _transform(current, value, now)
+
+
+def _apply_write(existing: Optional[Dict[str, Any]], op: str, data, merge: bool, path: str) -> Optional[Dict[str, Any]]:
+    """Returns the new document data for a write (None for deletes)"""
+    now = datetime.now(timezone.utc)
+    if op == "delete":
+        return None
+    if op == "create" and existing is not None:
+        raise exceptions.AlreadyExists(f"Document already exists: {path}")
+    if op == "update":
+        if existing is None:
+            raise exceptions.NotFound(f"No document to update: {path}")
+        result = _copy(existing)
+        for field_path, value in data.items():
+            current = _get_field(result, field_path)
+            _set_field(result, field_path, value if value is DELETE_FIELD else _transform(current, value, now))
+        return result
+    if merge and existing is not None:
+        result = _copy(existing)
+        _merge(result, data, now)
+        return result
+    result = {}
+    _merge(result, data, now)
+    return result
+
+
+def _split_path(path: str) -> Tuple[str, str]:
+    collection_path, _, doc_id = path.rpartition("/")
+    return collection_path, doc_id
+
+
+# --- SNAPSHOTS / REFERENCES ---
+
+class DocumentSnapshot:
+    def __init__(self, reference, data: Optional[Dict[str, Any]]):
+        self.reference = reference
+        self._data = data
+
+    @property
+    def id(self) -> str:
+        return self.reference.id
+
+    @property
+    def exists(self) -> bool:
+        return self._data is not None
+
+    def to_dict(self) -> Optional[Dict[str, Any]]:
+        return _copy(self._data) if self._data is not None else None
+
+    def get(self, field_path: str):
+        value = _get_field(self._data or {}, field_path)
+        if value is _MISSING:
+            raise KeyError(field_path)
+        return _copy(value)
+
+
+class _DocumentReference:
+    def __init__(self, client, path: str):
+        self._client = client
+        self.path = path
+        self._collection_path, self.id = _split_path(path)
+
+    def __eq__(self, other):
+        return isinstance(other, _DocumentReference) and other.path == self.path
+
+    def __hash__(self):
+        return hash(self.path)
+
+    @property
+    def parent(self):
+        return self._client.collection(self._collection_path)
+
+    def collection(self, collection_id: str):
+        return self._client.collection(f"{self.path}/{collection_id}")
+
+    def _get(self) -> DocumentSnapshot:
+        self._client._record("read")
+        return DocumentSnapshot(self, self._client._store.get(self._collection_path, self.id))
+
+    def _write(self, op: str, data=None, merge: bool = False):
+        batch = self._client._batch_class(self._client)
+        batch._add(op, self, data, merge)
+        batch._commit()
+
+
+class _Query:
+    def __init__(self, client, parent_path: Optional[str] = None, collection_id: Optional[str] = None,
+                 all_descendants: bool = False, filters=(), orders=(), limit=None, cursor=None, projection=None):
+        self._client = client
+        self._parent_path = parent_path  # collection path for plain queries
+        self._collection_id = collection_id
+        self._all_descendants = all_descendants
+        self._filters = tuple(filters)
+        self._orders = tuple(orders)
+        self._limit = limit
+        self._cursor = cursor
+        self._projection = projection
+
+    def _copy_with(self, **changes):
+        params = dict(
+            parent_path=self._parent_path, collection_id=self._collection_id,
+            all_descendants=self._all_descendants, filters=self._filters, orders=self._orders,
+            limit=self._limit, cursor=self._cursor, projection=self._projection
+        )
+        params.update(changes)
+        return self._client._query_class(self._client, **params)
+
+    def where(self, field_path: Optional[str] = None, op_string: Optional[str] = None, value=None, *, filter=None):
+        if filter is not None:
+            field_path, op_string, value = filter.field_path, filter.op_string, filter.value
+        return self._copy_with(filters=self._filters + ((field_path, op_string, value),))
+
+    def order_by(self, field_path: str, direction: str = ASCENDING):
+        return self._copy_with(orders=self._orders + ((field_path, direction),))
+
+    def limit(self, count: int):
+        return self._copy_with(limit=count)
+
+    def start_after(self, document_fields_or_snapshot):
+        return self._copy_with(cursor=document_fields_or_snapshot)
+
+    def select(self, field_paths: Iterable[str]):
+        return self._copy_with(projection=list(field_paths))
+
+    # --- execution ---
+
+    @staticmethod
+    def _matches(value, op: str, expected) -> bool:
+        if value is _MISSING:
+            return False
+        if op == "==":
+            return _type_rank(value) == _type_rank(expected) and _compare(value, expected) == 0
+        if op == "!=":
+            return value is not None and not (_type_rank(value) == _type_rank(expected) and _compare(value, expected) == 0)
+        if op == "in":
+            return any(_type_rank(value) == _type_rank(e) and _compare(value, e) == 0 for e in expected)
+        if op == "not-in":
+            return value is not None and not any(_type_rank(value) == _type_rank(e) and _compare(value, e) == 0 for e in expected)
+        if op == "array-contains":
+            return isinstance(value, list) and expected in value
+        if op == "array-contains-any":
+            return isinstance(value, list) and any(e in value for e in expected)
+        if _type_rank(value) != _type_rank(expected):
+            return False
+        result = _compare(value, expected)
+        return {"<": result < 0, "<=": result <= 0, ">": result > 0, ">=": result >= 0}[op]
+
+    def _field_value(self, path: str, data: Dict[str, Any], field_path: str):
+        if field_path == "__name__":
+            return self._client.document(path)
+        return _get_field(data, field_path)
+
+    def _run(self) -> List[DocumentSnapshot]:
+        eq_filters = [(f, v) for f, op, v in self._filters if op == "==" and isinstance(v, str)]
+        if self._all_descendants:
+            rows = self._client._store.scan_group(self._collection_id, eq_filters)
+        else:
+            rows = self._client._store.scan(self._parent_path, eq_filters)
+
+        orders = list(self._orders)
+        if not any(f == "__name__" for f, _ in orders):
+            orders.append(("__name__", orders[-1][1] if orders else ASCENDING))
+
+        matched = []
+        for collection_path, doc_id, data in rows:
+            path = f"{collection_path}/{doc_id}"
+            if all(self._matches(self._field_value(path, data, f), op, v) for f, op, v in self._filters):
+                # order_by implies the field exists
+                if all(f == "__name__" or _get_field(data, f) is not _MISSING for f, _ in orders):
+                    matched.append((path, data))
+
+        # Stable sorts from the least significant order to the most significant one
+        for field_path, direction in reversed(orders):
+            if field_path == "__name__":
+                matched.sort(key=lambda m: m[0], reverse=direction == DESCENDING)
+            else:
+                matched.sort(key=lambda m: _sort_key(_get_field(m[1], field_path)), reverse=direction == DESCENDING)
+
+        if self._cursor is not None:
+            matched = [m for m in matched if self._after_cursor(m, orders)]
+        if self._limit is not None:
+            matched = matched[:self._limit]
+
+        self._client._record("query", len(matched))
+        snapshots = []
+        for path, data in matched:
+            if self._projection is not None:
+                data = _project(data, self._projection)
+            snapshots.append(DocumentSnapshot(self._client.document(path), data))
+        return snapshots
+
+    def _after_cursor(self, item, orders) -> bool:
+        cursor = self._cursor
+        if isinstance(cursor, DocumentSnapshot):
+            values = [self._field_value(cursor.reference.path, cursor._data or {}, f) for f, _ in orders]
+        elif isinstance(cursor, dict):
+            values = [cursor[f] for f, _ in orders if f in cursor]
+        else:
+            values = list(cursor)
+        for (field_path, direction), expected in zip(orders, values):
+            result = _compare(self._field_value(item[0], item[1], field_path), expected)
+            if result:
+                return (result < 0) if direction == DESCENDING else (result > 0)
+        return False
+
+
+class _CollectionReference(_Query):
+    def __init__(self, client, path: str):
+        super().__init__(client, parent_path=path, collection_id=path.rsplit("/", 1)[-1])
+        self.path = path
+        self.id = self._collection_id
+
+    @property
+    def parent(self):
+        if "/" not in self.path:
+            return None
+        return self._client.document(self.path.rsplit("/", 1)[0])
+
+    def document(self, document_id: Optional[str] = None):
+        return self._client.document(f"{self.path}/{document_id or uuid.uuid4().hex[:20]}")
+
+
+class _WriteBatch:
+    def __init__(self, client):
+        self._client = client
+        self._writes = []
+
+    def _add(self, op, reference, data=None, merge=False):
+        self._writes.append((op, reference, data, merge))
+        return self
+
+    def set(self, reference, document_data, merge: bool = False):
+        return self._add("set", reference, document_data, merge)
+
+    def create(self, reference, document_data):
+        return self._add("create", reference, document_data)
+
+    def update(self, reference, field_updates):
+        return self._add("update", reference, field_updates)
+
+    def delete(self, reference):
+        return self._add("delete", reference)
+
+    def _commit(self):
+        if len(self._writes) > MAX_BATCH_WRITES:
+            raise exceptions.InvalidArgument(f"maximum {MAX_BATCH_WRITES} writes allowed per request")
+        store = self._client._store
+        # Resolve every write first so a failing write leaves the store untouched
+        pending: Dict[str, Optional[Dict[str, Any]]] = {}
+        for op, reference, data, merge in self._writes:
+            existing = pending[reference.path] if reference.path in pending else store.get(reference._collection_path, reference.id)
+            pending[reference.path] = _apply_write(existing, op, data, merge, reference.path)
+        with store.transaction():
+            for path, data in pending.items():
+                collection_path, doc_id = _split_path(path)
+                if data is None:
+                    store.delete(collection_path, doc_id)
+                else:
+                    store.put(collection_path, doc_id, data)
+        self._client._record("write", len(self._writes))
+        self._writes = []
+
+
+# --- SYNC API ---
+
+class LocalDocumentReference(_DocumentReference):
+    def get(self) -> DocumentSnapshot:
+        return self._get()
+
+    def set(self, document_data, merge: bool = False):
+        self._write("set", document_data, merge)
+
+    def create(self, document_data):
+        self._write("create", document_data)
+
+    def update(self, field_updates):
+        self._write("update", field_updates)
+
+    def delete(self):
+        self._write("delete")
+
+
+class LocalQuery(_Query):
+    def stream(self):
+        yield from self._run()
+
+    def get(self) -> List[DocumentSnapshot]:
+        return self._run()
+
+
+class LocalCollectionReference(_CollectionReference, LocalQuery):
+    pass
+
+
+class LocalWriteBatch(_WriteBatch):
+    def commit(self):
+        self._commit()
+
+
+class LocalBulkFailure:
+    def __init__(self, reference, attempts: int, error: Exception):
+        self.operation = type("Operation", (), {"reference": reference, "attempts": attempts})()
+        self.code = getattr(error, "code", None)
+        self.message = str(error)
+
+
+class LocalBulkWriter:
+    """Applies each write immediately; failures go through on_write_error like BulkWriter"""
+
+    def __init__(self, client):
+        self._client = client
+        self._on_error = lambda failure, writer: failure.attempts < 15
+
+    def on_write_error(self, callback):
+        self._on_error = callback or (lambda failure, writer: failure.attempts < 15)
+
+    def _write(self, op, reference, data=None, merge=False):
+        attempts = 0
+        while True:
+            attempts += 1
+            try:
+                self._client._batch_class(self._client)._add(op, reference, data, merge)._commit()
+                return
+            except exceptions.GoogleAPICallError as e:
+                if not self._on_error(LocalBulkFailure(reference, attempts, e), self):
+                    return
+
+    def set(self, reference, document_data, merge: bool = False):
+        self._write("set", reference, document_data, merge)
+
+    def create(self, reference, document_data):
+        self._write("create", reference, document_data)
+
+    def update(self, reference, field_updates):
+        self._write("update", reference, field_updates)
+
+    def delete(self, reference):
+        self._write("delete", reference)
+
+    def flush(self):
+        pass
+
+    def close(self):
+        pass
+
+
+# --- ASYNC API ---
+
+class AsyncLocalDocumentReference(_DocumentReference):
+    async def get(self) -> DocumentSnapshot:
+        return self._get()
+
+    async def set(self, document_data, merge: bool = False):
+        self._write("set", document_data, merge)
+
+    async def create(self, document_data):
+        self._write("create", document_data)
+
+    async def update(self, field_updates):
+        self._write("update", field_updates)
+
+    async def delete(self):
+        self._write("delete")
+
+
+class AsyncLocalQuery(_Query):
+    async def stream(self):
+        for snapshot in self._run():
+            yield snapshot
+
+    async def get(self) -> List[DocumentSnapshot]:
+        return self._run()
+
+
+class AsyncLocalCollectionReference(_CollectionReference, AsyncLocalQuery):
+    pass
+
+
+class AsyncLocalWriteBatch(_WriteBatch):
+    async def commit(self):
+        self._commit()
+
+
+# --- CLIENTS ---
+
+class _LocalClient:
+    def __init__(self, store=None):
+        self._store = store if store is not None else MemoryStore()
+        self.op_counts = {"read": 0, "query": 0, "write": 0, "docs_returned": 0}
+
+    def _record(self, kind: str, count: int = 1):
+        for counts in (self.op_counts, op_scope.get()):
+            if counts is None:
+                continue
+            if kind == "query":
+                counts["query"] = counts.get("query", 0) + 1
+                counts["docs_returned"] = counts.get("docs_returned", 0) + count
+            else:
+                counts[kind] = counts.get(kind, 0) + count
+
+    def collection(self, collection_path: str):
+        return self._collection_class(self, collection_path.strip("/"))
+
+    def document(self, document_path: str):
+        return self._document_class(self, document_path.strip("/"))
+
+    def collection_group(self, collection_id: str):
+        return self._query_class(self, collection_id=collection_id, all_descendants=True)
+
+    def batch(self):
+        return self._batch_class(self)
+
+    def _get_all(self, references, field_paths=None) -> List[DocumentSnapshot]:
+        snapshots = []
+        for reference in references:
+            data = self._store.get(reference._collection_path, reference.id)
+            if data is not None and field_paths is not None:
+                data = _project(data, field_paths)
+            snapshots.append(DocumentSnapshot(reference, data))
+        self._record("read", len(snapshots))
+        return snapshots
+
+    def close(self):
+        self._store.close()
+
+
+class LocalClient(_LocalClient):
+    """Drop-in for firestore.Client"""
+    _document_class = LocalDocumentReference
+    _collection_class = LocalCollectionReference
+    _query_class = LocalQuery
+    _batch_class = LocalWriteBatch
+
+    def bulk_writer(self):
+        return LocalBulkWriter(self)
+
+    def get_all(self, references, field_paths=None, transaction=None):
+        yield from self._get_all(references, field_paths)
+
+
+class AsyncLocalClient(_LocalClient):
+    """Drop-in for firestore.AsyncClient"""
+    _document_class = AsyncLocalDocumentReference
+    _collection_class = AsyncLocalCollectionReference
+    _query_class = AsyncLocalQuery
+    _batch_class = AsyncLocalWriteBatch
+
+    async def get_all(self, references, field_paths=None, transaction=None):
+        for snapshot in self._get_all(references, field_paths):
+            yield snapshot
+
+
+def open_store(backend: str, sqlite_path: Optional[str] = None):
+    if backend == "sqlite":
+        return SqliteStore(sqlite_path or "local.db")
+    return MemoryStore()
@@ -0,0 +1,163 @@
+"""
+Document stores behind the local Firestore stand-in (storage/local.py).
+
+A store only knows how to keep documents addressed by (collection_path, doc_id)
+and how to list a collection or a collection group. Filtering, ordering and
+write transforms live in local.py so both stores behave identically.
+"""
+
+import base64
+import json
+import sqlite3
+import threading
+from contextlib import contextmanager, nullcontext
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+# (collection_path, doc_id, data)
+Row = Tuple[str, str, Dict[str, Any]]
+
+
+def collection_id_of(collection_path: str) -> str:
+    return collection_path.rsplit("/", 1)[-1]
+
+
+class MemoryStore:
+    """Process-local dict store. Stored dicts are never mutated in place."""
+
+    def __init__(self):
+        self._collections: Dict[str, Dict[str, Dict[str, Any]]] = {}
+        self._groups: Dict[str, set] = {}  # collection_id -> {collection_path}
+
+    def get(self, collection_path: str, doc_id: str) -> Optional[Dict[str, Any]]:
+        return self._collections.get(collection_path, {}).get(doc_id)
+
+    def put(self, collection_path: str, doc_id: str, data: Dict[str, Any]):
+        if collection_path not in self._collections:
+            self._collections[collection_path] = {}
+            self._groups.setdefault(collection_id_of(collection_path), set()).add(collection_path)
+        self._collections[collection_path][doc_id] = data
+
+    def delete(self, collection_path: str, doc_id: str):
+        self._collections.get(collection_path, {}).pop(doc_id, None)
+
+    def scan(self, collection_path: str, eq_filters: List[Tuple[str, str]] = ()) -> Iterable[Row]:
+        for doc_id, data in list(self._collections.get(collection_path, {}).items()):
+            yield collection_path, doc_id, data
+
+    def scan_group(self, collection_id: str, eq_filters: List[Tuple[str, str]] = ()) -> Iterable[Row]:
+        for collection_path in sorted(self._groups.get(collection_id, ())):
+            yield from self.scan(collection_path)
+
+    def transaction(self):
+        return nullcontext()
+
+    def close(self):
+        pass
+
+
+# --- SQLite ---
+
+def _encode(value):
+    if isinstance(value, datetime):
+        return {"__type__": "datetime", "value": value.isoformat()}
+    if isinstance(value, bytes):
+        return {"__type__": "bytes", "value": base64.b64encode(value).decode("ascii")}
+    if isinstance(value, dict):
+        return {k: _encode(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_encode(v) for v in value]
+    return value
+
+
+def _decode(value):
+    if isinstance(value, dict):
+        kind = value.get("__type__")
+        if kind == "datetime":
+            return datetime.fromisoformat(value["value"])
+        if kind == "bytes":
+            return base64.b64decode(value["value"])
+        return {k: _decode(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_decode(v) for v in value]
+    return value
+
+
+def _json_path(field_path: str) -> str:
+    return "$." + ".".join(json.dumps(part) for part in field_path.split("."))
+
+
+class SqliteStore:
+    """
+    Single-table SQLite store. Documents are JSON; string equality filters are
+    pushed down with json_extract (local.py re-checks every filter anyway).
+    """
+
+    def __init__(self, path: str = "local.db"):
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._lock = threading.RLock()
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS documents ("
+            " collection_path TEXT NOT NULL,"
+            " collection_id TEXT NOT NULL,"
+            " doc_id TEXT NOT NULL,"
+            " data TEXT NOT NULL,"
+            " PRIMARY KEY (collection_path, doc_id))"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS documents_group ON documents (collection_id)")
+
+    def get(self, collection_path: str, doc_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT data FROM documents WHERE collection_path = ? AND doc_id = ?",
+                (collection_path, doc_id)
+            ).fetchone()
+        return _decode(json.loads(row[0])) if row else None
+
+    def put(self, collection_path: str, doc_id: str, data: Dict[str, Any]):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO documents (collection_path, collection_id, doc_id, data) VALUES (?, ?, ?, ?)",
+                (collection_path, collection_id_of(collection_path), doc_id, json.dumps(_encode(data)))
+            )
+
+    def delete(self, collection_path: str, doc_id: str):
+        with self._lock:
+            self._conn.execute(
+                "DELETE FROM documents WHERE collection_path = ? AND doc_id = ?",
+                (collection_path, doc_id)
+            )
+
+    def _select(self, where: str, params: list, eq_filters) -> Iterable[Row]:
+        for field_path, value in eq_filters:
+            where += " AND json_extract(data, ?) = ?"
+            params += [_json_path(field_path), value]
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT collection_path, doc_id, data FROM documents WHERE {where} ORDER BY collection_path, doc_id",
+                params
+            ).fetchall()
+        for collection_path, doc_id, data in rows:
+            yield collection_path, doc_id, _decode(json.loads(data))
+
+    def scan(self, collection_path: str, eq_filters: List[Tuple[str, str]] = ()) -> Iterable[Row]:
+        return self._select("collection_path = ?", [collection_path], eq_filters)
+
+    def scan_group(self, collection_id: str, eq_filters: List[Tuple[str, str]] = ()) -> Iterable[Row]:
+        return self._select("collection_id = ?", [collection_id], eq_filters)
+
+    @contextmanager
+    def transaction(self):
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                yield
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+
+    def close(self):
+        self._conn.close()
@@ -0,0 +1,138 @@
+"""
+Structured, non-blocking logging for the backend.
+
+- Records are formatted as one JSON object per line with Cloud Logging field
+  names (severity, message, time, logging.googleapis.com/trace), so they are
+  queryable in Cloud Logging without a parser.
+- Handlers only put records on an in-memory queue; a QueueListener thread does
+  the formatting (message, traceback, JSON) and the stdout write, so request
+  handlers never block on I/O. Records are queued as they are, except that
+  messages with mutable arguments are rendered first (see DeferredQueueHandler).
+- RequestContextMiddleware gives every request an id (X-Request-ID, generated
+  if absent, echoed back) that is attached to each record logged while serving it.
+
+LOG_LEVEL sets the level (default INFO); LOG_FORMAT=text prints plain lines for local use.
+"""
+
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import uuid
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from typing import Optional
+
+request_id_var: ContextVar[Optional[str]] = ContextVar("request_id", default=None)
+trace_var: ContextVar[Optional[str]] = ContextVar("trace", default=None)
+
+GCP_PROJECT = os.getenv("GOOGLE_CLOUD_PROJECT")
+
+# Attributes every LogRecord has; anything else was passed via `extra=` and is emitted as a field
+_RESERVED = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime", "request_id", "trace"}
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+class RequestContextFilter(logging.Filter):
+    def filter(self, record):
+        record.request_id = request_id_var.get()
+        record.trace = trace_var.get()
+        return True
+
+
+class DeferredQueueHandler(logging.handlers.QueueHandler):
+    """
+    QueueHandler that leaves formatting to the listener. The stock prepare()
+    formats the message and traceback on the calling thread and drops exc_info,
+    which also keeps tracebacks out of JsonFormatter's "exception" field.
+    """
+
+    _IMMUTABLE = (str, int, float, bool, bytes, type(None))
+
+    def prepare(self, record):
+        # The queue is in-process, so nothing is pickled; only arguments that may change
+        # before the listener gets to the record are rendered into the message now
+        args = record.args
+        if args and (isinstance(args, dict) or not all(isinstance(arg, self._IMMUTABLE) for arg in args)):
+            record.msg = record.getMessage()
+            record.args = None
+        return record
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            "severity": record.levelname,
+            "message": record.getMessage(),
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "logger": record.name,
+        }
+        if getattr(record, "request_id", None):
+            entry["request_id"] = record.request_id
+        if getattr(record, "trace", None) and GCP_PROJECT:
+            entry["logging.googleapis.com/trace"] = f"projects/{GCP_PROJECT}/traces/{record.trace}"
+        for key, value in record.__dict__.items():
+            if key not in _RESERVED and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+def configure_logging():
+    """Routes the root logger through a queue to a background stdout writer (idempotent)"""
+    global _listener
+    if _listener is not None:
+        return
+
+    stream_handler = logging.StreamHandler(sys.stdout)
+    if os.getenv("LOG_FORMAT", "json").lower() == "text":
+        stream_handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s [%(request_id)s] %(name)s: %(message)s"))
+    else:
+        stream_handler.setFormatter(JsonFormatter())
+
+    log_queue: queue.SimpleQueue = queue.SimpleQueue()
+    queue_handler = DeferredQueueHandler(log_queue)
+    # Capture request context on the calling thread, before the record is queued
+    queue_handler.addFilter(RequestContextFilter())
+
+    root = logging.getLogger()
+    root.handlers = [queue_handler]
+    root.setLevel(os.getenv("LOG_LEVEL", "INFO").upper())
+
+    _listener = logging.handlers.QueueListener(log_queue, stream_handler, respect_handler_level=True)
+    _listener.start()
+    atexit.register(_listener.stop)
+
+
+class RequestContextMiddleware:
+    """Pure ASGI middleware setting the request id (and Cloud trace id) for log records"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope["headers"])
+        request_id = headers.get(b"x-request-id", b"").decode("latin-1") or uuid.uuid4().hex
+        trace_header = headers.get(b"x-cloud-trace-context", b"").decode("latin-1")
+        request_token = request_id_var.set(request_id)
+        trace_token = trace_var.set(trace_header.split("/", 1)[0] or None)
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                message["headers"] = list(message.get("headers", [])) + [(b"x-request-id", request_id.encode("latin-1"))]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            request_id_var.reset(request_token)
+            trace_var.reset(trace_token)
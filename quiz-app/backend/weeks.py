@@ -0,0 +1,218 @@
+"""
+Week lifecycle: when each quiz week is open, and a timer that follows it.
+
+WeekTimeline holds the documents of the `weeks` collection in memory. A week
+without a document, or without start_time / end_time, runs for its ISO week:
+Monday 00:00 UTC to the next Monday. The active week is the configured week
+(is_active not False) whose window contains now, else the current ISO week
+unless it has a document (which then decides). Lookups are pure, so request
+handlers check windows without storage reads.
+
+WeekScheduler sleeps until the next start or end boundary, flips the active
+week and calls the on_start / on_end hooks. It also reloads the timeline every
+`reload_seconds` so edits made through another instance are picked up.
+
+Week ids use the ISO year ("2026-W53" exists, "2025-W53" does not), so
+neighbouring weeks are computed with date.fromisocalendar, never by adding
+to the week number.
+"""
+
+import asyncio
+import logging
+from datetime import date, datetime, timedelta, timezone
+from typing import Any, Awaitable, Callable, Dict, Iterable, NamedTuple, Optional
+
+logger = logging.getLogger(__name__)
+
+INACTIVE = "inactive"
+
+
+def iso_week_id(moment: datetime) -> str:
+    iso = moment.isocalendar()
+    return f"{iso[0]}-W{iso[1]:02d}"
+
+
+def week_monday(week_id: str) -> Optional[date]:
+    """Monday of an ISO week id ("2025-W01"), None if week_id is not one"""
+    try:
+        year, week = week_id.split("-W")
+        return date.fromisocalendar(int(year), int(week), 1)
+    except ValueError:
+        return None
+
+
+def week_offset(week_id: str, weeks: int) -> Optional[str]:
+    """ISO week `weeks` after (or before) week_id, None if week_id is not an ISO week"""
+    monday = week_monday(week_id)
+    if monday is None:
+        return None
+    return iso_week_id(monday + timedelta(weeks=weeks))
+
+
+def _utc(value: Optional[datetime]) -> Optional[datetime]:
+    if value is None:
+        return None
+    return value.replace(tzinfo=timezone.utc) if value.tzinfo is None else value.astimezone(timezone.utc)
+
+
+class WeekWindow(NamedTuple):
+    week_id: str
+    start: Optional[datetime]  # None for ids that are not ISO weeks and have no configured times
+    end: Optional[datetime]
+    is_active: bool
+    configured: bool  # Has a document in 'weeks'
+
+    def contains(self, moment: datetime, grace: float = 0) -> bool:
+        return (self.is_active and self.start is not None and self.end is not None
+                and self.start <= moment < self.end + timedelta(seconds=grace))
+
+
+def default_window(week_id: str) -> WeekWindow:
+    monday = week_monday(week_id)
+    if monday is None:
+        return WeekWindow(week_id, None, None, True, False)
+    start = datetime.combine(monday, datetime.min.time(), tzinfo=timezone.utc)
+    return WeekWindow(week_id, start, start + timedelta(weeks=1), True, False)
+
+
+class WeekTimeline:
+    def __init__(self, docs: Optional[Iterable[Dict[str, Any]]] = None):
+        self.loaded = False
+        self._windows: Dict[str, WeekWindow] = {}
+        if docs is not None:
+            self.load(docs)
+
+    def load(self, docs: Iterable[Dict[str, Any]]):
+        """Replaces the timeline with week documents (dicts with week_id, start_time, end_time, is_active)"""
+        windows = {}
+        for doc in docs:
+            week_id = doc.get("week_id")
+            if not week_id:
+                continue
+            windows[week_id] = self.window_from_doc(doc)
+        self._windows = windows
+        self.loaded = True
+
+    def set_week(self, doc: Dict[str, Any]):
+        self._windows[doc["week_id"]] = self.window_from_doc(doc)
+
+    @staticmethod
+    def window_from_doc(doc: Dict[str, Any]) -> WeekWindow:
+        default = default_window(doc["week_id"])
+        start = _utc(doc.get("start_time")) or default.start
+        end = _utc(doc.get("end_time")) or (start + timedelta(weeks=1) if start else None)
+        return WeekWindow(doc["week_id"], start, end, doc.get("is_active") is not False, True)
+
+    def window(self, week_id: str) -> WeekWindow:
+        return self._windows.get(week_id) or default_window(week_id)
+
+    def active_week(self, now: datetime) -> str:
+        """Week open for play at `now`, or INACTIVE"""
+        active = None
+        for window in self._windows.values():
+            if window.contains(now) and (active is None or window.start > active.start):
+                active = window
+        if active is not None:
+            return active.week_id
+        iso_week = iso_week_id(now)
+        return INACTIVE if iso_week in self._windows else iso_week
+
+    def latest_week(self, now: datetime) -> str:
+        """The active week, or between weeks the one that ended most recently (for leaderboards)"""
+        active = self.active_week(now)
+        if active != INACTIVE:
+            return active
+        ended = [w for w in self._windows.values() if w.is_active and w.end is not None and w.end <= now]
+        if ended:
+            return max(ended, key=lambda w: w.end).week_id
+        return week_offset(iso_week_id(now), -1)
+
+    def accepting(self, week_id: str, now: datetime, grace: float = 0) -> bool:
+        """Whether a submission for week_id is inside its window (plus `grace` seconds after the end)"""
+        window = self.window(week_id)
+        if window.start is None:
+            return window.configured and window.is_active  # Custom week id without times
+        return window.contains(now, grace) and (self.active_week(now) == week_id or now >= window.end)
+
+    def next_boundary(self, now: datetime) -> datetime:
+        """Next start or end of any week after `now` (at latest the next ISO week start)"""
+        boundary = default_window(iso_week_id(now)).end
+        for window in self._windows.values():
+            for moment in (window.start, window.end):
+                if moment is not None and now < moment < boundary:
+                    boundary = moment
+        return boundary
+
+
+Hook = Callable[[str], Awaitable[None]]
+
+
+class WeekScheduler:
+    """Follows a WeekTimeline: calls on_end(old) and on_start(new) whenever the active week changes"""
+
+    def __init__(self, timeline: WeekTimeline, reload: Callable[[], Awaitable[None]],
+                 on_start: Optional[Hook] = None, on_end: Optional[Hook] = None, reload_seconds: float = 300,
+                 clock: Callable[[], datetime] = lambda: datetime.now(timezone.utc)):
+        self.timeline = timeline
+        self.reload = reload
+        self.on_start = on_start
+        self.on_end = on_end
+        self.reload_seconds = reload_seconds
+        self.clock = clock
+        self.active_week: Optional[str] = None
+        self._wake = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        self.active_week = self.timeline.active_week(self.clock())
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def wake(self):
+        """Re-evaluates the active week now (after the timeline was edited)"""
+        self._wake.set()
+
+    async def _run(self):
+        # Reload right away if startup could not load the timeline
+        next_reload = self.clock() + timedelta(seconds=self.reload_seconds if self.timeline.loaded else 0)
+        while True:
+            now = self.clock()
+            if now >= next_reload:
+                try:
+                    await self.reload()
+                except Exception:
+                    logger.warning("Week timeline reload failed, keeping the previous one", exc_info=True)
+                next_reload = now + timedelta(seconds=self.reload_seconds)
+            await self._flip(now)
+
+            wake_at = min(self.timeline.next_boundary(now), next_reload)
+            self._wake.clear()
+            try:
+                await asyncio.wait_for(self._wake.wait(), max(0.0, (wake_at - self.clock()).total_seconds()))
+            except asyncio.TimeoutError:
+                pass
+
+    async def _flip(self, now: datetime):
+        active = self.timeline.active_week(now)
+        if active == self.active_week:
+            return
+        previous, self.active_week = self.active_week, active
+        logger.info("Active week %s -> %s", previous, active, extra={"week_id": active})
+        if previous not in (None, INACTIVE) and self.on_end:
+            await self._call(self.on_end, previous)
+        if active != INACTIVE and self.on_start:
+            await self._call(self.on_start, active)
+
+    async def _call(self, hook: Hook, week_id: str):
+        try:
+            await hook(week_id)
+        except Exception:
+            logger.exception("Week hook %s failed", getattr(hook, "__name__", hook), extra={"week_id": week_id})
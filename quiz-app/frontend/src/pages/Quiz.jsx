@@ -1,4 +1,4 @@
-import { useState, useEffect } from 'react';
+import { useState, useEffect, useRef } from 'react';
 import { useNavigate } from 'react-router-dom';
 import { motion, AnimatePresence } from 'framer-motion';
 import { ArrowRight } from 'lucide-react';
@@ -15,6 +15,7 @@ function Quiz() {
     const [submitting, setSubmitting] = useState(false);
     const [startTime, setStartTime] = useState(null);
     const [direction, setDirection] = useState(0);
+    const submissionKey = useRef(crypto.randomUUID()); // Same key for every retry of this submission
 
     const navigate = useNavigate();
     const { playSound, stopSound } = useSoundManager();
@@ -147,7 +148,7 @@ function Quiz() {
         const duration = Math.round((Date.now() - startTime) / 1000);
 
         try {
-            await submitAnswers(userId, answers, duration, weekId);
+            await submitAnswers(userId, answers, duration, weekId, submissionKey.current);
             localStorage.setItem('has_submitted', 'true');
             navigate('/thank-you');
         } catch (error) {
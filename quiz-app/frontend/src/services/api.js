@@ -18,14 +18,21 @@ export const getConfig = async () => {
     return response.data;
 };
 
-export const submitAnswers = async (userId, answers, timeTaken, weekId) => {
-    const response = await axios.post(`${API_URL}/api/submit`, {
-        user_id: userId,
-        answers,
-        time_taken: timeTaken,
-        week_id: weekId
-    });
-    return response.data;
+// Retries network failures (no response) with the same Idempotency-Key, so a submission is never stored twice
+export const submitAnswers = async (userId, answers, timeTaken, weekId, idempotencyKey = crypto.randomUUID(), retries = 2) => {
+    try {
+        const response = await axios.post(`${API_URL}/api/submit`, {
+            user_id: userId,
+            answers,
+            time_taken: timeTaken,
+            week_id: weekId
+        }, { headers: { 'Idempotency-Key': idempotencyKey } });
+        return response.data;
+    } catch (error) {
+        if (error.response || retries <= 0) throw error;
+        await new Promise(resolve => setTimeout(resolve, 1000));
+        return submitAnswers(userId, answers, timeTaken, weekId, idempotencyKey, retries - 1);
+    }
 };
 
 // Public Leaderboard
@@ -84,9 +91,35 @@ export const addBatchQuestions = async (questions) => {
     return response.data;
 };
 
+export const importQuestions = async (file, format = 'csv', dryRun = false) => {
+    const response = await axios.post(`${API_URL}/api/admin/questions/import`, file, {
+        params: { format, dry_run: dryRun },
+        headers: { 'Content-Type': format === 'csv' ? 'text/csv' : 'application/x-ndjson' }
+    });
+    return response.data;
+};
+
 export const getSubmissionDetails = async (userId, weekId) => {
     const response = await axios.get(`${API_URL}/api/admin/submission/${userId}`, {
         params: { week_id: weekId }
     });
     return response.data;
 };
+
+export const getAnswerStats = async (weekId) => {
+    const response = await axios.get(`${API_URL}/api/admin/answer-stats/${weekId}`);
+    return response.data;
+};
+
+export const getScoreDistribution = async (type = 'weekly', weekId = null, score = null) => {
+    const params = { type };
+    if (weekId) params.week_id = weekId;
+    if (score !== null) params.score = score;
+    const response = await axios.get(`${API_URL}/api/stats/distribution`, { params });
+    return response.data;
+};
+
+export const getUserStats = async (userId) => {
+    const response = await axios.get(`${API_URL}/api/users/${encodeURIComponent(userId)}/stats`);
+    return response.data;
+};